@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.append(str(project_root))
+
+from src.utils.scoring_criteria import ScoringCriteria
+from src.config import config
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def load_queries():
+    """Use the scoring dimension descriptions as realistic questions"""
+    criteria = ScoringCriteria.load_criteria(str(project_root / "Report_score.json")) or {}
+    queries = []
+    for category in ScoringCriteria.get_categories(criteria):
+        for dimension in ScoringCriteria.get_dimensions_for_category(criteria, category):
+            queries.append(f"What does the report say about {dimension.get('dimension', '')}?")
+    return queries or ["What are the key sustainability goals mentioned?"]
+
+def run_stage(name: str, call, total: int, concurrency: int):
+    """Run call(i) total times from concurrent clients and summarize latency and throughput
+
+    call returns whether the request succeeded; exceptions count as errors.
+    """
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            ok = bool(call(i))
+        except Exception as e:
+            logger.error(f"{name} request {i} failed: {str(e)}")
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(total)))
+    wall_seconds = time.perf_counter() - start
+    
+    latencies = np.array([ms for ms, _ in results])
+    return {
+        "stage": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, ok in results if not ok),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "throughput_rps": round(total / wall_seconds, 2),
+    }
+
+def compare(stages, baseline_path: str, max_regression: float):
+    """Stages whose p95 latency regressed by more than max_regression against a saved run"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {stage["stage"]: stage for stage in json.load(f)["stages"]}
+    regressions = []
+    for stage in stages:
+        previous = baseline.get(stage["stage"])
+        if previous and previous["p95_ms"] > 0 and stage["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{stage['stage']}: p95 {previous['p95_ms']} ms -> {stage['p95_ms']} ms")
+    return regressions
+
+def main():
+    """Drive uploads, questions in each mode and scoring end to end against the mock LLM
+
+    The mock provider stands in for Gemini and OpenAI with a fixed, configurable
+    latency, so the figures measure the system's own overhead (upload handling,
+    parsing, indexing, retrieval, prompt assembly, scheduling) and can be compared
+    between runs in CI with --baseline.
+    """
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark with a local mock LLM")
+    parser.add_argument("--documents", nargs="+",
+                        default=[str(project_root / "data" / "documents" / "report" / "UOL_Group_Sustainability_Report_FY2023.pdf")],
+                        help="Reports to upload and score")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=20, help="Questions per mode")
+    parser.add_argument("--modes", nargs="+", default=["analysis", "explore"], help="/ask modes to exercise")
+    parser.add_argument("--scoring-requests", type=int, default=4, help="ScoringAgent.score_document calls")
+    parser.add_argument("--provider", default="mock", help="LLM provider; anything but mock calls the real API")
+    parser.add_argument("--mock-latency", type=float, help="Fixed latency of each mock call in seconds")
+    parser.add_argument("--mock-tps", type=float, help="Mock response rate in tokens per second, 0 for instant")
+    parser.add_argument("--mock-responses", help="JSON file mapping prompt substrings to canned responses")
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    parser.add_argument("--baseline", help="Results of an earlier run to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed relative p95 increase against the baseline before failing")
+    args = parser.parse_args()
+    
+    # Configure the provider before the app creates its agents
+    config.llm.provider = args.provider
+    if args.mock_latency is not None:
+        config.llm.mock_latency_s = args.mock_latency
+    if args.mock_tps is not None:
+        config.llm.mock_tokens_per_second = args.mock_tps
+    if args.mock_responses:
+        config.llm.mock_responses_path = args.mock_responses
+    
+    import web_app
+    from src.agents.scoring_agent import ScoringAgent
+    
+    documents = [path for path in args.documents if os.path.exists(path)]
+    if not documents:
+        print("[Error] None of the documents to upload exist")
+        return 1
+    queries = load_queries()
+    clients = [web_app.app.test_client() for _ in range(args.clients)]
+    
+    def upload(i):
+        files = [(open(path, 'rb'), os.path.basename(path)) for path in documents]
+        try:
+            response = clients[i % len(clients)].post(
+                '/upload_documents', data={'files': files}, content_type='multipart/form-data'
+            )
+        finally:
+            for stream, _ in files:
+                stream.close()
+        return response.get_json().get('success')
+    
+    def ask(mode):
+        def call(i):
+            response = clients[i % len(clients)].post('/ask', json={'query': queries[i % len(queries)], 'mode': mode})
+            return response.get_json().get('success')
+        return call
+    
+    stages = [run_stage("upload_documents", upload, args.clients, args.clients)]
+    for mode in args.modes:
+        stages.append(run_stage(f"ask_{mode}", ask(mode), args.requests, args.clients))
+    
+    if args.scoring_requests:
+        scoring_agent = ScoringAgent()
+        scoring_agent.load_documents(documents)
+        stages.append(run_stage(
+            "score_document",
+            lambda i: "error" not in scoring_agent.score_document(documents[i % len(documents)]),
+            args.scoring_requests,
+            args.clients
+        ))
+    
+    print("\n" + "=" * 88)
+    print(f"Provider: {config.llm.provider}   clients: {args.clients}   documents: {len(documents)}")
+    print("-" * 88)
+    print(f"{'Stage':<20}{'Requests':>10}{'Errors':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'req/s':>10}")
+    for stage in stages:
+        print(f"{stage['stage']:<20}{stage['requests']:>10}{stage['errors']:>8}{stage['p50_ms']:>11}"
+              f"{stage['p95_ms']:>11}{stage['p99_ms']:>11}{stage['throughput_rps']:>10}")
+    print("=" * 88)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "provider": config.llm.provider,
+                "clients": args.clients,
+                "documents": [os.path.basename(path) for path in documents],
+                "stages": stages
+            }, f, indent=2)
+    
+    if args.baseline:
+        regressions = compare(stages, args.baseline, args.max_regression)
+        if regressions:
+            print("p95 latency regressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No p95 latency regressions against the baseline")
+    return 1 if any(stage["errors"] for stage in stages) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
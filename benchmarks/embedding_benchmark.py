@@ -0,0 +1,135 @@
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+import numpy as np
+import faiss
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.append(str(project_root))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from src.utils.document_loader import DocumentLoader
+from src.utils.scoring_criteria import ScoringCriteria
+from src.utils.embeddings import create_embeddings
+from src.utils.chunker import StructureAwareChunker
+from src.config import config
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# The first option is the reference that recall is measured against
+EMBEDDING_OPTIONS = [
+    ("sentence-transformers/all-mpnet-base-v2", "torch"),
+    ("sentence-transformers/all-mpnet-base-v2", "onnx-int8"),
+    ("sentence-transformers/all-MiniLM-L6-v2", "torch"),
+    ("sentence-transformers/all-MiniLM-L6-v2", "onnx"),
+    ("sentence-transformers/all-MiniLM-L6-v2", "onnx-int8"),
+]
+
+def load_chunks(doc_dir: Path, max_chunks: int):
+    """Chunk the bundled reports the same way ingestion does"""
+    supported_extensions = tuple(DocumentLoader.SUPPORTED_EXTENSIONS.keys())
+    doc_files = [str(f) for f in doc_dir.glob("**/*") if f.is_file() and f.suffix.lower() in supported_extensions]
+    pages = DocumentLoader.load_documents_pages(doc_files)
+    if config.rag.chunking == "structure":
+        chunks = StructureAwareChunker().split_documents(pages)
+    else:
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=config.rag.chunk_size,
+            chunk_overlap=config.rag.chunk_overlap
+        )
+        chunks = splitter.split_documents(pages)
+    return [chunk.page_content for chunk in chunks[:max_chunks]]
+
+def load_queries():
+    """Use the scoring dimension descriptions as realistic retrieval queries"""
+    criteria = ScoringCriteria.load_criteria(str(project_root / "Report_score.json")) or {}
+    queries = []
+    for category in ScoringCriteria.get_categories(criteria):
+        for dimension in ScoringCriteria.get_dimensions_for_category(criteria, category):
+            queries.append(f"{dimension.get('dimension', '')}: {dimension.get('description', '')}")
+    return queries
+
+def run_option(model_name: str, backend: str, chunks, queries, k: int):
+    """Embed the corpus and queries with one option and return timings and top-k ids"""
+    start = time.perf_counter()
+    embeddings = create_embeddings(model_name, backend)
+    load_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    chunk_vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    embed_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    query_vectors = np.asarray([embeddings.embed_query(q) for q in queries], dtype=np.float32)
+    query_seconds = time.perf_counter() - start
+    
+    index = faiss.IndexFlatL2(chunk_vectors.shape[1])
+    index.add(chunk_vectors)
+    _, ids = index.search(query_vectors, k)
+    
+    return {
+        "model": model_name,
+        "backend": backend,
+        "dimension": int(chunk_vectors.shape[1]),
+        "load_seconds": round(load_seconds, 2),
+        "chunks_per_second": round(len(chunks) / embed_seconds, 1),
+        "query_ms": round(1000 * query_seconds / max(len(queries), 1), 1),
+    }, ids
+
+def main():
+    """Compare embedding throughput and retrieval recall of the supported embedding options"""
+    parser = argparse.ArgumentParser(description="Benchmark embedding models and backends on the bundled reports")
+    parser.add_argument("--doc-dir", default=str(project_root / "data" / "documents"))
+    parser.add_argument("--max-chunks", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=10, help="Recall is measured at this depth")
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    args = parser.parse_args()
+    
+    chunks = load_chunks(Path(args.doc_dir), args.max_chunks)
+    queries = load_queries()
+    if not chunks or not queries:
+        print("[Error] Need both documents and scoring dimensions to benchmark")
+        return
+    print(f"[Info] Benchmarking on {len(chunks)} chunks and {len(queries)} queries")
+    
+    results = []
+    reference_ids = None
+    for model_name, backend in EMBEDDING_OPTIONS:
+        try:
+            result, ids = run_option(model_name, backend, chunks, queries, args.k)
+        except Exception as e:
+            logger.error(f"Skipping {model_name} ({backend}): {str(e)}")
+            continue
+        if reference_ids is None:
+            reference_ids = ids
+        # Overlap of top-k with the reference model's top-k, averaged over queries
+        recall = np.mean([
+            len(set(row) & set(ref_row)) / args.k for row, ref_row in zip(ids, reference_ids)
+        ])
+        result[f"recall@{args.k}"] = round(float(recall), 3)
+        results.append(result)
+    
+    print("\n" + "=" * 100)
+    print(f"{'model':45} {'backend':10} {'dim':>5} {'chunks/s':>10} {'query ms':>9} {f'recall@{args.k}':>10}")
+    print("-" * 100)
+    for r in results:
+        print(f"{r['model']:45} {r['backend']:10} {r['dimension']:>5} {r['chunks_per_second']:>10} "
+              f"{r['query_ms']:>9} {r[f'recall@{args.k}']:>10}")
+    print("=" * 100)
+    print("Recall is measured against the first successful option. Select one with "
+          "RAG_EMBEDDING_MODEL / RAG_EMBEDDING_BACKEND; writer processes rebuild the index when it next loads.")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
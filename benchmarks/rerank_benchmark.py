@@ -0,0 +1,109 @@
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+import numpy as np
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.absolute()
+sys.path.append(str(project_root))
+
+from sentence_transformers import CrossEncoder
+from src.utils.vector_store import VectorStore
+from src.utils.reranker import Reranker
+from src.utils.scoring_criteria import ScoringCriteria
+from src.utils.tokens import count_tokens
+from src.config import config
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def load_queries():
+    """Use the scoring dimension descriptions as realistic retrieval queries"""
+    criteria = ScoringCriteria.load_criteria(str(project_root / "Report_score.json")) or {}
+    queries = []
+    for category in ScoringCriteria.get_categories(criteria):
+        for dimension in ScoringCriteria.get_dimensions_for_category(criteria, category):
+            queries.append(f"{dimension.get('dimension', '')}: {dimension.get('description', '')}")
+    return queries
+
+def main():
+    """Compare the 500-chunk context against a re-ranked bounded context on the current index
+
+    A larger judge cross-encoder stands in for answer quality: it scores the chunks
+    each strategy keeps, and reports how much of the judge's own top-n (within the
+    candidate set) each strategy retains.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark cross-encoder re-ranking against plain top-k retrieval")
+    parser.add_argument("--baseline-k", type=int, default=500, help="Chunks sent by the current vectorized path")
+    parser.add_argument("--judge-model", default="cross-encoder/ms-marco-MiniLM-L-12-v2")
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    args = parser.parse_args()
+    
+    vector_store = VectorStore(read_only=True)
+    if not vector_store.create_or_load():
+        print("[Error] No vector store found. Run ingest.py first.")
+        return
+    queries = load_queries()
+    if not queries:
+        print("[Error] No scoring dimensions found to use as queries")
+        return
+    reranker = Reranker()
+    judge = CrossEncoder(args.judge_model, device="cpu")
+    top_n = config.rag.rerank_top_n
+    
+    rows = []
+    for query in queries:
+        start = time.perf_counter()
+        baseline = vector_store.similarity_search(query, k=args.baseline_k)
+        baseline_ms = (time.perf_counter() - start) * 1000
+        
+        start = time.perf_counter()
+        candidates = vector_store.similarity_search(query, k=config.rag.rerank_candidates)
+        reranked = reranker.rerank(query, candidates)
+        rerank_ms = (time.perf_counter() - start) * 1000
+        
+        judge_scores = judge.predict([(query, doc.page_content) for doc in candidates])
+        best = set(np.argsort(judge_scores)[::-1][:top_n])
+        position = {id(doc): i for i, doc in enumerate(candidates)}
+        kept_vector = set(range(min(top_n, len(candidates))))
+        kept_rerank = {position[id(doc)] for doc in reranked}
+        
+        rows.append({
+            "baseline_tokens": count_tokens("\n---\n".join(doc.page_content for doc in baseline)),
+            "rerank_tokens": count_tokens("\n---\n".join(doc.page_content for doc in reranked)),
+            "baseline_ms": baseline_ms,
+            "rerank_ms": rerank_ms,
+            "vector_top_n_judge": float(np.mean([judge_scores[i] for i in kept_vector])) if kept_vector else 0.0,
+            "rerank_top_n_judge": float(np.mean([judge_scores[i] for i in kept_rerank])) if kept_rerank else 0.0,
+            "vector_top_n_coverage": len(kept_vector & best) / max(len(best), 1),
+            "rerank_top_n_coverage": len(kept_rerank & best) / max(len(best), 1),
+        })
+    
+    summary = {key: round(float(np.mean([row[key] for row in rows])), 3) for key in rows[0]}
+    summary["queries"] = len(rows)
+    summary["top_n"] = top_n
+    
+    print("\n" + "=" * 80)
+    print(f"Queries: {len(rows)}   candidates: {config.rag.rerank_candidates}   kept: {top_n}")
+    print("-" * 80)
+    print(f"Context tokens        baseline (k={args.baseline_k}): {summary['baseline_tokens']:>10}   "
+          f"re-ranked: {summary['rerank_tokens']:>8}")
+    print(f"Retrieval latency ms  baseline: {summary['baseline_ms']:>10}   re-ranked: {summary['rerank_ms']:>8}")
+    print(f"Judge score of kept   vector order: {summary['vector_top_n_judge']:>6}   "
+          f"re-ranked: {summary['rerank_top_n_judge']:>8}")
+    print(f"Judge top-{top_n} coverage vector order: {summary['vector_top_n_coverage']:>6}   "
+          f"re-ranked: {summary['rerank_top_n_coverage']:>8}")
+    print("=" * 80)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "queries": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.absolute()
+sys.path.append(str(project_root))
+
+from src.utils.vector_store import VectorStore
+from src.utils.document_loader import DocumentLoader
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    """Writer process: ingest documents and publish a new index generation
+
+    Serving processes started with RAG_READ_ONLY=true memory-map the published
+    index and switch to the new generation on their next search.
+    """
+    parser = argparse.ArgumentParser(description="Ingest documents into a new vector index generation")
+    parser.add_argument("doc_dir", nargs="?", default="data/documents", help="Directory to ingest recursively")
+    args = parser.parse_args()
+    
+    doc_path = Path(args.doc_dir)
+    if not doc_path.exists():
+        print(f"[Error] Document directory does not exist: {args.doc_dir}")
+        return
+    
+    supported_extensions = tuple(DocumentLoader.SUPPORTED_EXTENSIONS.keys())
+    doc_files = [
+        str(f) for f in doc_path.glob("**/*")
+        if f.is_file() and f.suffix.lower() in supported_extensions
+    ]
+    if not doc_files:
+        print(f"[Error] No supported documents found in directory: {args.doc_dir}")
+        return
+    
+    vector_store = VectorStore(read_only=False)
+    vector_store.create_or_load()
+    
+    print(f"[Info] Ingesting {len(doc_files)} document(s)...")
+    vector_store.ingest_files(doc_files)
+    print(f"[Info] Published index generation: {vector_store.generation}")
+
+if __name__ == "__main__":
+    main()
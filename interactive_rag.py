@@ -1,7 +1,14 @@
 import logging
+import argparse
+import contextlib
 from pathlib import Path
 from src.agents.rag_assistant import RAGAssistant
 from src.utils.document_loader import DocumentLoader
+from src.utils.conversation_memory import ConversationMemory
+from src.utils.telemetry import telemetry
+from src.utils.profiling import RequestProfiler, requested_profile_mode
+
+logging.basicConfig(level=logging.INFO)
 
 def load_documents(rag_assistant, doc_dir: str = "data/documents"):
     """Load documents into the RAG system"""
@@ -27,11 +34,19 @@ def load_documents(rag_assistant, doc_dir: str = "data/documents"):
         return False
 
 def main():
+    parser = argparse.ArgumentParser(description="Interactive Q&A over the documents in data/documents")
+    parser.add_argument("--profile", nargs="?", const="1", default=None,
+                        help="Profile every question (cprofile or sampling) and store it under data/profiles")
+    args = parser.parse_args()
+    profile_mode = requested_profile_mode(args.profile, trusted=True)
     try:
+        telemetry.configure_export()
         rag_assistant = RAGAssistant()
         if not load_documents(rag_assistant):
             print("[Terminated] Document loading failed. Cannot enter interactive Q&A mode.")
             return
+        # Keeps recent turns and a rolling summary so follow-up questions work
+        memory = ConversationMemory(rag_assistant.generate_response)
         print("\nLocal RAG Interactive Q&A Platform is running. Please enter your question (type 'exit' to quit):")
         while True:
             user_query = input("\nPlease enter your question (type 'exit' to quit):\n> ").strip()
@@ -40,15 +55,24 @@ def main():
                 break
             if not user_query:
                 print("Question cannot be empty. Please try again."); continue
-            result = rag_assistant.process_query(user_query)
+            # One trace per question, so its stages can be found in the exported spans
+            with telemetry.trace("interactive_query") as span:
+                profiler = RequestProfiler("interactive_query", profile_mode) if profile_mode else contextlib.nullcontext()
+                with profiler:
+                    result = rag_assistant.process_query(user_query, memory=memory)
+            print(f"[Info] Trace {span.trace_id}, {span.duration:.2f}s")
+            if result.get("usage"):
+                print(f"[Info] {result['usage']['total_tokens']} tokens "
+                      f"({result['usage']['prompt_tokens']} prompt, {result['usage']['completion_tokens']} completion), "
+                      f"estimated ${result['usage']['cost_usd']:.4f}")
+            if profile_mode and profiler.path:
+                print(f"[Info] Profile written to {profiler.path}")
             print("\n========= Retrieved context preview =========")
             print(result["context"])
             print("\n========= RAG LLM Answer =========")
             if result.get("enhanced_prompt"):
-                answer = rag_assistant.agent.generate_reply([
-                    {"role": "user", "content": result["enhanced_prompt"]}
-                ])
-                print(answer)
+                # The answer recorded in memory, rather than a second generation from the same prompt
+                print(result["response"])
             else:
                 print("[Error] Unable to generate answer. Please check your documents and retrieval pipeline.")
     except Exception as e:
@@ -1,8 +1,12 @@
 import logging
+import argparse
+import contextlib
 from pathlib import Path
 from src.agents.rag_assistant import RAGAssistant
 from src.agents.user_proxy import EnhancedUserProxy
 from src.utils.document_loader import DocumentLoader
+from src.utils.telemetry import telemetry
+from src.utils.profiling import RequestProfiler, requested_profile_mode
 import autogen
 
 logging.basicConfig(level=logging.INFO)
@@ -61,8 +65,14 @@ def load_documents(rag_assistant, doc_dir: str = "data/documents"):
 
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description="Summarize climate risk management in data/documents")
+    parser.add_argument("--profile", nargs="?", const="1", default=None,
+                        help="Profile the query (cprofile or sampling) and store it under data/profiles")
+    args = parser.parse_args()
+    profile_mode = requested_profile_mode(args.profile, trusted=True)
     try:
         # 单 agent RAG 问答流程
+        telemetry.configure_export()
         rag_assistant = RAGAssistant()
         
         # 检查文档目录和内容
@@ -80,6 +90,8 @@ def main():
         print(f"[信息] 检测到 {len(doc_files)} 个pdf/txt文档，开始加载...")
         load_documents(rag_assistant)
         print("[信息] 文档加载完毕，准备进行RAG分析。")
+        # 宽泛的总结类问题从摘要索引回答，摘要按文档哈希缓存，只在首次运行时生成
+        rag_assistant.build_summary_index()
         
         # 原始query已备份，如需回滚可恢复
         query = (
@@ -88,7 +100,15 @@ def main():
             "The summary should be free-flowing, analytical, and as detailed as possible, integrating and synthesizing information from the context. Do not mention specific file names."
         )
         print("[信息] 开始RAG检索与分析...")
-        result = rag_assistant.process_query(query)
+        with telemetry.trace("main_query"):
+            profiler = RequestProfiler("main_query", profile_mode) if profile_mode else contextlib.nullcontext()
+            with profiler:
+                result = rag_assistant.process_query(query)
+        if profile_mode and profiler.path:
+            print(f"[信息] 性能分析结果已保存到: {profiler.path}")
+        if result.get("usage"):
+            print(f"[信息] 本次查询使用 {result['usage']['total_tokens']} 个 token，"
+                  f"估计费用 ${result['usage']['cost_usd']:.4f}")
         print("\n=========检索到的 context 预览=========")
         print(result["context"])
         print("\n=========RAG LLM Answer=========")
@@ -1,8 +1,12 @@
+import re
+import time
 import autogen
 import logging
 import sys
 import os
-from typing import List, Optional, Dict, Any
+from collections import OrderedDict
+from functools import partial
+from typing import List, Optional, Dict, Any, Union
 
 # 添加项目根目录到系统路径
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
@@ -10,29 +14,62 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')
 from src.utils.vector_store import VectorStore
 from src.utils.document_loader import DocumentLoader
 from src.utils.metrics_loader import MetricsLoader
+from src.utils.reranker import Reranker
+from src.utils.summary_index import SummaryIndex
+from src.utils.ingest_checkpoint import IngestionCheckpoint
+from src.utils.chunker import StructureAwareChunker
+from src.utils.map_reduce import MapReduceAnalyzer
+from src.utils.tokens import count_tokens, truncate_to_tokens
+from src.utils.cost_model import CostModel
+from src.utils.conversation_memory import ConversationMemory
+from src.utils.prompt_layout import PromptLayout
+from src.utils.llm_providers import ProviderRouter
+from src.utils.request_scheduler import RequestScheduler
+from src.utils.telemetry import telemetry
+from src.utils.usage import usage_tracker
 from src.config import config
 
-# Import Google Gemini API if available
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-
 logger = logging.getLogger(__name__)
 
+# Questions about a whole report rather than a specific fact
+BROAD_QUERY = re.compile(
+    r'\b(summar(y|ise|ize)|overview|overall|comprehensive|in-depth|key (points|themes|findings)|'
+    r'main (points|themes|findings)|whole (report|document)|all key)\b',
+    re.IGNORECASE
+)
+
 class RAGAssistant:
     """Assistant agent with RAG capabilities"""
     
-    def __init__(self):
-        self.vector_store = VectorStore()
-        self.vector_store.create_or_load()
+    def __init__(self, vector_store: Optional[VectorStore] = None, reranker: Optional[Reranker] = None):
+        """
+        Args:
+            vector_store: Store to retrieve from; by default the shared store is loaded
+            reranker: Re-ranker to share with another assistant instead of loading a second model
+        """
+        if vector_store is None:
+            vector_store = VectorStore()
+            vector_store.create_or_load()
+        self.vector_store = vector_store
         # Initialize document storage
         self.texts = []
         self.file_paths = []
         self.user_req_file_paths = []
         self.vectorized = False
         self.metrics_data = None
+        self.reranker = reranker or (Reranker() if config.rag.rerank_enabled else None)
+        # Reference documents are added to the context unless the assistant is scoped to user documents
+        self.include_reference_documents = True
+        # Summaries are built in the background, behind interactive questions
+        self.summary_index = SummaryIndex(
+            partial(self.generate_response, priority=RequestScheduler.BATCH),
+            self.vector_store.embeddings.embed_documents
+        )
+        self.map_reducer = MapReduceAnalyzer(self.generate_response)
+        self.cost_model = CostModel()
+        self.document_tokens = 0
+        # First-seen latency of each prompt prefix, to measure what reusing it saves
+        self.prompt_prefixes = OrderedDict()
         
         # Load sustainability metrics reference data if available
         project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
@@ -51,18 +88,8 @@ class RAGAssistant:
             else:
                 logger.warning("No metrics reference data found")
         
-        # Set up the appropriate LLM based on provider
-        if config.llm.provider == "google" and GEMINI_AVAILABLE:
-            # Configure Gemini
-            if config.llm.google_api_key:
-                genai.configure(api_key=config.llm.google_api_key)
-                logger.info(f"Configured Google Gemini with model: {config.llm.model}")
-                self.gemini_model = genai.GenerativeModel(config.llm.model)
-            else:
-                logger.error("Google API key not found. Please set GOOGLE_API_KEY in your environment variables.")
-                # Fall back to OpenAI
-                # config.llm.provider = "openai"
-                # logger.info("Falling back to OpenAI provider.")
+        # LLM calls go through the shared provider router, which fails over and hedges between providers
+        self.llm = ProviderRouter.default()
         
         # Create the assistant agent with RAG capabilities
         # Use the to_dict method to get the correct config format
@@ -74,29 +101,39 @@ class RAGAssistant:
             llm_config=llm_config
         )
     
-    def load_documents(self, file_paths: List[str], vectorize: bool = True) -> None:
+    def load_documents(self, file_paths: List[str], vectorize: bool = True,
+                       build_summaries: Optional[bool] = None) -> None:
         """Load documents into the vector store
         
         Args:
             file_paths: List of paths to documents
             vectorize: Whether to vectorize documents for retrieval (True) or just load them for direct use (False)
+            build_summaries: Whether to build the summary index of vectorized documents, which
+                costs LLM calls for documents not summarized before; defaults to config.rag.build_summaries
         """
         try:
             logger.info(f"Loading {len(file_paths)} documents...")
-            self.texts = DocumentLoader.load_documents(file_paths)
             
             # Store the file paths for reference
             self.file_paths = file_paths
+            # Broad questions must not be answered from documents loaded before
+            self.summary_index.retain(file_paths)
             
             # Only add to vector store if vectorization is requested
             if vectorize:
                 logger.info("Vectorizing documents for efficient retrieval...")
-                self.vector_store.add_texts(self.texts)
+                pages = self.vector_store.ingest_files(file_paths)
+                self.texts = [page.page_content for page in pages]
                 self.vectorized = True
                 logger.info("Documents successfully vectorized and loaded into vector store")
+                if config.rag.build_summaries if build_summaries is None else build_summaries:
+                    self.build_summary_index()
             else:
+                pages = DocumentLoader.load_documents_pages(file_paths)
+                self.texts = [page.page_content for page in pages]
                 logger.info("Documents loaded without vectorization for direct LLM processing")
                 self.vectorized = False
+            self.document_tokens = sum(count_tokens(text) for text in self.texts)
         except Exception as e:
             logger.error(f"Error loading documents: {str(e)}")
             raise
@@ -110,6 +147,7 @@ class RAGAssistant:
         self.user_req_file_paths = file_paths
         logger.info(f"Set {len(file_paths)} user requirement files")
     
+    @telemetry.traced("get_relevant_context")
     def get_relevant_context(self, query: str, k: Optional[int] = None) -> str:
         """Get relevant context for the query with priority given to user requirement documents"""
         try:
@@ -125,7 +163,7 @@ class RAGAssistant:
             project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
             ref_dir = os.path.join(project_root, 'data', 'documents', 'reference')
             
-            if os.path.exists(ref_dir):
+            if self.include_reference_documents and os.path.exists(ref_dir):
                 # Get all reference documents
                 ref_files = []
                 for root, _, files in os.walk(ref_dir):
@@ -189,6 +227,7 @@ class RAGAssistant:
             context = "\n\n".join(context_parts)
             
             # Log context statistics
+            telemetry.current().set(chunks=len(user_req_texts) + len(reference_texts) + len(chunks))
             logger.info(f"Created context with {len(context)} characters from {len(user_req_texts)} user chunks, "
                        f"{len(reference_texts)} reference chunks, and {len(chunks)} vector search chunks")
             
@@ -197,45 +236,133 @@ class RAGAssistant:
             logger.error(f"Error retrieving context: {str(e)}")
             return "Error: Unable to retrieve relevant context"
     
-    def enhance_prompt(self, query: str, context: str) -> str:
-        """为LLM拼接简明prompt，处理用户需求和系统文档的组合"""
+    @telemetry.traced("get_reranked_context")
+    def get_reranked_context(self, query: str) -> str:
+        """Get a small context from re-ranked retrieval candidates instead of whole documents"""
+        try:
+            candidates = self.vector_store.similarity_search(query, k=config.rag.rerank_candidates)
+            documents = self.reranker.rerank(query, candidates)
+            
+            user_chunks = [doc.page_content for doc in documents
+                           if doc.metadata.get("source") in self.user_req_file_paths]
+            other_chunks = [doc.page_content for doc in documents
+                            if doc.metadata.get("source") not in self.user_req_file_paths]
+            
+            context_parts = []
+            if user_chunks:
+                context_parts.append("\n\n=== USER UPLOADED DOCUMENTS ===\n" + "\n---\n".join(user_chunks))
+            if other_chunks:
+                context_parts.append("\n\n=== RELEVANT CHUNKS FROM VECTOR SEARCH ===\n" + "\n---\n".join(other_chunks))
+            context = "\n\n".join(context_parts)
+            
+            telemetry.current().set(candidates=len(candidates), chunks=len(documents))
+            logger.info(f"Created re-ranked context with {len(context)} characters from {len(documents)} of "
+                       f"{len(candidates)} candidate chunks")
+            return context
+        except Exception as e:
+            logger.error(f"Error retrieving re-ranked context: {str(e)}")
+            return "Error: Unable to retrieve relevant context"
+    
+    def build_summary_index(self) -> None:
+        """Load or build section and document summaries for the loaded documents
+
+        Chunks come from the ingestion checkpoint when the document was vectorized,
+        otherwise the document is chunked here. Summaries are only generated for
+        documents (or prompt versions) that have none stored yet.
+        """
+        for file_path in self.file_paths:
+            try:
+                doc_id = DocumentLoader.file_hash(file_path)
+                checkpoint = IngestionCheckpoint(doc_id, file_path, self.vector_store.embedding_signature)
+                if checkpoint.complete:
+                    _, chunks, _ = checkpoint.load()
+                else:
+                    chunks = StructureAwareChunker().split_documents(DocumentLoader.load_document_pages(file_path))
+                with usage_tracker.track(documents=[file_path]):
+                    self.summary_index.ensure(doc_id, file_path, chunks)
+            except Exception as e:
+                logger.error(f"Error building summaries for {file_path}: {str(e)}")
+    
+    @staticmethod
+    def is_broad_query(query: str) -> bool:
+        """Whether the query asks about documents as a whole rather than a specific fact"""
+        return bool(BROAD_QUERY.search(query))
+    
+    def get_summary_context(self, query: str, drill_down: bool = False) -> str:
+        """
+        Get context from the summary index, optionally adding chunks from the most relevant sections
+
+        Args:
+            query: User query
+            drill_down: Also include retrieved chunks belonging to the sections whose summaries matched
+
+        Returns:
+            Context string, empty if no summaries are loaded
+        """
+        if not self.summary_index.documents:
+            return ""
+        query_vector = self.vector_store.embed_queries([query])[0]
+        context = self.summary_index.get_context(query_vector)
+        if not context or not drill_down or not self.vectorized:
+            return context
+        
+        titles = set(self.summary_index.section_titles(query_vector))
+        candidates = self.vector_store.similarity_search(query, k=config.rag.rerank_candidates)
+        chunks = [doc.page_content for doc in candidates if doc.metadata.get("section") in titles]
+        chunks = chunks[:config.rag.rerank_top_n]
+        if chunks:
+            context += "\n\n=== RELEVANT CHUNKS FROM VECTOR SEARCH ===\n" + "\n---\n".join(chunks)
+        logger.info(f"Created summary context with {len(context)} characters and {len(chunks)} drill-down chunks")
+        return context
+    
+    def get_map_reduce_context(self, query: str, texts: List[str]) -> str:
+        """Get context as notes extracted from every section of the texts by concurrent map calls"""
+        stats = {}
+        notes = self.map_reducer.run(query, texts, stats)
+        if stats["failed_sections"]:
+            # Tell the model (and the caller, through the returned context) which parts are missing
+            notes += (f"\n\nNOTE: parts {', '.join(map(str, stats['failed_sections']))} of {stats['sections']} "
+                      f"could not be read; these notes do not cover them.")
+        if not notes:
+            return "Error: No relevant information found in the documents"
+        context = "\n\n=== NOTES EXTRACTED FROM THE FULL DOCUMENTS ===\n" + notes
+        logger.info(f"Created map-reduce context with {len(context)} characters")
+        return context
+    
+    @telemetry.traced("enhance_prompt")
+    def build_prompt(self, query: str, context: str, history: str = "",
+                     static_context: bool = False) -> PromptLayout:
+        """为LLM拼接简明prompt，处理用户需求和系统文档的组合
+
+        Blocks that do not change between queries come first so that providers
+        can reuse the cached prompt prefix; the question always comes last.
+
+        Args:
+            query: User query
+            context: Retrieved document context
+            history: Conversation so far, from ConversationMemory.format_history
+            static_context: The context is the whole document set rather than retrieved
+                for this query, so it belongs to the cacheable prefix
+
+        Returns:
+            Prompt layout with static and per-query blocks
+        """
+        layout = PromptLayout()
+        layout.add_static("header", "# SUSTAINABILITY REPORT ANALYSIS")
         
         # Format metrics data for inclusion in the prompt if available
-        metrics_section = ""
         if self.metrics_data:
             metrics_section = MetricsLoader.format_metrics_for_prompt(self.metrics_data)
+            layout.add_static("metrics", f"## REFERENCE METRICS AND DEFINITIONS\n{metrics_section}")
             logger.info("Added metrics reference data to prompt")
         
         # Check if the context contains user uploaded documents
         has_user_documents = "=== USER UPLOADED DOCUMENTS ===" in context
         
-        # Build a more structured prompt that includes metrics for analysis
-        prompt = f"""
-# SUSTAINABILITY REPORT ANALYSIS
-
-## EXTRACTED TEXT CONTEXT
-The following text has been extracted from sustainability reports and/or benchmark documents for analysis:
-
-{context}
-
-## USER QUESTION
-{query}
-"""
-
-        # Add metrics section if available
-        if metrics_section:
-            prompt += f"""
-
-## REFERENCE METRICS AND DEFINITIONS
-{metrics_section}
-"""
-
         # Add analysis instructions
         if has_user_documents:
-            prompt += f"""
-
-## ANALYSIS INSTRUCTIONS
-Please analyze the uploaded sustainability report using the reference metrics and definitions provided. Follow these guidelines:
+            layout.add_static("instructions", """## ANALYSIS INSTRUCTIONS
+Please analyze the uploaded sustainability report in the extracted text context below, using the reference metrics and definitions provided. Follow these guidelines:
 
 1. Structure your analysis according to the key sustainability metrics and frameworks mentioned in the reference section.
 2. For each relevant metric or framework found in the report, provide:
@@ -248,13 +375,10 @@ Please analyze the uploaded sustainability report using the reference metrics an
 4. If certain metrics are not addressed in the report, note these gaps.
 5. Conclude with an overall assessment of the organization's sustainability reporting quality and completeness.
 
-Present your analysis in a clear, structured format with appropriate headings and sections.
-"""
+Present your analysis in a clear, structured format with appropriate headings and sections.""")
         else:
-            prompt += f"""
-
-## ANALYSIS INSTRUCTIONS
-Please analyze the context thoroughly and provide a detailed answer. Follow these guidelines:
+            layout.add_static("instructions", """## ANALYSIS INSTRUCTIONS
+Please analyze the extracted text context below thoroughly and provide a detailed answer to the user question. Follow these guidelines:
 
 1. Carefully examine all parts of the context, even if information appears fragmented or scattered across different sections.
 2. Look for both direct and indirect references to the query topic.
@@ -262,70 +386,175 @@ Please analyze the context thoroughly and provide a detailed answer. Follow thes
 4. For governance or board-related queries, look for mentions of directors, board members, committees, governance structure, etc.
 5. If after thorough examination you determine the context truly lacks information about the query, state so clearly.
 
-Your goal is to extract as much relevant information as possible from the provided context, even if it requires connecting details from different parts of the text.
-"""
+Your goal is to extract as much relevant information as possible from the provided context, even if it requires connecting details from different parts of the text.""")
+        
+        context_block = f"""## EXTRACTED TEXT CONTEXT
+The following text has been extracted from sustainability reports and/or benchmark documents for analysis:
+
+{context}"""
+        if static_context:
+            layout.add_static("context", context_block)
+        else:
+            layout.add_variable("context", context_block)
         
-        return prompt
+        if history:
+            layout.add_variable("history", f"## CONVERSATION HISTORY\n{history}")
+        
+        layout.add_variable("question", f"## USER QUESTION\n{query}")
+        telemetry.current().set(blocks=len(layout.blocks))
+        return layout
     
-    def process_query(self, query: str) -> Dict[str, Any]:
-        """处理用户查询，根据是否向量化决定检索方式"""
-        try:
-            # Handle differently based on whether documents were vectorized
-            if self.vectorized:
-                # Get relevant context using vector search
-                context = self.get_relevant_context(query, k=500)  # 增加检索数量到500个chunk
+    def enhance_prompt(self, query: str, context: str, history: str = "") -> str:
+        """Prompt text for a query, static blocks first (see build_prompt)"""
+        return self.build_prompt(query, context, history).render()
+    
+    def generate_response(self, prompt: Union[str, PromptLayout], stats: Optional[Dict[str, Any]] = None,
+                          priority: int = RequestScheduler.INTERACTIVE) -> str:
+        """Send a prompt to the configured LLM providers, failing over between them
 
-            else:
-                # If not vectorized, use all document texts as context
-                context = "\n\nRelevant Context:\n" + "\n---\n".join(self.texts[:15])
-                # print("\n========= 未向量化，使用前15个文档作为context =========\n")
-            
-            # Enhance the prompt with context
-            enhanced_prompt = self.enhance_prompt(query, context)
-            print("================enhanced_prompt================",enhanced_prompt[:100])
-            print("================context================",context[:100])
-            # Use the appropriate model based on provider
-            if config.llm.provider == "google" and GEMINI_AVAILABLE and hasattr(self, 'gemini_model'):
-                try:
-                    # Use Google Gemini API directly
-                    logger.info("Using Google Gemini for response generation")
-                    gemini_response = self.gemini_model.generate_content(enhanced_prompt)
-                    
-                    # Check if the response is valid
-                    if gemini_response and hasattr(gemini_response, 'text'):
-                        response = gemini_response.text
-                        logger.info("Successfully generated response with Gemini")
+        Args:
+            prompt: Prompt text, or a layout whose static prefix can be served from
+                Gemini cached content
+            stats: Receives the provider that answered, whether the call was hedged
+                and the context cache status
+            priority: RequestScheduler.BATCH for background work that should yield
+                to questions users are waiting on
+        """
+        return self.llm.generate(prompt, system_message=self.agent.system_message, stats=stats, priority=priority)
+    
+    def record_prompt_stats(self, prefix_key: str, stats: Dict[str, Any]) -> None:
+        """
+        Add prefix reuse figures to the stats of a query
+
+        A prefix sent before can be served from the provider's prompt cache: from
+        Gemini cached content on a 'hit', or from OpenAI's automatic prefix cache
+        when it is at least config.llm.prompt_cache_min_openai_tokens long.
+
+        Args:
+            prefix_key: Hash of the prompt's static prefix
+            stats: Stats from PromptLayout.stats with 'cache' and 'latency_ms', updated in place
+        """
+        first_latency = self.prompt_prefixes.get(prefix_key)
+        reused = first_latency is not None
+        if stats.get("provider") == "google":
+            cached = stats.get("cache") == "hit"
+        else:
+            cached = reused and stats["prefix_tokens"] >= config.llm.prompt_cache_min_openai_tokens
+        stats["prefix_reused"] = reused
+        stats["cached_tokens"] = stats["prefix_tokens"] if cached else 0
+        stats["latency_saved_ms"] = first_latency - stats["latency_ms"] if reused else 0
+        if not reused:
+            self.prompt_prefixes[prefix_key] = stats["latency_ms"]
+            while len(self.prompt_prefixes) > 256:
+                self.prompt_prefixes.popitem(last=False)
+        logger.info(
+            f"Prompt: {stats['prefix_tokens']} prefix + {stats['suffix_tokens']} suffix tokens, "
+            f"{stats['cached_tokens']} cached, {stats['latency_ms']} ms "
+            f"({stats['latency_saved_ms']} ms faster than the first query with this prefix)"
+        )
+    
+    @telemetry.traced("process_query")
+    def process_query(self, query: str, strategy: Optional[str] = None,
+                      memory: Optional[ConversationMemory] = None, downgrade: bool = False) -> Dict[str, Any]:
+        """
+        处理用户查询，根据是否向量化决定检索方式
+
+        Args:
+            query: User query
+            strategy: "summary" to answer from the summary index, "map_reduce" to read every
+                page in bounded map calls, "full_context" to send every page, "retrieval" to
+                search the index, or None to pick automatically: broad questions use the
+                summary index, drilling down into the matching sections, whenever it has
+                summaries loaded, otherwise the cost model decides
+            memory: Conversation of the session; follow-up questions are rewritten for retrieval,
+                the history is added to the prompt and the turn is recorded
+            downgrade: Answer from a small retrieved context, at most
+                config.rag.downgrade_context_tokens, for a session over its budget
+
+        Returns:
+            Response, context and prompt, with the tokens and cost of the query's LLM calls in 'usage'
+        """
+        # Reference documents are shared by every session; only the user's own documents are charged
+        with usage_tracker.track(documents=self.user_req_file_paths or self.file_paths) as usage:
+            try:
+                # Retrieve with a standalone version of follow-up questions
+                search_query = memory.rewrite_query(query) if memory else query
+                broad_query = self.is_broad_query(search_query)
+                use_summaries = strategy == "summary" or (strategy is None and broad_query)
+                if downgrade:
+                    # Never whole documents or map-reduce over the budget
+                    strategy = "retrieval"
+                elif strategy is None:
+                    strategy = self.cost_model.plan(self.document_tokens, broad_query)["mode"]
+                    if strategy == "retrieval" and not self.vectorized:
+                        # Nothing to retrieve from; read every page rather than truncating
+                        strategy = "map_reduce"
+                telemetry.current().set(strategy=strategy, downgraded=downgrade)
+                # Broad questions get chunks from the matching sections too, whether asked for the
+                # summary strategy or picked out automatically; over budget the summaries alone do
+                context = self.get_summary_context(search_query, drill_down=not downgrade) if use_summaries else ""
+                
+                # Handle differently based on whether documents were vectorized
+                static_context = False
+                if context:
+                    logger.info("Answering from the summary index")
+                elif downgrade:
+                    logger.info("Session over its budget, answering from a small retrieved context")
+                    if not self.vectorized:
+                        context = "\n\nRelevant Context:\n" + "\n---\n".join(self.texts)
+                    elif self.reranker:
+                        context = self.get_reranked_context(search_query)
                     else:
-                        logger.warning("Gemini returned an empty or invalid response, falling back to OpenAI")
-                        response = self.agent.generate_reply([
-                            {"role": "user", "content": enhanced_prompt}
-                        ])
-                except Exception as gemini_error:
-                    logger.error(f"Error with Gemini API: {str(gemini_error)}")
-                    # Fallback to OpenAI with a compatible model
-                    logger.info("Falling back to OpenAI with gpt-3.5-turbo model")
-                    # Use the OpenAI agent that's already configured correctly
-                    response = self.agent.generate_reply([
-                        {"role": "user", "content": enhanced_prompt}
-                    ])
-            else:
-                # Send the enhanced prompt to the LLM using generate_reply
-                response = self.agent.generate_reply([
-                    {"role": "user", "content": enhanced_prompt}
-                ])
-            
-            return {
-                'response': response,
-                'context': context,
-                'enhanced_prompt': enhanced_prompt
-            }
-        except Exception as e:
-            logger.error(f"Error processing query: {str(e)}")
-            return {
-                'response': f"Error: {str(e)}",
-                'context': "",
-                'enhanced_prompt': ""
-            }
+                        context = self.get_relevant_context(search_query, k=config.rag.downgrade_top_k)
+                elif strategy == "map_reduce":
+                    # Too much text for one prompt: read every page in bounded map calls instead of truncating
+                    context = self.get_map_reduce_context(search_query, self.texts)
+                elif strategy == "full_context" or not self.vectorized:
+                    # The documents fit in one prompt, so send them whole
+                    context = "\n\nRelevant Context:\n" + "\n---\n".join(self.texts)
+                    static_context = True
+                elif self.reranker:
+                    # Let the cross-encoder pick a few chunks rather than the LLM reading hundreds
+                    context = self.get_reranked_context(search_query)
+                else:
+                    # Get relevant context using vector search
+                    context = self.get_relevant_context(search_query, k=500)  # 增加检索数量到500个chunk
+                    if count_tokens(context) > self.cost_model.full_context_budget():
+                        context = self.get_map_reduce_context(search_query, [context])
+                if downgrade:
+                    context = truncate_to_tokens(context, config.rag.downgrade_context_tokens)
+                
+                # Enhance the prompt with context; whole documents are part of the cacheable prefix
+                layout = self.build_prompt(query, context, memory.format_history() if memory else "",
+                                           static_context=static_context)
+                enhanced_prompt = layout.render()
+                print("================enhanced_prompt================",enhanced_prompt[:100])
+                print("================context================",context[:100])
+                prompt_stats = layout.stats()
+                started = time.perf_counter()
+                response = self.generate_response(layout, prompt_stats)
+                prompt_stats["latency_ms"] = round((time.perf_counter() - started) * 1000)
+                self.record_prompt_stats(layout.prefix_key(), prompt_stats)
+                if memory:
+                    memory.add_turn(query, str(response))
+                
+                return {
+                    'response': response,
+                    'context': context,
+                    'enhanced_prompt': enhanced_prompt,
+                    'search_query': search_query,
+                    'prompt_stats': prompt_stats,
+                    'downgraded': downgrade,
+                    'usage': usage.to_dict()
+                }
+            except Exception as e:
+                logger.error(f"Error processing query: {str(e)}")
+                return {
+                    'response': f"Error: {str(e)}",
+                    'context': "",
+                    'enhanced_prompt': "",
+                    'usage': usage.to_dict()
+                }
 if __name__ == "__main__":
     # 示例用法：初始化、加载文档、提问
     assistant = RAGAssistant()
@@ -2,10 +2,14 @@ import logging
 import os
 import re
 import autogen
-from typing import Dict, Any, List
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
 
 from src.agents.rag_assistant import RAGAssistant
 from src.agents.scoring_agent import ScoringAgent
+from src.utils.conversation_memory import ConversationMemory
+from src.utils.telemetry import telemetry
+from src.config import config
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +24,8 @@ class RouterAgent:
         self.rag_assistant = None
         self.scoring_agent = None
         self.file_paths = []
+        # Conversation memory per session and mode, least recently used first
+        self.memories: "OrderedDict[str, ConversationMemory]" = OrderedDict()
         
     def initialize_agents(self):
         """Initialize all specialized agents if they haven't been initialized yet"""
@@ -28,10 +34,11 @@ class RouterAgent:
             logger.info("Initialized RAG assistant")
             
         if self.scoring_agent is None:
-            self.scoring_agent = ScoringAgent()
+            self.scoring_agent = ScoringAgent(vector_store=self.rag_assistant.vector_store)
             logger.info("Initialized scoring agent")
     
-    def load_documents(self, file_paths: List[str], vectorize: bool = False, user_files: List[str] = None) -> bool:
+    def load_documents(self, file_paths: List[str], vectorize: bool = False, user_files: List[str] = None,
+                       build_summaries: Optional[bool] = None) -> bool:
         """
         Load documents into all agents
         
@@ -39,6 +46,7 @@ class RouterAgent:
             file_paths: List of file paths to load
             vectorize: Whether to vectorize the documents for RAG
             user_files: List of user uploaded file paths (if separate from system files)
+            build_summaries: Whether to build the summary index, defaults to config.rag.build_summaries
             
         Returns:
             True if documents were loaded successfully, False otherwise
@@ -56,10 +64,14 @@ class RouterAgent:
             self.initialize_agents()
             
             # Load documents into RAG assistant (all files including system references)
-            rag_success = self.rag_assistant.load_documents(file_paths, vectorize=vectorize)
+            # RAGAssistant.load_documents raises on failure, e.g. when a read-only store refuses ingestion
+            self.rag_assistant.load_documents(file_paths, vectorize=vectorize, build_summaries=build_summaries)
+            rag_success = True
             
             # Load documents into scoring agent (it doesn't need vectorization)
             # For scoring agent, we only use user uploaded files, not system reference files
+            # Evidence per scoring dimension is extracted now so scoring prompts stay small
+            self.scoring_agent.prepare_evidence(self.user_files)
             scoring_success = True
             
             return rag_success and scoring_success
@@ -77,17 +89,44 @@ class RouterAgent:
         if self.rag_assistant:
             self.rag_assistant.set_user_requirement_files(file_paths)
     
-    def route_query(self, query: str, mode: str = None) -> Dict[str, Any]:
+    def get_memory(self, session_id: Optional[str], mode: str) -> ConversationMemory:
+        """
+        Get the conversation memory of a session for one mode, creating it if needed
+        
+        Args:
+            session_id: Browser or CLI session identifier
+            mode: Mode the conversation happens in; modes keep separate histories
+            
+        Returns:
+            Conversation memory
+        """
+        key = f"{session_id or 'default'}:{mode}"
+        memory = self.memories.get(key)
+        if memory is None:
+            memory = ConversationMemory(self.rag_assistant.generate_response)
+            self.memories[key] = memory
+            while len(self.memories) > config.rag.memory_max_sessions:
+                self.memories.popitem(last=False)
+        self.memories.move_to_end(key)
+        return memory
+    
+    @telemetry.traced("route_query")
+    def route_query(self, query: str, mode: str = None, session_id: Optional[str] = None,
+                    downgrade: bool = False) -> Dict[str, Any]:
         """
         Route the query to the appropriate agent based on its content and mode
         
         Args:
             query: User query string
             mode: Optional mode parameter ('analysis', 'scoring', or 'explore')
+            session_id: Session whose conversation history is used for follow-up questions
+            downgrade: Answer analysis and explore questions from a small retrieved context,
+                for a session over its budget; scoring is not affected
             
         Returns:
             Dictionary containing the response and metadata
         """
+        telemetry.current().set(mode=mode or "auto")
         # Initialize agents if needed
         self.initialize_agents()
         
@@ -149,8 +188,13 @@ class RouterAgent:
             
             # If we don't have an explore agent yet, create one
             if not hasattr(self, 'explore_agent') or not self.explore_agent:
-                from src.agents.rag_assistant import RAGAssistant
-                self.explore_agent = RAGAssistant()
+                # Retrieve from an in-memory index of the user's documents only, sharing the
+                # embedding and re-ranking models; their checkpointed vectors are reused
+                self.explore_agent = RAGAssistant(
+                    vector_store=self.rag_assistant.vector_store.session_store(),
+                    reranker=self.rag_assistant.reranker
+                )
+                self.explore_agent.include_reference_documents = False
                 
                 # Clear any default metrics data that might have been loaded
                 self.explore_agent.metrics_data = None
@@ -185,26 +229,34 @@ class RouterAgent:
                     }
             
             # Process query with the explore agent
-            result = self.explore_agent.process_query(query)
+            result = self.explore_agent.process_query(query, memory=self.get_memory(session_id, 'explore'),
+                                                      downgrade=downgrade)
             
             return {
                 "agent": "explore_agent",
                 "query": query,
                 "context": result.get("context", ""),
                 "enhanced_prompt": result.get("enhanced_prompt", ""),
-                "response": result.get("response", "")
+                "response": result.get("response", ""),
+                "prompt_stats": result.get("prompt_stats"),
+                "downgraded": result.get("downgraded", False),
+                "usage": result.get("usage")
             }
         else:
             # Default to RAG assistant for analysis and other queries
             logger.info("Routing query to RAG assistant")
-            result = self.rag_assistant.process_query(query)
+            result = self.rag_assistant.process_query(query, memory=self.get_memory(session_id, 'analysis'),
+                                                      downgrade=downgrade)
             
             return {
                 "agent": "rag_assistant",
                 "query": query,
                 "context": result.get("context", ""),
                 "enhanced_prompt": result.get("enhanced_prompt", ""),
-                "response": result.get("response", "")
+                "response": result.get("response", ""),
+                "prompt_stats": result.get("prompt_stats"),
+                "downgraded": result.get("downgraded", False),
+                "usage": result.get("usage")
             }
     
     def _format_scoring_results(self, results: List[Dict[str, Any]]) -> str:
@@ -10,24 +10,56 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')
 
 from src.utils.document_loader import DocumentLoader
 from src.utils.scoring_criteria import ScoringCriteria
+from src.utils.evidence_index import EvidenceIndex
+from src.utils.prompt_layout import PromptLayout
+from src.utils.llm_providers import ProviderRouter
+from src.utils.request_scheduler import RequestScheduler
+from src.utils.telemetry import telemetry
+from src.utils.usage import usage_tracker
 from src.config import config
 
-# Import Google Gemini API if available
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-
 logger = logging.getLogger(__name__)
 
+SCORING_INSTRUCTIONS = """## SCORING INSTRUCTIONS
+For each category and dimension in the scoring criteria:
+
+1. Provide a score from 0-5 where:
+   - 0: Not addressed at all
+   - 1: Minimally addressed with significant gaps
+   - 2: Partially addressed with notable gaps
+   - 3: Adequately addressed with some gaps
+   - 4: Well addressed with minor gaps
+   - 5: Comprehensively addressed with no significant gaps
+
+2. For each dimension, provide:
+   - Score (0-5)
+   - Brief justification (1-2 sentences)
+   - Evidence from the report (direct quotes or specific references)
+   - Recommendations for improvement
+
+3. For each category, calculate an average score of its dimensions.
+
+4. Provide an overall report score (average of all category scores).
+
+5. Include a summary assessment highlighting key strengths and areas for improvement.
+
+Present your evaluation in a clear, structured format with appropriate headings and sections.
+"""
+
 class ScoringAgent:
     """Agent for scoring sustainability reports based on predefined criteria"""
     
-    def __init__(self):
+    def __init__(self, vector_store=None):
+        """
+        Args:
+            vector_store: Optional VectorStore; when given, dimension evidence is
+                precomputed with its embeddings and scoring prompts are built from it
+        """
         self.document_loader = DocumentLoader()
         self.texts = []
         self.file_paths = []
+        self.documents = {}
+        self.evidence_index = EvidenceIndex(vector_store) if vector_store is not None else None
         
         # Load scoring criteria
         project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
@@ -40,15 +72,8 @@ class ScoringAgent:
         else:
             logger.error(f"Scoring criteria file not found at {self.criteria_file_path}")
         
-        # Set up the appropriate LLM based on provider
-        if config.llm.provider == "google" and GEMINI_AVAILABLE:
-            # Configure Gemini
-            if config.llm.google_api_key:
-                genai.configure(api_key=config.llm.google_api_key)
-                logger.info(f"Configured Google Gemini with model: {config.llm.model}")
-                self.gemini_model = genai.GenerativeModel(config.llm.model)
-            else:
-                logger.error("Google API key not found. Please set GOOGLE_API_KEY in your environment variables.")
+        # LLM calls go through the shared provider router, which fails over and hedges between providers
+        self.llm = ProviderRouter.default()
         
         # Create the assistant agent with scoring capabilities
         llm_config = config.llm.to_dict()
@@ -73,12 +98,14 @@ class ScoringAgent:
         try:
             self.file_paths = file_paths
             self.texts = []
+            self.documents = {}
             
             for file_path in file_paths:
-                text = self.document_loader.load_document(file_path)
-                if text:
-                    self.texts.append(text)
-                    logger.info(f"Loaded document for scoring: {file_path}")
+                document = self.document_loader.parse_document(file_path)
+                if document.page_count:
+                    self.documents[file_path] = document
+                    self.texts.append(document.text)
+                    logger.info(f"Loaded document for scoring: {file_path} ({document.page_count} pages)")
                 else:
                     logger.warning(f"Failed to load document: {file_path}")
             
@@ -92,7 +119,7 @@ class ScoringAgent:
         Create a prompt for scoring a document
         
         Args:
-            document_text: Text content of the document to score
+            document_text: Text content of the document to score, already within the token budget
             
         Returns:
             Formatted prompt for the LLM
@@ -100,47 +127,75 @@ class ScoringAgent:
         if not self.scoring_criteria:
             return "Error: Scoring criteria not loaded."
         
-        formatted_criteria = ScoringCriteria.format_criteria_for_prompt(self.scoring_criteria)
-        
-        prompt = f"""# SUSTAINABILITY REPORT SCORING TASK
-
-## DOCUMENT TO SCORE
+        return self._scoring_layout().add_variable("document", f"""## DOCUMENT TO SCORE
 The following text has been extracted from a sustainability report for scoring:
 
-{document_text[:50000]}  # Limit text to avoid token limits
-
-## SCORING CRITERIA
+{document_text}""").render()
+    
+    def _scoring_layout(self) -> PromptLayout:
+        """Prompt layout starting with the task, criteria and instructions, which are the same for every document"""
+        formatted_criteria = ScoringCriteria.format_criteria_for_prompt(self.scoring_criteria)
+        layout = PromptLayout()
+        layout.add_static("header", "# SUSTAINABILITY REPORT SCORING TASK")
+        layout.add_static("criteria", f"""## SCORING CRITERIA
 Please score the sustainability report based on the following criteria:
 
-{formatted_criteria}
-
-## SCORING INSTRUCTIONS
-For each category and dimension listed above:
-
-1. Provide a score from 0-5 where:
-   - 0: Not addressed at all
-   - 1: Minimally addressed with significant gaps
-   - 2: Partially addressed with notable gaps
-   - 3: Adequately addressed with some gaps
-   - 4: Well addressed with minor gaps
-   - 5: Comprehensively addressed with no significant gaps
-
-2. For each dimension, provide:
-   - Score (0-5)
-   - Brief justification (1-2 sentences)
-   - Evidence from the report (direct quotes or specific references)
-   - Recommendations for improvement
-
-3. For each category, calculate an average score of its dimensions.
-
-4. Provide an overall report score (average of all category scores).
-
-5. Include a summary assessment highlighting key strengths and areas for improvement.
+{formatted_criteria}""")
+        layout.add_static("instructions", SCORING_INSTRUCTIONS.strip())
+        return layout
+    
+    def prepare_evidence(self, file_paths: List[str]) -> None:
+        """
+        Precompute dimension evidence for documents so scoring does not read the raw report
+        
+        Args:
+            file_paths: Documents that will be scored
+        """
+        if not self.evidence_index or not self.scoring_criteria:
+            return
+        for file_path in file_paths:
+            if not file_path.lower().endswith(('.pdf', '.txt')):
+                continue
+            try:
+                self.evidence_index.ensure(file_path, self.scoring_criteria)
+            except Exception as e:
+                logger.error(f"Error extracting scoring evidence for {file_path}: {str(e)}")
+    
+    def create_evidence_prompt(self, evidence: Dict[str, Any]) -> str:
+        """
+        Create a scoring prompt from precomputed dimension evidence
+        
+        Args:
+            evidence: Evidence of one document, as returned by EvidenceIndex.ensure
+            
+        Returns:
+            Formatted prompt for the LLM
+        """
+        if not self.scoring_criteria:
+            return "Error: Scoring criteria not loaded."
+        
+        sections = []
+        current_category = None
+        for dimension in evidence.get("dimensions", []):
+            if dimension["category"] != current_category:
+                current_category = dimension["category"]
+                sections.append(f"### {current_category}")
+            sections.append(f"#### {dimension['dimension']}")
+            if dimension["evidence"]:
+                for item in dimension["evidence"]:
+                    page = f"page {item['page'] + 1}" if item.get("page") is not None else "page unknown"
+                    sections.append(f"- [{page}] {item['text']}")
+            else:
+                sections.append("- No evidence found")
+            sections.append("")
+        
+        return self._scoring_layout().add_variable("evidence", f"""## EVIDENCE FROM THE REPORT
+Each dimension of the criteria is followed by the passages of the sustainability report most relevant to it.
+Score each dimension from its evidence only; if the evidence does not address a dimension, treat it as not addressed.
 
-Present your evaluation in a clear, structured format with appropriate headings and sections.
-"""
-        return prompt
+{chr(10).join(sections)}""").render()
     
+    @telemetry.traced("score_document")
     def score_document(self, file_path: str) -> Dict[str, Any]:
         """
         Score a single document based on the scoring criteria
@@ -149,59 +204,45 @@ Present your evaluation in a clear, structured format with appropriate headings
             file_path: Path to the document to score
             
         Returns:
-            Dictionary containing the scoring results
+            Dictionary containing the scoring results and the tokens and cost of the scoring call
         """
-        try:
-            # Load the document
-            document_text = self.document_loader.load_document(file_path)
-            if not document_text:
-                logger.error(f"Failed to load document for scoring: {file_path}")
-                return {"error": f"Failed to load document: {file_path}"}
+        telemetry.current().set(document=os.path.basename(file_path))
+        with usage_tracker.track(documents=[file_path]) as usage:
+            try:
+                if self.evidence_index and self.scoring_criteria:
+                    # Build the prompt from the evidence extracted for each dimension
+                    evidence = self.evidence_index.ensure(file_path, self.scoring_criteria)
+                    scoring_prompt = self.create_evidence_prompt(evidence)
+                else:
+                    # Reuse the document parsed by load_documents; parse_document caches it otherwise
+                    document = self.documents.get(file_path) or self.document_loader.parse_document(file_path)
+                    if not document.page_count:
+                        logger.error(f"Failed to load document for scoring: {file_path}")
+                        return {"error": f"Failed to load document: {file_path}"}
+                
+                    # Create the scoring prompt from as many whole pages as fit the token budget
+                    document_text = document.text_within_tokens(config.rag.scoring_document_tokens)
+                    scoring_prompt = self.create_scoring_prompt(document_text)
             
-            # Create the scoring prompt
-            scoring_prompt = self.create_scoring_prompt(document_text)
+                # Process with the first provider that answers
+                llm_stats = {}
+                response_text = self.llm.generate(scoring_prompt, system_message=self.agent.system_message,
+                                                  stats=llm_stats, priority=RequestScheduler.BATCH)
+                logger.info(f"Scored {os.path.basename(file_path)} with {llm_stats.get('provider')}")
             
-            # Process with the appropriate LLM
-            if config.llm.provider == "google" and GEMINI_AVAILABLE and hasattr(self, 'gemini_model'):
-                logger.info("Using Google Gemini for scoring")
-                try:
-                    gemini_response = self.gemini_model.generate_content(scoring_prompt)
-                    
-                    # Check if the response is valid
-                    if gemini_response and hasattr(gemini_response, 'text'):
-                        response_text = gemini_response.text
-                        logger.info("Successfully generated scoring with Gemini")
-                    else:
-                        logger.warning("Gemini returned an empty or invalid response, falling back to OpenAI")
-                        response_text = self.agent.generate_reply([
-                            {"role": "user", "content": scoring_prompt}
-                        ])
-                except Exception as gemini_error:
-                    logger.error(f"Error with Gemini API: {str(gemini_error)}")
-                    # Fallback to OpenAI
-                    logger.info("Falling back to OpenAI for scoring")
-                    response_text = self.agent.generate_reply([
-                        {"role": "user", "content": scoring_prompt}
-                    ])
-            else:
-                # Use the OpenAI agent
-                logger.info("Using OpenAI for scoring")
-                response_text = self.agent.generate_reply([
-                    {"role": "user", "content": scoring_prompt}
-                ])
+                # Format the response
+                result = {
+                    "file_path": file_path,
+                    "file_name": os.path.basename(file_path),
+                    "scoring_result": response_text,
+                    "timestamp": self._get_timestamp(),
+                    "usage": usage.to_dict()
+                }
             
-            # Format the response
-            result = {
-                "file_path": file_path,
-                "file_name": os.path.basename(file_path),
-                "scoring_result": response_text,
-                "timestamp": self._get_timestamp()
-            }
-            
-            return result
-        except Exception as e:
-            logger.error(f"Error scoring document: {str(e)}")
-            return {"error": f"Error scoring document: {str(e)}"}
+                return result
+            except Exception as e:
+                logger.error(f"Error scoring document: {str(e)}")
+                return {"error": f"Error scoring document: {str(e)}", "usage": usage.to_dict()}
     
     def _get_timestamp(self) -> str:
         """Get current timestamp string"""
@@ -1,14 +1,22 @@
 import autogen
 import logging
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional
 from ..config import config
+from ..utils.conversation_memory import ConversationMemory
+from ..utils.llm_providers import ProviderRouter
 
 logger = logging.getLogger(__name__)
 
 class EnhancedUserProxy(autogen.UserProxyAgent):
     """Enhanced user proxy with RAG support"""
     
-    def __init__(self, name="user_proxy", **kwargs):
+    def __init__(self, name="user_proxy", generate: Optional[Callable[[str], str]] = None, **kwargs):
+        """
+        Args:
+            name: Agent name in the group chat
+            generate: Sends a prompt to the LLM and returns the response text, used to
+                summarize older turns; defaults to the shared provider router
+        """
         super().__init__(
             name=name,
             system_message="""You are an enhanced user proxy that manages RAG-enabled conversations.
@@ -23,13 +31,44 @@ class EnhancedUserProxy(autogen.UserProxyAgent):
             code_execution_config={"use_docker": False},  # Disable Docker requirement
             **kwargs
         )
-        self._conversation_context = []
+        # Bounded history: recent turns verbatim, older ones summarized
+        self.memory = ConversationMemory(generate or ProviderRouter.default().generate)
+        self._pending_question = None
+        # Replies are generated from the bounded history rather than every message so far
+        self.register_hook("process_all_messages_before_reply", self._with_history)
     
-    def _update_context(self, message: Dict[str, Any]) -> None:
+    def _update_context(self, message: Dict[str, Any], sender: Any = None) -> None:
         """Update conversation context"""
-        self._conversation_context.append(message)
-        if len(self._conversation_context) > 5:  # Keep last 5 messages
-            self._conversation_context.pop(0)
+        content = message.get("content", "") if isinstance(message, dict) else str(message)
+        # In a group chat messages arrive from the manager, named after the agent that spoke
+        speaker = message.get("name") if isinstance(message, dict) else None
+        speaker = speaker or getattr(sender, "name", None)
+        if speaker == "rag_assistant":
+            self.memory.add_turn(self._pending_question or "", content)
+            self._pending_question = None
+        else:
+            self._pending_question = content
+    
+    def conversation_history(self) -> str:
+        """Conversation so far, within the memory's token budget"""
+        return self.memory.format_history()
+    
+    def _with_history(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replace the messages a reply is generated from with the history and the latest message"""
+        history = self.conversation_history()
+        if not history or not messages:
+            return messages
+        return [{"role": "system", "content": f"Conversation so far:\n{history}"}] + messages[-1:]
+    
+    def _process_received_message(self, message, sender, silent):
+        """Record question and answer turns as messages arrive"""
+        self._update_context(message, sender)
+        return super()._process_received_message(message, sender, silent)
+    
+    def send(self, message, recipient, request_reply=None, silent=False):
+        """Record the proxy's own questions, which it never receives back"""
+        self._update_context(message)
+        return super().send(message, recipient, request_reply=request_reply, silent=silent)
     
     def _evaluate_response(self, response: str) -> bool:
         """Evaluate if the response is satisfactory"""
@@ -42,7 +81,7 @@ class EnhancedUserProxy(autogen.UserProxyAgent):
             logger.info(f"Received message from {sender.name}")
             
             # Update conversation context
-            self._update_context(message)
+            self._update_context(message, sender)
             
             # Evaluate response if it's from the RAG assistant
             if sender.name == "rag_assistant":
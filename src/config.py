@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 
 # Load environment variables
 load_dotenv()
@@ -10,48 +10,215 @@ class RAGConfig(BaseModel):
     """RAG specific configuration"""
     chunk_size: int = Field(default=1000, description="Size of text chunks for splitting documents")
     chunk_overlap: int = Field(default=200, description="Overlap between text chunks")
+    chunking: str = Field(default="structure", description="Chunking strategy: structure (page/heading/table aware) or recursive")
+    chunk_tokens: int = Field(default=350, description="Maximum tokens per chunk for structure-aware chunking")
+    chunk_overlap_tokens: int = Field(default=24, description="Maximum tokens carried over between consecutive chunks")
     embedding_model: str = Field(
-        default="sentence-transformers/all-mpnet-base-v2",
+        default=os.getenv("RAG_EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2"),
         description="Model to use for embeddings"
     )
+    embedding_backend: str = Field(
+        default=os.getenv("RAG_EMBEDDING_BACKEND", "torch"),
+        description="Embedding backend: torch, onnx or onnx-int8 (quantized, CPU friendly)"
+    )
+    onnx_int8_file: str = Field(default="onnx/model_quint8_avx2.onnx", description="Quantized ONNX file used by the onnx-int8 backend")
+    embedding_batch_size: int = Field(default=64, description="Batch size for embedding chunks")
     retrieval_k: int = Field(default=4, description="Number of documents to retrieve")
+    query_cache_size: int = Field(default=1024, description="Number of query embeddings kept in the LRU cache")
+    rerank_enabled: bool = Field(
+        default=os.getenv("RAG_RERANK", "false").lower() == "true",
+        description="Re-rank a bounded candidate set with a local cross-encoder instead of sending hundreds of chunks"
+    )
+    rerank_model: str = Field(default="cross-encoder/ms-marco-MiniLM-L-6-v2", description="Cross-encoder used for re-ranking")
+    rerank_candidates: int = Field(default=50, description="Number of retrieval candidates passed to the re-ranker")
+    rerank_top_n: int = Field(default=8, description="Number of re-ranked chunks kept for the prompt")
+    rerank_batch_size: int = Field(default=16, description="Batch size for cross-encoder inference")
+    rerank_budget_ms: int = Field(default=1500, description="Latency budget for re-ranking one query")
     vector_store_path: str = Field(
         default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "vector_store"),
         description="Path to vector store"
     )
+    read_only: bool = Field(
+        default=os.getenv("RAG_READ_ONLY", "false").lower() == "true",
+        description="Serve the vector store read-only and follow generations published by a writer process"
+    )
+    mmap_index: bool = Field(default=True, description="Memory-map the FAISS index in read-only mode so workers share pages")
+    keep_generations: int = Field(default=2, description="Number of published index generations to keep on disk")
+    ingest_checkpoint_path: str = Field(
+        default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "ingest_checkpoints"),
+        description="Path to per-document ingestion checkpoints"
+    )
+    ingest_batch_pages: int = Field(default=16, description="Pages extracted and embedded per checkpointed batch")
+    ingest_checkpoint_ttl_hours: int = Field(default=72, description="Hours an unused checkpoint of a document not in the index is kept")
+    ingest_checkpoint_max_mb: int = Field(default=2048, description="Space ingestion checkpoints may use before the least recently used complete ones are removed")
+    summary_path: str = Field(
+        default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "summaries"),
+        description="Path to per-document section and document summaries"
+    )
+    build_summaries: bool = Field(
+        default=os.getenv("RAG_BUILD_SUMMARIES", "false").lower() == "true",
+        description="Build the summary index right after documents are vectorized"
+    )
+    summary_section_tokens: int = Field(default=3000, description="Maximum tokens of section text sent to one summary call")
+    summary_min_section_tokens: int = Field(default=300, description="Sections smaller than this are merged with the next one")
+    summary_workers: int = Field(default=4, description="Concurrent section summary calls")
+    summary_top_sections: int = Field(default=6, description="Section summaries included for a broad question")
+    direct_context_tokens: int = Field(default=30000, description="Largest document context sent in one prompt before switching to map-reduce")
+    map_section_tokens: int = Field(default=6000, description="Maximum tokens of document text per map call")
+    map_workers: int = Field(default=4, description="Concurrent map and reduce calls")
+    reduce_input_tokens: int = Field(default=12000, description="Maximum tokens of partial notes per reduce call")
+    map_max_failed_fraction: float = Field(default=0.25, description="Share of map calls that may fail before a map-reduce query fails instead of answering from the rest")
+    expected_answer_tokens: int = Field(default=1500, description="Answer length assumed when estimating cost and latency")
+    memory_recent_turns: int = Field(default=4, description="Conversation turns kept verbatim")
+    memory_history_tokens: int = Field(default=1500, description="Token budget of the verbatim conversation turns")
+    memory_summary_tokens: int = Field(default=400, description="Token budget of the rolling summary of older turns")
+    downgrade_top_k: int = Field(default=20, description="Chunks retrieved for a session over its budget when no re-ranker is loaded")
+    downgrade_context_tokens: int = Field(default=8000, description="Largest context sent for a session over its budget")
+    memory_max_sessions: int = Field(default=200, description="Conversations kept in memory by the router")
+    evidence_path: str = Field(
+        default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "evidence"),
+        description="Path to precomputed scoring evidence per document"
+    )
+    evidence_k: int = Field(default=5, description="Evidence chunks stored per scoring dimension")
+    parse_cache_size: int = Field(default=32, description="Number of parsed documents kept in memory")
+    scoring_document_tokens: int = Field(default=12000, description="Maximum tokens of report text in a scoring prompt without evidence")
 
 class LLMConfig(BaseModel):
     """LLM configuration"""
-    provider: str = Field(default="google", description="Provider for LLM (openai or google)")
-    model: str = Field(default="models/gemini-1.5-pro", description="Model to use for LLM")
+    provider: str = Field(default=os.getenv("LLM_PROVIDER", "google"), description="Preferred LLM provider (google, openai, or mock for a local stand-in)")
+    fallback_providers: List[str] = Field(default=["google", "openai"], description="Providers tried after the preferred one, in order")
+    model: Optional[str] = Field(default=os.getenv("LLM_MODEL"), description="Model of the preferred provider, overriding google_model or openai_model")
+    google_model: str = Field(default="models/gemini-1.5-pro", description="Gemini model")
+    openai_model: str = Field(default="gpt-3.5-turbo", description="OpenAI model")
     temperature: float = Field(default=0.7, description="Temperature for LLM")
     openai_api_key: str = Field(default=os.getenv("OPENAI_API_KEY"), description="API key for OpenAI")
     google_api_key: str = Field(default=os.getenv("GOOGLE_API_KEY"), description="API key for Google Gemini")
+    google_timeout_s: float = Field(default=120, description="Seconds to wait for Gemini before failing over")
+    openai_timeout_s: float = Field(default=120, description="Seconds to wait for OpenAI before failing over")
+    circuit_failure_threshold: int = Field(default=3, description="Consecutive failures that open a provider's circuit")
+    circuit_cooldown_s: float = Field(default=30, description="Seconds a provider with an open circuit is skipped")
+    hedge_enabled: bool = Field(default=True, description="Also send a call to the next provider once it exceeds the first one's p95 latency")
+    hedge_min_delay_s: float = Field(default=2.0, description="Shortest wait before hedging a call")
+    max_concurrent_calls: int = Field(default=16, description="LLM calls in flight at once across all agents")
+    google_rpm: int = Field(default=360, description="Gemini requests per minute quota")
+    google_tpm: int = Field(default=4_000_000, description="Gemini tokens per minute quota")
+    openai_rpm: int = Field(default=500, description="OpenAI requests per minute quota")
+    openai_tpm: int = Field(default=200_000, description="OpenAI tokens per minute quota")
+    rate_limit_max_retries: int = Field(default=4, description="Retries of a call rejected with a rate-limit error")
+    rate_limit_backoff_s: float = Field(default=2.0, description="Base of the exponential backoff after a rate-limit error")
+    rate_limit_max_backoff_s: float = Field(default=60.0, description="Longest backoff after a rate-limit error")
+    mock_latency_s: float = Field(default=0.5, description="Fixed latency of each mock provider call")
+    mock_prompt_tokens_per_second: float = Field(default=20000, description="Rate at which the mock provider reads prompts, 0 for instant")
+    mock_tokens_per_second: float = Field(default=80, description="Rate at which the mock provider writes responses, 0 for instant")
+    mock_response_tokens: int = Field(default=300, description="Length of the mock provider's filler responses")
+    mock_responses_path: Optional[str] = Field(default=os.getenv("MOCK_RESPONSES_PATH"), description="JSON file mapping prompt substrings to canned mock responses")
+    prompt_cache_enabled: bool = Field(default=True, description="Serve large static prompt prefixes from Gemini cached content")
+    prompt_cache_min_tokens: int = Field(default=32768, description="Smallest prompt prefix Gemini accepts as cached content")
+    prompt_cache_min_openai_tokens: int = Field(default=1024, description="Smallest prompt prefix OpenAI caches automatically")
+    prompt_cache_ttl_minutes: int = Field(default=30, description="Minutes Gemini keeps a cached prompt prefix")
+    session_token_budget: int = Field(default=int(os.getenv("SESSION_TOKEN_BUDGET", "0")), description="Prompt and completion tokens a session may use before budget_action applies, 0 for unlimited")
+    session_cost_budget_usd: float = Field(default=float(os.getenv("SESSION_COST_BUDGET_USD", "0")), description="Estimated cost a session may incur before budget_action applies, 0 for unlimited")
+    budget_action: str = Field(default=os.getenv("BUDGET_ACTION", "downgrade"), description="What happens to requests of a session over its budget: reject, or downgrade to a small retrieved context")
+    usage_max_sessions: int = Field(default=1000, description="Sessions whose usage is kept in memory, least recently active dropped first")
     
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert config to AutoGen format"""
-        if self.provider == "openai":
-            return {
-                "config_list": [{
-                    "model": self.model,
-                    "api_key": self.openai_api_key,
-                }],
-                "temperature": self.temperature
-            }
-        elif self.provider == "google":
-            return {
-                "config_list": [{
-                    "model": self.model,
-                    "api_key": self.google_api_key,
-                }],
-                "temperature": self.temperature
+    def provider_order(self) -> List[str]:
+        """Providers in order of preference, the preferred one first"""
+        if self.provider == "mock":
+            # Never fall through to a paid provider while benchmarking
+            return ["mock"]
+        return [self.provider] + [name for name in self.fallback_providers if name != self.provider]
+    
+    def model_for(self, provider: str) -> str:
+        """Model to call at a provider; model applies only to the preferred provider"""
+        if provider == "mock":
+            return "mock"
+        if provider == self.provider and self.model:
+            return self.model
+        return self.openai_model if provider == "openai" else self.google_model
+    
+    @property
+    def preferred_model(self) -> str:
+        """Model of the preferred provider, which answers unless it fails"""
+        return self.model_for(self.provider)
+    
+    def api_key_for(self, provider: str) -> Optional[str]:
+        return self.openai_api_key if provider == "openai" else self.google_api_key
+    
+    def timeout_for(self, provider: str) -> float:
+        return self.openai_timeout_s if provider == "openai" else self.google_timeout_s
+    
+    def rate_limits_for(self, provider: str) -> Tuple[int, int]:
+        """Requests and tokens per minute quota of a provider"""
+        if provider == "mock":
+            return 1_000_000, 1_000_000_000
+        if provider == "openai":
+            return self.openai_rpm, self.openai_tpm
+        return self.google_rpm, self.google_tpm
+    
+    def to_dict(self) -> Union[Dict[str, Any], bool]:
+        """Convert config to AutoGen format, one config_list entry per provider with its own model
+
+        The mock provider has no AutoGen client, so agents are created without an LLM.
+        """
+        if self.provider == "mock":
+            return False
+        config_list = []
+        for provider in self.provider_order():
+            entry = {
+                "model": self.model_for(provider),
+                "api_key": self.api_key_for(provider),
             }
+            if provider == "google":
+                entry["api_type"] = "google"
+            config_list.append(entry)
+        return {
+            "config_list": config_list,
+            "temperature": self.temperature
+        }
+
+class WebConfig(BaseModel):
+    """Web application configuration"""
+    scoring_path: str = Field(
+        default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "scoring"),
+        description="Path to stored scoring results"
+    )
+    scoring_workers: int = Field(default=2, description="Scoring jobs run concurrently in the background")
+    blob_path: str = Field(
+        default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "blobs"),
+        description="Path to content-addressed uploaded documents"
+    )
+    blob_ttl_hours: int = Field(default=72, description="Hours a session keeps its uploaded documents alive")
+    blob_gc_interval_minutes: int = Field(default=60, description="Minimum minutes between garbage collections of unreferenced uploads")
+    max_file_mb: int = Field(default=50, description="Largest accepted uploaded file, enforced while streaming")
+    max_request_mb: int = Field(default=200, description="Largest accepted upload request")
+    prefetch_workers: int = Field(default=2, description="Threads parsing uploaded documents as soon as they are stored")
+
+class TelemetryConfig(BaseModel):
+    """Tracing and metrics configuration"""
+    trace_export: str = Field(default=os.getenv("TRACE_EXPORT", "none"), description="Where finished spans go: none, file or otlp")
+    trace_file_path: str = Field(
+        default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "traces", "spans.jsonl"),
+        description="JSON-lines file of spans in the OTLP/JSON format when trace_export is file"
+    )
+    otlp_endpoint: str = Field(default=os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces"), description="OTLP/HTTP traces endpoint of a collector when trace_export is otlp")
+    service_name: str = Field(default="sustainability-rag", description="service.name resource attribute of exported spans")
+    profiling_enabled: bool = Field(default=os.getenv("PROFILING_ENABLED", "false").lower() == "true", description="Honour per-request profiling toggles sent by HTTP clients (X-Profile header, ?profile=); --profile always works")
+    profile_mode: str = Field(default="cprofile", description="Profiler used when a toggle does not name one: cprofile or sampling (pyinstrument)")
+    profile_path: str = Field(
+        default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "profiles"),
+        description="Directory profiles are stored under, one subdirectory per profiled request"
+    )
+    profile_top_n: int = Field(default=40, description="Functions and allocation sites listed in profile summaries")
+    profile_max_count: int = Field(default=100, description="Profiles kept on disk, oldest removed first")
+    profile_traceback_frames: int = Field(default=1, description="Frames tracemalloc records per allocation")
 
 class Config:
     """Main configuration class"""
     def __init__(self):
         self.rag = RAGConfig()
         self.llm = LLMConfig()
+        self.web = WebConfig()
+        self.telemetry = TelemetryConfig()
         
     @property
     def llm_config(self) -> Dict[str, Any]:
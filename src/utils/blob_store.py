@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
+from werkzeug.utils import secure_filename
+from .upload_stream import HashingUploadFile
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    """Content-addressed storage for uploaded documents
+
+    Each distinct file is stored once under data/blobs/<sha256>/<filename>, named
+    after its first upload, so identical uploads share one path and everything
+    keyed by that path or hash (parsed text, ingestion checkpoints, index
+    entries, evidence, scores) is reused. Sessions record the blobs they use in
+    data/blobs/refs/<session_id>.json; blobs no live session references and
+    the shared index does not contain are removed by gc().
+    """
+    
+    BLOCK_SIZE = 1024 * 1024
+    REFS_DIR = "refs"
+    TMP_DIR = ".tmp"
+    
+    def __init__(self, root: Optional[str] = None):
+        """
+        Args:
+            root: Blob directory, defaults to config.web.blob_path
+        """
+        self.root = root or config.web.blob_path
+        self._lock = threading.Lock()
+        self._last_gc = 0.0
+        os.makedirs(os.path.join(self.root, self.REFS_DIR), exist_ok=True)
+        os.makedirs(os.path.join(self.root, self.TMP_DIR), exist_ok=True)
+    
+    def path_for(self, sha: str) -> Optional[str]:
+        """Path of a stored blob, None if it is not stored"""
+        blob_dir = os.path.join(self.root, sha)
+        try:
+            names = [name for name in os.listdir(blob_dir) if not name.startswith(".")]
+        except FileNotFoundError:
+            return None
+        return os.path.join(blob_dir, names[0]) if names else None
+    
+    def put(self, stream: BinaryIO, filename: str) -> Tuple[str, str, bool]:
+        """
+        Store an uploaded file unless identical content is already stored
+
+        Args:
+            stream: Seekable binary stream of the upload; a HashingUploadFile is
+                moved into place without being read again
+            filename: Original file name, used for the first copy of the content
+
+        Returns:
+            SHA-256 of the content, path of the stored blob, and whether it was newly written
+        """
+        if isinstance(stream, HashingUploadFile):
+            stream.finish()
+            sha = stream.sha
+            if self.path_for(sha):
+                stream.discard()
+                self._touch(sha)
+                logger.info(f"Upload {filename} matches stored blob {sha[:12]}, discarding it")
+                return sha, self.path_for(sha), False
+            return sha, self._commit(sha, stream.path, filename), True
+        
+        sha256 = hashlib.sha256()
+        for block in iter(lambda: stream.read(self.BLOCK_SIZE), b''):
+            sha256.update(block)
+        sha = sha256.hexdigest()
+        
+        existing = self.path_for(sha)
+        if existing:
+            self._touch(sha)
+            logger.info(f"Upload {filename} matches stored blob {sha[:12]}, skipping write")
+            return sha, existing, False
+        
+        stream.seek(0)
+        tmp_path = os.path.join(self.root, self.TMP_DIR, f"{sha}.{threading.get_ident()}")
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(stream, f, self.BLOCK_SIZE)
+        return sha, self._commit(sha, tmp_path, filename), True
+    
+    def _commit(self, sha: str, tmp_path: str, filename: str) -> str:
+        """Move a fully written temporary file into place as the blob for sha"""
+        with self._lock:
+            existing = self.path_for(sha)
+            if existing:
+                # Another request stored the same content meanwhile
+                os.remove(tmp_path)
+                return existing
+            blob_dir = os.path.join(self.root, sha)
+            os.makedirs(blob_dir, exist_ok=True)
+            path = os.path.join(blob_dir, secure_filename(filename) or sha)
+            os.replace(tmp_path, path)
+        logger.info(f"Stored new blob {sha[:12]} as {os.path.basename(path)}")
+        return path
+    
+    def _touch(self, sha: str) -> None:
+        """Mark a blob as recently used so gc() spares it"""
+        # The directory is touched, not the file, so caches keyed by file mtime stay valid
+        try:
+            os.utime(os.path.join(self.root, sha))
+        except OSError:
+            pass
+    
+    def _refs_path(self, session_id: str) -> str:
+        return os.path.join(self.root, self.REFS_DIR, f"{secure_filename(session_id)}.json")
+    
+    def add_references(self, session_id: str, shas: List[str]) -> None:
+        """Record that a session uses the given blobs"""
+        path = self._refs_path(session_id)
+        with self._lock:
+            refs = self._read_refs(path)
+            refs["blobs"] = sorted(set(refs.get("blobs", [])) | set(shas))
+            refs["updated"] = time.time()
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(refs, f)
+            os.replace(tmp_path, path)
+    
+    def references(self, session_id: str) -> List[str]:
+        """Blobs a session uses"""
+        return self._read_refs(self._refs_path(session_id)).get("blobs", [])
+    
+    @staticmethod
+    def _read_refs(path: str) -> Dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def gc(self, force: bool = False, keep: Optional[Set[str]] = None) -> int:
+        """
+        Remove expired session references and blobs nothing references any more
+
+        Blobs written or reused within the session lifetime are kept even if
+        unreferenced, so an upload whose reference is not recorded yet survives.
+
+        Args:
+            force: Run even if the last collection was less than the GC interval ago
+            keep: SHA-256 of blobs to keep regardless of session references, such as
+                documents in the shared index; a document's doc_id is its blob's SHA-256
+
+        Returns:
+            Number of blobs removed
+        """
+        now = time.time()
+        if not force and now - self._last_gc < config.web.blob_gc_interval_minutes * 60:
+            return 0
+        self._last_gc = now
+        ttl = config.web.blob_ttl_hours * 3600
+        
+        with self._lock:
+            referenced = set(keep or ())
+            refs_dir = os.path.join(self.root, self.REFS_DIR)
+            for name in os.listdir(refs_dir):
+                path = os.path.join(refs_dir, name)
+                refs = self._read_refs(path)
+                if now - refs.get("updated", 0) > ttl:
+                    os.remove(path)
+                    continue
+                referenced.update(refs.get("blobs", []))
+            
+            # Temporary files of uploads that never completed
+            tmp_dir = os.path.join(self.root, self.TMP_DIR)
+            for name in os.listdir(tmp_dir):
+                path = os.path.join(tmp_dir, name)
+                if now - os.path.getmtime(path) > ttl:
+                    os.remove(path)
+            
+            removed = 0
+            for sha in os.listdir(self.root):
+                if sha in (self.REFS_DIR, self.TMP_DIR) or sha in referenced:
+                    continue
+                if now - os.path.getmtime(os.path.join(self.root, sha)) <= ttl:
+                    continue
+                shutil.rmtree(os.path.join(self.root, sha), ignore_errors=True)
+                removed += 1
+        
+        if removed:
+            logger.info(f"Removed {removed} unreferenced blobs")
+        return removed
@@ -0,0 +1,149 @@
+import os
+import json
+import mmap
+import logging
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, Union
+import numpy as np
+from langchain.docstore.base import AddableMixin, Docstore
+from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
+
+class ChunkStore(Docstore):
+    """Compact, memory-mapped store of chunk texts and metadata
+
+    A generation directory holds three files:
+        chunks.bin      UTF-8 chunk texts, concatenated
+        chunks.meta     JSON metadata of each chunk, concatenated
+        chunks.idx.npy  uint64 array of shape (n + 1, 2) with text/metadata offsets
+
+    Chunk IDs are FAISS positions, so chunk i is found with two offset lookups
+    and nothing is deserialized until it is actually returned by a search.
+    """
+    
+    TEXT_FILE = "chunks.bin"
+    META_FILE = "chunks.meta"
+    INDEX_FILE = "chunks.idx.npy"
+    
+    def __init__(self, path: str):
+        """Open a chunk store written by ChunkStore.write"""
+        self.path = path
+        self._offsets = np.load(os.path.join(path, self.INDEX_FILE), mmap_mode='r')
+        self._text = self._map(os.path.join(path, self.TEXT_FILE))
+        self._meta = self._map(os.path.join(path, self.META_FILE))
+    
+    @staticmethod
+    def _map(file_path: str):
+        with open(file_path, 'rb') as f:
+            # mmap cannot map empty files
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        """Check whether a directory contains a chunk store"""
+        return os.path.exists(os.path.join(path, cls.INDEX_FILE))
+    
+    @classmethod
+    def write(cls, path: str, documents: Iterable[Document]) -> int:
+        """
+        Write documents to a new chunk store, streaming them to disk
+
+        Args:
+            path: Directory to write into
+            documents: Documents in FAISS position order
+
+        Returns:
+            Number of chunks written
+        """
+        offsets = [(0, 0)]
+        text_pos = meta_pos = 0
+        with open(os.path.join(path, cls.TEXT_FILE), 'wb') as text_file, \
+                open(os.path.join(path, cls.META_FILE), 'wb') as meta_file:
+            for doc in documents:
+                text = doc.page_content.encode('utf-8')
+                meta = json.dumps(doc.metadata or {}, ensure_ascii=False, default=str).encode('utf-8')
+                text_file.write(text)
+                meta_file.write(meta)
+                text_pos += len(text)
+                meta_pos += len(meta)
+                offsets.append((text_pos, meta_pos))
+        
+        np.save(os.path.join(path, cls.INDEX_FILE), np.asarray(offsets, dtype=np.uint64))
+        logger.info(f"Wrote {len(offsets) - 1} chunks to {path}")
+        return len(offsets) - 1
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self.get(i)
+    
+    def get(self, i: int) -> Document:
+        """Get the chunk at FAISS position i"""
+        text_start, meta_start = self._offsets[i]
+        text_end, meta_end = self._offsets[i + 1]
+        text = self._text[int(text_start):int(text_end)].decode('utf-8')
+        metadata = json.loads(self._meta[int(meta_start):int(meta_end)].decode('utf-8'))
+        return Document(page_content=text, metadata=metadata)
+    
+    def search(self, search: str) -> Union[str, Document]:
+        """Docstore interface: look up a chunk by its ID"""
+        try:
+            i = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= i < len(self):
+            return f"ID {search} not found."
+        return self.get(i)
+
+class LayeredDocstore(Docstore, AddableMixin):
+    """Writable docstore layering newly added chunks over a read-only ChunkStore
+
+    Lets a writer append to an existing generation without first loading every
+    stored chunk into memory.
+    """
+    
+    def __init__(self, base: ChunkStore = None):
+        self.base = base
+        self._added: Dict[str, Document] = {}
+    
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = set(texts).intersection(self._added)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+    
+    def delete(self, ids) -> None:
+        for _id in ids:
+            self._added.pop(_id, None)
+    
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._added:
+            return self._added[search]
+        if self.base is not None:
+            return self.base.search(search)
+        return f"ID {search} not found."
+
+class PositionalIds(Mapping):
+    """Read-only index_to_docstore_id mapping where chunk i has ID str(i)
+
+    Avoids materializing a dict with one entry per vector in serving processes.
+    """
+    
+    def __init__(self, size: int):
+        self.size = size
+    
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < self.size:
+            raise KeyError(i)
+        return str(i)
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.size))
+    
+    def __len__(self) -> int:
+        return self.size
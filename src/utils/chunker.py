@@ -0,0 +1,213 @@
+import re
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+from langchain.docstore.document import Document
+from .tokens import count_tokens, split_to_tokens
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+NUMBERED_HEADING = re.compile(r'^(\d+(\.\d+)*|[IVX]+\.|[A-Z]\.)\s+[A-Z]')
+NUMBER_TOKEN = re.compile(r'^[\(\-]?[\d,.]+%?\)?$')
+COLUMN_GAP = re.compile(r'\S(\s{2,}|\t)\S')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+PAGE_NUMBER = re.compile(r'^\d{1,4}\b|\b\d{1,4}$')
+
+class StructureAwareChunker:
+    """Split extracted report pages into coherent chunks
+
+    Chunks never cross a page boundary, a heading always starts a new chunk,
+    tables are kept together where they fit, and sizes are measured in tokens.
+    Lines repeated on many pages of a document (running headers and footers)
+    are dropped before chunking. Each chunk carries its source, page, section
+    title and content type as metadata.
+    """
+    
+    def __init__(self, chunk_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None):
+        self.chunk_tokens = chunk_tokens or config.rag.chunk_tokens
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else config.rag.chunk_overlap_tokens
+    
+    def split_documents(self, pages: List[Document], sections: Optional[Dict[str, str]] = None) -> List[Document]:
+        """
+        Split page documents into chunks
+
+        Args:
+            pages: One document per page, in reading order, with 'source' and 'page' metadata
+            sections: Section open per source before these pages; updated in place so
+                consecutive batches of the same document continue the right section
+
+        Returns:
+            Chunk documents with 'source', 'page', 'section' and 'content_type' metadata
+        """
+        boilerplate = self._find_boilerplate(pages)
+        sections = sections if sections is not None else {}
+        chunks = []
+        
+        for page in pages:
+            source = page.metadata.get("source", "")
+            page_chunks, sections[source] = self._split_page(
+                page.page_content, boilerplate.get(source, set()), sections.get(source, "")
+            )
+            for content_type, text, section in page_chunks:
+                metadata = dict(page.metadata)
+                metadata.update({"section": section, "content_type": content_type, "chunk_index": len(chunks)})
+                chunks.append(Document(page_content=text, metadata=metadata))
+        
+        logger.info(f"Split {len(pages)} pages into {len(chunks)} structure-aware chunks")
+        return chunks
+    
+    @staticmethod
+    def _find_boilerplate(pages: List[Document]) -> Dict[str, set]:
+        """Find short lines that repeat on at least 30% of a document's pages, ignoring page numbers"""
+        line_counts = defaultdict(Counter)
+        page_counts = Counter()
+        for page in pages:
+            source = page.metadata.get("source", "")
+            page_counts[source] += 1
+            lines = {
+                PAGE_NUMBER.sub('#', line.strip()) for line in page.page_content.splitlines()
+                if 0 < len(line.strip()) <= 100 and not StructureAwareChunker._is_table_row(line)
+            }
+            line_counts[source].update(lines)
+        
+        boilerplate = {}
+        for source, counts in line_counts.items():
+            if page_counts[source] < 4:
+                continue
+            threshold = max(3, int(page_counts[source] * 0.3))
+            boilerplate[source] = {line for line, count in counts.items() if count >= threshold}
+        return boilerplate
+    
+    def _split_page(self, text: str, boilerplate: set, section: str) -> Tuple[List[Tuple[str, str, str]], str]:
+        """Split one page into (content_type, text, section) chunks, returning the section open at its end"""
+        chunks = []
+        current: List[str] = []
+        current_tokens = 0
+        current_type = "text"
+        
+        def flush():
+            nonlocal current, current_tokens, current_type
+            # A heading with no body yet only lives on as the next chunks' section
+            if current and current != [section]:
+                chunks.append((current_type, "\n".join(current).strip(), section))
+            current, current_tokens, current_type = [], 0, "text"
+        
+        for block_type, block in self._blocks(text, boilerplate):
+            if block_type == "heading":
+                flush()
+                section = block
+                current, current_tokens = [block], count_tokens(block)
+                continue
+            
+            block_tokens = count_tokens(block)
+            if block_tokens > self.chunk_tokens:
+                # Oversized blocks are split on their own, keeping the heading in front
+                heading = current if current_tokens and len(current) == 1 and current[0] == section else []
+                if not heading:
+                    flush()
+                for piece in self._split_oversized(block, block_type):
+                    chunks.append((block_type, "\n".join(heading + [piece]).strip(), section))
+                    heading = []
+                current, current_tokens, current_type = [], 0, "text"
+                continue
+            
+            if current_tokens + block_tokens > self.chunk_tokens:
+                carry = self._overlap(current) if block_type == "text" and current_type == "text" else ""
+                flush()
+                if carry:
+                    current, current_tokens = [carry], count_tokens(carry)
+            current.append(block)
+            current_tokens += block_tokens
+            if block_type == "table":
+                current_type = "table"
+        
+        flush()
+        return [chunk for chunk in chunks if chunk[1]], section
+    
+    def _blocks(self, text: str, boilerplate: set) -> List[Tuple[str, str]]:
+        """Group page lines into heading, table and paragraph blocks"""
+        blocks = []
+        lines: List[str] = []
+        lines_type = None
+        
+        def close():
+            nonlocal lines, lines_type
+            if lines:
+                joiner = "\n" if lines_type == "table" else " "
+                blocks.append((lines_type, joiner.join(lines)))
+            lines, lines_type = [], None
+        
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line:
+                if lines_type == "text":
+                    close()
+                continue
+            if PAGE_NUMBER.sub('#', line) in boilerplate:
+                continue
+            is_table_row = self._is_table_row(raw_line)
+            if not is_table_row and self._is_heading(line):
+                close()
+                blocks.append(("heading", line))
+                continue
+            line_type = "table" if is_table_row else "text"
+            if line_type != lines_type:
+                close()
+                lines_type = line_type
+            lines.append(line)
+        close()
+        return blocks
+    
+    @staticmethod
+    def _is_heading(line: str) -> bool:
+        """Short, unpunctuated lines that are numbered, all caps or title case"""
+        words = line.split()
+        if not words or len(words) > 10 or len(line) > 80 or line[-1] in ".,;:":
+            return False
+        if NUMBERED_HEADING.match(line):
+            return True
+        letters = [c for c in line if c.isalpha()]
+        alpha_words = [w for w in words if w[0].isalpha()]
+        if len(letters) < 4 or len(alpha_words) * 2 < len(words):
+            return False
+        if all(c.isupper() for c in letters):
+            return True
+        capitalized = [w for w in words if w[0].isupper() or not w[0].isalpha()]
+        return 2 <= len(words) <= 8 and len(capitalized) == len(words)
+    
+    @staticmethod
+    def _is_table_row(line: str) -> bool:
+        """Rows that are mostly numeric cells or have column-aligned gaps"""
+        tokens = line.split()
+        numbers = sum(1 for token in tokens if NUMBER_TOKEN.match(token))
+        return (numbers >= 2 and numbers * 5 >= len(tokens) * 2) or len(COLUMN_GAP.findall(line)) >= 2
+    
+    def _split_oversized(self, block: str, block_type: str) -> List[str]:
+        """Split a block larger than one chunk along rows or sentences"""
+        units = block.split("\n") if block_type == "table" else SENTENCE_END.split(block)
+        joiner = "\n" if block_type == "table" else " "
+        pieces, current, current_tokens = [], [], 0
+        for unit in units:
+            unit_tokens = count_tokens(unit)
+            if unit_tokens > self.chunk_tokens:
+                if current:
+                    pieces.append(joiner.join(current))
+                    current, current_tokens = [], 0
+                pieces.extend(split_to_tokens(unit, self.chunk_tokens))
+                continue
+            if current_tokens + unit_tokens > self.chunk_tokens:
+                pieces.append(joiner.join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit_tokens
+        if current:
+            pieces.append(joiner.join(current))
+        return pieces
+    
+    def _overlap(self, lines: List[str]) -> str:
+        """Carry the last sentence of a full chunk into the next one if it is short enough"""
+        if not self.overlap_tokens or not lines:
+            return ""
+        last_sentence = SENTENCE_END.split(lines[-1])[-1]
+        return last_sentence if count_tokens(last_sentence) <= self.overlap_tokens else ""
@@ -0,0 +1,159 @@
+import re
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+from .tokens import count_tokens, truncate_to_tokens
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """Update the running summary of a conversation about sustainability reports.
+Keep the topics asked about, facts and figures given in answers, and any preferences the user stated.
+Write at most {max_words} words. Do not add information.
+
+## CURRENT SUMMARY
+{summary}
+
+## TURNS TO ADD
+{turns}
+"""
+
+REWRITE_PROMPT = """Rewrite the follow-up question as a standalone question that can be understood
+without the conversation, resolving pronouns and references to earlier turns. Reply with the question only.
+
+## CONVERSATION
+{history}
+
+## FOLLOW-UP QUESTION
+{query}
+"""
+
+# Pronouns with nothing to refer to inside the question, explicit references to earlier turns,
+# and elliptical openers such as "and for 2022?". Words like "this", "that" or "more" are left
+# out because standalone questions ("this report", "more than 50%") use them all the time.
+FOLLOW_UP = re.compile(
+    r'\b(it|its|they|them|their|he|she|him|her|the above|previous answer|earlier answer|'
+    r'you (said|mentioned)|as before)\b'
+    r'|^\s*(and|but|what about|how about|what else|why( not)?|same)\b',
+    re.IGNORECASE
+)
+
+class ConversationMemory:
+    """Bounded conversation history for one session
+
+    The most recent turns are kept verbatim. Older turns are folded into a
+    rolling summary that stays under a token budget, so the history sent with
+    each question has a fixed upper size however long the conversation runs.
+    Follow-up questions are rewritten into standalone questions for retrieval.
+    """
+    
+    def __init__(self, generate: Optional[Callable[[str], str]] = None, recent_turns: Optional[int] = None,
+                 summary_tokens: Optional[int] = None, history_tokens: Optional[int] = None):
+        """
+        Args:
+            generate: Sends a prompt to the LLM and returns the response text; without it,
+                older turns are truncated into the summary and questions are not rewritten
+            recent_turns: Turns kept verbatim, defaults to config.rag.memory_recent_turns
+            summary_tokens: Token budget of the rolling summary
+            history_tokens: Token budget of the verbatim turns
+        """
+        self.generate = generate
+        self.recent_turns = recent_turns or config.rag.memory_recent_turns
+        self.summary_tokens = summary_tokens or config.rag.memory_summary_tokens
+        self.history_tokens = history_tokens or config.rag.memory_history_tokens
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []
+        self._lock = threading.Lock()
+        # Serializes summary updates, which call the LLM, without blocking readers of the history
+        self._summary_lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.turns)
+    
+    def add_turn(self, user: str, assistant: str) -> None:
+        """Record a question and its answer, folding older turns into the summary if over budget"""
+        with self._lock:
+            self.turns.append({"user": user, "assistant": assistant})
+            overflow = []
+            while len(self.turns) > 1 and (
+                len(self.turns) > self.recent_turns
+                or count_tokens(self._format_turns(self.turns)) > self.history_tokens
+            ):
+                overflow.append(self.turns.pop(0))
+        if not overflow:
+            return
+        
+        # Until the summary is updated, the history briefly lacks the overflowed turns
+        with self._summary_lock:
+            with self._lock:
+                summary = self.summary
+            summary = self._summarize(summary, overflow)
+            with self._lock:
+                self.summary = summary
+    
+    def _summarize(self, summary: str, turns: List[Dict[str, str]]) -> str:
+        text = self._format_turns(turns)
+        if self.generate:
+            try:
+                return truncate_to_tokens(self.generate(SUMMARY_PROMPT.format(
+                    max_words=int(self.summary_tokens * 0.75),
+                    summary=summary or "(empty)",
+                    turns=text
+                )).strip(), self.summary_tokens)
+            except Exception as e:
+                logger.error(f"Error summarizing conversation, truncating instead: {str(e)}")
+        # Keep the most recent part of the history when no summary can be generated
+        combined = f"{summary}\n{text}".strip()
+        tokens = count_tokens(combined)
+        if tokens <= self.summary_tokens:
+            return combined
+        return combined[-self.summary_tokens * len(combined) // tokens:]
+    
+    @staticmethod
+    def _format_turns(turns: List[Dict[str, str]]) -> str:
+        return "\n".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in turns)
+    
+    def format_history(self) -> str:
+        """History for the prompt: the rolling summary followed by the recent turns"""
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of earlier conversation:\n{self.summary}")
+            if self.turns:
+                parts.append(self._format_turns(self.turns))
+            return "\n\n".join(parts)
+    
+    # Questions this short rarely name what they ask about
+    FOLLOW_UP_MAX_WORDS = 4
+    
+    @classmethod
+    def is_follow_up(cls, query: str) -> bool:
+        """Whether a question probably cannot be understood without earlier turns"""
+        return len(query.split()) <= cls.FOLLOW_UP_MAX_WORDS or bool(FOLLOW_UP.search(query))
+    
+    def rewrite_query(self, query: str) -> str:
+        """
+        Turn a follow-up question into a standalone one for retrieval
+
+        Args:
+            query: Question as asked
+
+        Returns:
+            Standalone question, or the question unchanged if it has no history to depend on
+        """
+        if not self.generate or not (self.turns or self.summary) or not self.is_follow_up(query):
+            return query
+        try:
+            rewritten = self.generate(REWRITE_PROMPT.format(history=self.format_history(), query=query)).strip()
+        except Exception as e:
+            logger.error(f"Error rewriting follow-up question: {str(e)}")
+            return query
+        if not rewritten or count_tokens(rewritten) > 200:
+            return query
+        logger.info(f"Rewrote follow-up question for retrieval: {rewritten}")
+        return rewritten
+    
+    def clear(self) -> None:
+        with self._lock:
+            self.summary = ""
+            self.turns = []
@@ -0,0 +1,169 @@
+import math
+import os
+import logging
+from typing import Any, Dict, List, Optional
+from .document_loader import DocumentLoader
+from .tokens import CHARS_PER_TOKEN, count_tokens
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+# Rough planning figures per model family, matched by substring of the model name:
+# context window in tokens, USD per million input/output tokens (and input tokens
+# served from the provider's prompt cache), and throughput in tokens per second for
+# reading the prompt and writing the answer.
+MODEL_PROFILES = {
+    "gemini-1.5-pro": {"context_window": 2_000_000, "input_price": 1.25, "output_price": 5.00,
+                       "cached_input_price": 0.3125, "prefill_tps": 4000, "decode_tps": 60},
+    "gemini-1.5-flash": {"context_window": 1_000_000, "input_price": 0.075, "output_price": 0.30,
+                         "cached_input_price": 0.01875, "prefill_tps": 10000, "decode_tps": 150},
+    "gemini-2.0-flash": {"context_window": 1_000_000, "input_price": 0.10, "output_price": 0.40,
+                         "cached_input_price": 0.025, "prefill_tps": 10000, "decode_tps": 150},
+    "gpt-4o-mini": {"context_window": 128_000, "input_price": 0.15, "output_price": 0.60,
+                    "cached_input_price": 0.075, "prefill_tps": 8000, "decode_tps": 100},
+    "gpt-4o": {"context_window": 128_000, "input_price": 2.50, "output_price": 10.00,
+               "cached_input_price": 1.25, "prefill_tps": 5000, "decode_tps": 80},
+    "gpt-3.5-turbo": {"context_window": 16_385, "input_price": 0.50, "output_price": 1.50,
+                      "cached_input_price": 0.50, "prefill_tps": 8000, "decode_tps": 100},
+    # Local stand-in used by the benchmark; free
+    "mock": {"context_window": 2_000_000, "input_price": 0.0, "output_price": 0.0,
+             "cached_input_price": 0.0, "prefill_tps": 20000, "decode_tps": 80},
+}
+DEFAULT_PROFILE = {"context_window": 32_000, "input_price": 1.00, "output_price": 3.00,
+                   "cached_input_price": 1.00, "prefill_tps": 4000, "decode_tps": 60}
+
+_UNPRICED_MODELS = set()
+
+# Instructions, metrics reference and question around the document context
+PROMPT_OVERHEAD_TOKENS = 2000
+
+class CostModel:
+    """Choose how to answer over a set of documents from their size and the model
+
+    Documents that fit comfortably in one prompt are sent whole (full_context),
+    which avoids embedding them at all. Larger documents are retrieved from, and
+    questions about a whole document too large for one prompt are answered by
+    map-reduce. Every mode is reported with its estimated prompt size, cost and
+    latency so the decision can be checked.
+    """
+    
+    def __init__(self, model: Optional[str] = None):
+        """
+        Args:
+            model: LLM name, defaults to the preferred provider's model
+        """
+        self.model = model or config.llm.preferred_model
+        self.profile = self.model_profile(self.model)
+    
+    @staticmethod
+    def model_profile(model: str) -> Dict[str, Any]:
+        """Planning figures for a model, falling back to a conservative default"""
+        name = model.split("/")[-1].lower()
+        for family in sorted(MODEL_PROFILES, key=len, reverse=True):
+            if family in name:
+                return MODEL_PROFILES[family]
+        if model not in _UNPRICED_MODELS:
+            # Every call is priced, so warn once per model
+            _UNPRICED_MODELS.add(model)
+            logger.warning(f"No cost profile for model {model}, using defaults")
+        return DEFAULT_PROFILE
+    
+    @staticmethod
+    def call_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        """Estimated price in USD of one LLM call, with cached prompt tokens at the cached input rate"""
+        profile = CostModel.model_profile(model)
+        uncached = max(0, prompt_tokens - cached_tokens)
+        return (uncached * profile["input_price"] + cached_tokens * profile["cached_input_price"]
+                + completion_tokens * profile["output_price"]) / 1_000_000
+    
+    @staticmethod
+    def estimate_tokens(file_paths: List[str]) -> int:
+        """Token count of the extracted text of documents, estimated from size where they cannot be parsed"""
+        total = 0
+        for file_path in file_paths:
+            try:
+                total += sum(count_tokens(page) for page in DocumentLoader.parse_document(file_path).pages)
+            except Exception:
+                if os.path.exists(file_path):
+                    total += os.path.getsize(file_path) // CHARS_PER_TOKEN
+        return total
+    
+    def full_context_budget(self) -> int:
+        """Largest document context sent in one prompt"""
+        window_budget = self.profile["context_window"] // 2 - PROMPT_OVERHEAD_TOKENS - config.rag.expected_answer_tokens
+        return max(0, min(window_budget, config.rag.direct_context_tokens))
+    
+    def _estimate(self, prompt_tokens: int, output_tokens: int, calls: int = 1) -> Dict[str, Any]:
+        """Cost of LLM calls totalling the given tokens, and latency if they ran one after another"""
+        cost = (prompt_tokens * self.profile["input_price"] + output_tokens * self.profile["output_price"]) / 1_000_000
+        latency = prompt_tokens / self.profile["prefill_tps"] + output_tokens / self.profile["decode_tps"]
+        return {
+            "prompt_tokens": prompt_tokens,
+            "llm_calls": calls,
+            "estimated_cost_usd": round(cost, 4),
+            "estimated_latency_s": round(latency, 1),
+        }
+    
+    def estimates(self, document_tokens: int) -> Dict[str, Dict[str, Any]]:
+        """Estimated prompt size, cost and latency of answering one question in each mode"""
+        answer = config.rag.expected_answer_tokens
+        full_context = self._estimate(document_tokens + PROMPT_OVERHEAD_TOKENS, answer)
+        
+        if config.rag.rerank_enabled:
+            retrieved = config.rag.rerank_top_n * config.rag.chunk_tokens
+        else:
+            retrieved = min(document_tokens, self.full_context_budget())
+        retrieval = self._estimate(min(document_tokens, retrieved) + PROMPT_OVERHEAD_TOKENS, answer)
+        
+        sections = max(1, math.ceil(document_tokens / config.rag.map_section_tokens))
+        map_notes = config.rag.expected_answer_tokens // 2
+        map_prompt = document_tokens + sections * PROMPT_OVERHEAD_TOKENS
+        reduce_prompt = min(sections * map_notes, config.rag.reduce_input_tokens) + PROMPT_OVERHEAD_TOKENS
+        map_rounds = math.ceil(sections / config.rag.map_workers)
+        map_reduce = self._estimate(map_prompt + reduce_prompt, sections * map_notes + answer, sections + 1)
+        # Map calls run concurrently, so latency grows with rounds of workers rather than sections
+        map_reduce["estimated_latency_s"] = round(
+            map_rounds * (config.rag.map_section_tokens / self.profile["prefill_tps"]
+                          + map_notes / self.profile["decode_tps"])
+            + reduce_prompt / self.profile["prefill_tps"] + answer / self.profile["decode_tps"],
+            1
+        )
+        return {"full_context": full_context, "retrieval": retrieval, "map_reduce": map_reduce}
+    
+    def plan(self, document_tokens: int, broad_query: bool = False) -> Dict[str, Any]:
+        """
+        Pick the analysis mode for documents of a given size
+
+        Args:
+            document_tokens: Tokens of extracted document text
+            broad_query: Whether the question is about the documents as a whole
+
+        Returns:
+            Dictionary with 'mode' ('full_context', 'retrieval' or 'map_reduce'), 'vectorize',
+            'reason', the token figures it was based on and the estimates of every mode
+        """
+        budget = self.full_context_budget()
+        if document_tokens <= budget:
+            mode = "full_context"
+            reason = f"{document_tokens} tokens fit the {budget} token single-prompt budget"
+        elif broad_query:
+            mode = "map_reduce"
+            reason = f"{document_tokens} tokens exceed the {budget} token budget and the question covers whole documents"
+        else:
+            mode = "retrieval"
+            reason = f"{document_tokens} tokens exceed the {budget} token budget; retrieving relevant chunks"
+        
+        estimates = self.estimates(document_tokens)
+        logger.info(f"Analysis plan: {mode} ({reason})")
+        return {
+            "mode": mode,
+            "vectorize": mode == "retrieval",
+            "reason": reason,
+            "model": self.model,
+            "document_tokens": document_tokens,
+            "context_window": self.profile["context_window"],
+            "full_context_budget": budget,
+            "estimated_cost_usd": estimates[mode]["estimated_cost_usd"],
+            "estimated_latency_s": estimates[mode]["estimated_latency_s"],
+            "estimates": estimates,
+        }
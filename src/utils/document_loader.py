@@ -1,14 +1,69 @@
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+from collections import OrderedDict
 from pathlib import Path
+import os
+import hashlib
 import logging
+import threading
+from pypdf import PdfReader
+from langchain.docstore.document import Document
 from langchain_community.document_loaders import (
     PyPDFLoader,
     TextLoader,
     UnstructuredMarkdownLoader
 )
+from .tokens import count_tokens, truncate_to_tokens
+from .telemetry import telemetry
+from ..config import config
 
 logger = logging.getLogger(__name__)
 
+class ParsedDocument:
+    """Text of one parsed document, indexed by page"""
+    
+    def __init__(self, file_path: str, pages: List[str]):
+        """
+        Args:
+            file_path: Path the document was parsed from
+            pages: Extracted text of each page, in order
+        """
+        self.file_path = file_path
+        self.pages = pages
+    
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+    
+    @property
+    def text(self) -> str:
+        """Full text with pages separated by blank lines"""
+        return "\n\n".join(self.pages)
+    
+    def text_within_tokens(self, max_tokens: int) -> str:
+        """
+        Text of the leading pages, each marked with its page number, within a token budget
+        
+        Args:
+            max_tokens: Maximum tokens of the returned text
+            
+        Returns:
+            Whole pages while they fit, then the start of the first page that does not
+        """
+        parts = []
+        remaining = max_tokens
+        for page_number, page in enumerate(self.pages):
+            part = f"[Page {page_number + 1}]\n{page}"
+            part_tokens = count_tokens(part)
+            if part_tokens > remaining:
+                if remaining > 0:
+                    parts.append(truncate_to_tokens(part, remaining))
+                logger.info(f"Truncated {self.file_path} to {page_number + 1} of {len(self.pages)} pages "
+                            f"for a {max_tokens} token budget")
+                break
+            parts.append(part)
+            remaining -= part_tokens + 1
+        return "\n\n".join(parts)
+
 class DocumentLoader:
     """Document loader supporting multiple file types"""
     
@@ -18,9 +73,77 @@ class DocumentLoader:
         '.md': UnstructuredMarkdownLoader
     }
     
+    # Parsed documents keyed by absolute path, validated against mtime and size
+    _parse_cache: "OrderedDict[str, Tuple[Tuple[int, int], ParsedDocument]]" = OrderedDict()
+    _parse_cache_lock = threading.Lock()
+    # One lock per path being parsed, so concurrent callers wait for a single parse
+    _parse_locks: Dict[str, threading.Lock] = {}
+    
+    @classmethod
+    def cached_document(cls, file_path: str) -> Optional[ParsedDocument]:
+        """Parsed document from the cache if the file has not changed since, else None"""
+        path = os.path.abspath(file_path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        with cls._parse_cache_lock:
+            cached = cls._parse_cache.get(path)
+            if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+                cls._parse_cache.move_to_end(path)
+                return cached[1]
+        return None
+    
+    @classmethod
+    @telemetry.traced("load_document")
+    def parse_document(cls, file_path: str) -> ParsedDocument:
+        """
+        Parse a document once and reuse the result until the file changes
+        
+        Args:
+            file_path: Path to the document
+            
+        Returns:
+            Page-indexed text of the document
+        """
+        path = os.path.abspath(file_path)
+        telemetry.current().set(document=os.path.basename(file_path))
+        with cls._parse_cache_lock:
+            path_lock = cls._parse_locks.setdefault(path, threading.Lock())
+        
+        with path_lock:
+            parsed = cls.cached_document(file_path)
+            if parsed is not None:
+                telemetry.current().set(cache_hit=True, pages=parsed.page_count)
+                return parsed
+            
+            stat = os.stat(path)
+            parsed = ParsedDocument(file_path, [doc.page_content for doc in cls._extract_pages(file_path)])
+            with cls._parse_cache_lock:
+                cls._parse_cache[path] = ((stat.st_mtime_ns, stat.st_size), parsed)
+                cls._parse_cache.move_to_end(path)
+                while len(cls._parse_cache) > config.rag.parse_cache_size:
+                    evicted, _ = cls._parse_cache.popitem(last=False)
+                    cls._parse_locks.pop(evicted, None)
+        telemetry.current().set(cache_hit=False, pages=parsed.page_count)
+        return parsed
+    
     @classmethod
     def load_document(cls, file_path: str) -> List[str]:
         """Load a single document and return its content as text"""
+        return list(cls.parse_document(file_path).pages)
+    
+    @classmethod
+    def load_document_pages(cls, file_path: str) -> List[Document]:
+        """Load a single document as one Document per page with 'source' and 'page' metadata"""
+        return [
+            Document(page_content=text, metadata={"source": file_path, "page": page_number})
+            for page_number, text in enumerate(cls.parse_document(file_path).pages)
+        ]
+    
+    @classmethod
+    def _extract_pages(cls, file_path: str) -> List[Document]:
+        """Extract a document's pages with the loader for its file type"""
         try:
             path = Path(file_path)
             if not path.exists():
@@ -34,16 +157,45 @@ class DocumentLoader:
             loader = loader_class(file_path)
             documents = loader.load()
             
-            # Extract text content from documents
-            texts = [doc.page_content for doc in documents]
-            logger.info(f"Successfully loaded {len(texts)} pages from {file_path}")
+            for page_number, doc in enumerate(documents):
+                doc.metadata["source"] = file_path
+                doc.metadata.setdefault("page", page_number)
+            logger.info(f"Successfully loaded {len(documents)} pages from {file_path}")
             
-            return texts
+            return documents
             
         except Exception as e:
             logger.error(f"Error loading document {file_path}: {str(e)}")
             raise
     
+    @classmethod
+    def iter_document_pages(cls, file_path: str, start_page: int = 0) -> Iterator[Document]:
+        """Yield a document's pages one at a time, starting at start_page
+        
+        PDF pages are extracted lazily, so resuming an ingestion does not re-extract earlier pages.
+        """
+        path = Path(file_path)
+        if path.suffix.lower() != '.pdf' or cls.cached_document(file_path) is not None:
+            # Already parsed (e.g. prefetched after upload), or not worth extracting lazily
+            yield from cls.load_document_pages(file_path)[start_page:]
+            return
+        if not path.exists():
+            raise FileNotFoundError(f"File not found: {file_path}")
+        
+        reader = PdfReader(file_path)
+        for page_number in range(start_page, len(reader.pages)):
+            text = reader.pages[page_number].extract_text() or ""
+            yield Document(page_content=text, metadata={"source": file_path, "page": page_number})
+    
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        """SHA-256 of a file's content, identifying a document independently of its name"""
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+    
     @classmethod
     def load_documents(cls, file_paths: List[str]) -> List[str]:
         """Load multiple documents and return their contents"""
@@ -58,3 +210,17 @@ class DocumentLoader:
         
         logger.info(f"Successfully loaded {len(all_texts)} total pages from {len(file_paths)} documents")
         return all_texts
+    
+    @classmethod
+    def load_documents_pages(cls, file_paths: List[str]) -> List[Document]:
+        """Load multiple documents as page Documents, skipping files that fail to load"""
+        all_pages = []
+        for file_path in file_paths:
+            try:
+                all_pages.extend(cls.load_document_pages(file_path))
+            except Exception as e:
+                logger.error(f"Skipping file {file_path} due to error: {str(e)}")
+                continue
+        
+        logger.info(f"Successfully loaded {len(all_pages)} total pages from {len(file_paths)} documents")
+        return all_pages
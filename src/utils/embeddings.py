@@ -0,0 +1,53 @@
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Loaded models, shared by every store of the process that uses the same model and backend
+_models: Dict[Tuple[str, str], HuggingFaceEmbeddings] = {}
+_models_lock = threading.Lock()
+
+def create_embeddings(model_name: Optional[str] = None, backend: Optional[str] = None) -> HuggingFaceEmbeddings:
+    """
+    Create the embedding model for the configured backend, or return the one already loaded
+
+    Args:
+        model_name: Sentence-transformers model, defaults to config.rag.embedding_model
+        backend: 'torch', 'onnx' or 'onnx-int8', defaults to config.rag.embedding_backend
+
+    Returns:
+        LangChain embeddings object
+    """
+    model_name = model_name or config.rag.embedding_model
+    backend = backend or config.rag.embedding_backend
+    with _models_lock:
+        if (model_name, backend) not in _models:
+            _models[(model_name, backend)] = _load_embeddings(model_name, backend)
+        return _models[(model_name, backend)]
+
+def _load_embeddings(model_name: str, backend: str) -> HuggingFaceEmbeddings:
+    if backend == "torch":
+        model_kwargs = {}
+    elif backend == "onnx":
+        model_kwargs = {"backend": "onnx"}
+    elif backend == "onnx-int8":
+        # Quantized exports shipped in the sentence-transformers hub repos
+        model_kwargs = {"backend": "onnx", "model_kwargs": {"file_name": config.rag.onnx_int8_file}}
+    else:
+        raise ValueError(f"Unsupported embedding backend: {backend}. Expected one of {EMBEDDING_BACKENDS}")
+    
+    logger.info(f"Loading embedding model {model_name} with {backend} backend")
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": config.rag.embedding_batch_size}
+    )
+
+def embedding_signature(model_name: Optional[str] = None, backend: Optional[str] = None) -> str:
+    """Identify the vector space an index was built in; vectors from different signatures must not be mixed"""
+    return f"{model_name or config.rag.embedding_model}|{backend or config.rag.embedding_backend}"
@@ -0,0 +1,127 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from langchain.docstore.document import Document
+from .chunker import StructureAwareChunker
+from .document_loader import DocumentLoader
+from .ingest_checkpoint import IngestionCheckpoint
+from .scoring_criteria import ScoringCriteria
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+class EvidenceIndex:
+    """Top evidence chunks per scoring dimension, precomputed per document
+
+    Each dimension description in the scoring criteria is used as a retrieval
+    query against the chunks of one document. The best chunks are stored under
+    data/evidence/<doc_sha256>/<version>.json, where the version hashes the
+    dimension descriptions, the embedding signature and the evidence size, so
+    scoring prompts can be rebuilt without retrieving again.
+    """
+    
+    def __init__(self, vector_store, root: str = None):
+        """
+        Args:
+            vector_store: VectorStore whose embeddings are used for chunks and queries
+            root: Evidence directory, defaults to config.rag.evidence_path
+        """
+        self.vector_store = vector_store
+        self.root = root or config.rag.evidence_path
+    
+    @staticmethod
+    def dimension_queries(criteria: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+        """(category, dimension, query) for every dimension in the criteria"""
+        queries = []
+        for category in ScoringCriteria.get_categories(criteria):
+            for dimension in ScoringCriteria.get_dimensions_for_category(criteria, category):
+                name = dimension.get("dimension", "")
+                description = ScoringCriteria.clean_description(dimension.get("description", ""))
+                if name:
+                    queries.append((category, name, f"{name}: {description}"))
+        return queries
+    
+    def _version(self, queries: List[Tuple[str, str, str]]) -> str:
+        key = json.dumps([queries, self.vector_store.embedding_signature, config.rag.evidence_k])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]
+    
+    def ensure(self, file_path: str, criteria: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Load the evidence of a document, extracting it first if needed
+
+        Args:
+            file_path: Document to score
+            criteria: Scoring criteria loaded from Report_score.json
+
+        Returns:
+            Dictionary with 'doc_id', 'source', 'version' and 'dimensions', a list of
+            {'category', 'dimension', 'evidence': [{'text', 'page', 'section'}]}
+        """
+        doc_id = DocumentLoader.file_hash(file_path)
+        queries = self.dimension_queries(criteria)
+        version = self._version(queries)
+        path = os.path.join(self.root, doc_id, f"{version}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                evidence = json.load(f)
+            logger.info(f"Loaded scoring evidence for {file_path}")
+            return evidence
+        except FileNotFoundError:
+            pass
+        
+        chunks, vectors = self._document_chunks(doc_id, file_path)
+        evidence = {
+            "doc_id": doc_id,
+            "source": os.path.basename(file_path),
+            "version": version,
+            "dimensions": self._extract(queries, chunks, vectors),
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(evidence, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info(f"Extracted scoring evidence for {len(queries)} dimensions from {file_path}")
+        return evidence
+    
+    def _document_chunks(self, doc_id: str, file_path: str) -> Tuple[List[Document], np.ndarray]:
+        """Chunks and embeddings of a document, from its ingestion checkpoint when it has one"""
+        checkpoint = IngestionCheckpoint(doc_id, file_path, self.vector_store.embedding_signature)
+        if checkpoint.complete:
+            _, chunks, vectors = checkpoint.load()
+            return chunks, vectors
+        
+        chunks = StructureAwareChunker().split_documents(DocumentLoader.load_document_pages(file_path))
+        vectors = np.asarray(
+            self.vector_store.embeddings.embed_documents([chunk.page_content for chunk in chunks]) if chunks else [],
+            dtype=np.float32
+        )
+        return chunks, vectors
+    
+    def _extract(self, queries: List[Tuple[str, str, str]], chunks: List[Document],
+                 vectors: np.ndarray) -> List[Dict[str, Any]]:
+        """Rank the document's chunks against every dimension query in one batch"""
+        dimensions = [{"category": category, "dimension": name, "evidence": []} for category, name, _ in queries]
+        if not chunks or not len(vectors) or not queries:
+            return dimensions
+        
+        query_vectors = self.vector_store.embed_queries([query for _, _, query in queries])
+        # Squared L2 distance, matching the FAISS index metric
+        distances = (
+            (query_vectors ** 2).sum(axis=1)[:, None]
+            - 2 * query_vectors @ vectors.T
+            + (vectors ** 2).sum(axis=1)[None, :]
+        )
+        k = min(config.rag.evidence_k, len(chunks))
+        for dimension, row in zip(dimensions, distances):
+            for i in np.argsort(row)[:k]:
+                chunk = chunks[int(i)]
+                dimension["evidence"].append({
+                    "text": chunk.page_content,
+                    "page": chunk.metadata.get("page"),
+                    "section": chunk.metadata.get("section", ""),
+                })
+        return dimensions
@@ -0,0 +1,142 @@
+import os
+import shutil
+import time
+import uuid
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+class IndexGenerations:
+    """Versioned on-disk layout for the vector index
+
+    Every ingestion writes a complete index into its own generation directory
+    and then atomically repoints the CURRENT file at it. Readers only ever open
+    fully written generations, so a serving process can follow new generations
+    without locks and without seeing a half-written index. A single writer
+    process is assumed.
+    """
+    
+    POINTER_FILE = "CURRENT"
+    GENERATIONS_DIR = "generations"
+    TMP_PREFIX = ".tmp-"
+    
+    def __init__(self, root: str, keep: int = 2):
+        """
+        Args:
+            root: Vector store directory (config.rag.vector_store_path)
+            keep: Number of published generations to keep on disk
+        """
+        self.root = root
+        self.keep = max(1, keep)
+        self.generations_dir = os.path.join(root, self.GENERATIONS_DIR)
+        self.pointer_path = os.path.join(root, self.POINTER_FILE)
+    
+    def current(self) -> Optional[str]:
+        """
+        Get the directory of the currently published generation
+
+        Returns:
+            Path of the current generation, the legacy single-directory store
+            if no generation was ever published, or None if there is no index
+        """
+        try:
+            with open(self.pointer_path, 'r', encoding='utf-8') as f:
+                name = f.read().strip()
+            path = os.path.join(self.generations_dir, name)
+            if name and os.path.isdir(path):
+                return path
+            logger.warning(f"Index pointer references missing generation: {name}")
+        except FileNotFoundError:
+            pass
+        
+        # Stores written before generations were introduced live directly in root
+        if os.path.exists(os.path.join(self.root, "index.faiss")):
+            return self.root
+        return None
+    
+    def pointer_mtime(self) -> Optional[int]:
+        """Get the modification time of the CURRENT pointer, None if it does not exist"""
+        try:
+            return os.stat(self.pointer_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def begin(self) -> str:
+        """
+        Create a scratch directory for a new generation
+
+        Returns:
+            Path to write the new index into; pass it to publish() when complete
+        """
+        name = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(self.generations_dir, self.TMP_PREFIX + name)
+        os.makedirs(path)
+        return path
+    
+    def publish(self, tmp_path: str) -> str:
+        """
+        Make a fully written generation the current one
+
+        Args:
+            tmp_path: Directory returned by begin()
+
+        Returns:
+            Final path of the published generation
+        """
+        name = os.path.basename(tmp_path)[len(self.TMP_PREFIX):]
+        final_path = os.path.join(self.generations_dir, name)
+        os.rename(tmp_path, final_path)
+        
+        # os.replace is atomic, so readers see either the old or the new pointer
+        pointer_tmp = f"{self.pointer_path}.{os.getpid()}.tmp"
+        with open(pointer_tmp, 'w', encoding='utf-8') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, self.pointer_path)
+        logger.info(f"Published index generation {name}")
+        
+        self.prune()
+        return final_path
+    
+    def list_generations(self) -> List[str]:
+        """List published generation names, oldest first"""
+        if not os.path.isdir(self.generations_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.generations_dir)
+            if not name.startswith(self.TMP_PREFIX)
+        )
+    
+    def prune(self) -> None:
+        """Remove generations beyond the retention count and abandoned scratch directories"""
+        current = self.current()
+        current_name = os.path.basename(current) if current else None
+        
+        stale = self.list_generations()[:-self.keep]
+        if os.path.isdir(self.generations_dir):
+            stale += [
+                name for name in os.listdir(self.generations_dir)
+                if name.startswith(self.TMP_PREFIX)
+                and name[len(self.TMP_PREFIX):] != current_name
+                and self._is_abandoned(os.path.join(self.generations_dir, name))
+            ]
+        
+        for name in stale:
+            if name == current_name:
+                continue
+            try:
+                # Readers that still map files from this generation keep them alive until they swap
+                shutil.rmtree(os.path.join(self.generations_dir, name))
+                logger.info(f"Removed old index generation {name}")
+            except OSError as e:
+                logger.warning(f"Could not remove index generation {name}: {str(e)}")
+    
+    @staticmethod
+    def _is_abandoned(path: str, max_age_seconds: int = 3600) -> bool:
+        """Scratch directories older than an hour belong to crashed writers"""
+        try:
+            return time.time() - os.stat(path).st_mtime > max_age_seconds
+        except FileNotFoundError:
+            return False
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import shutil
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from langchain.docstore.document import Document
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+class IngestionCheckpoint:
+    """Persisted ingestion progress for one document
+
+    Pages are ingested in batches. Each committed batch stores its extracted
+    page text, its chunks (with IDs and metadata) and their embeddings, so an
+    interrupted ingestion resumes after the last committed batch instead of
+    re-extracting and re-embedding the whole document. Checkpoints are keyed by
+    the document's SHA-256 and tied to the embedding signature they were built with.
+
+    Complete checkpoints double as a cache of extracted and embedded documents
+    for explore sessions and scoring evidence; gc() bounds how much of it is kept.
+    """
+    
+    MANIFEST_FILE = "manifest.json"
+    
+    def __init__(self, doc_id: str, source: str, signature: str, root: str = None):
+        """
+        Args:
+            doc_id: SHA-256 of the document file
+            source: Path of the document, for logging and metadata
+            signature: Embedding signature the stored vectors were built with
+            root: Checkpoint directory, defaults to config.rag.ingest_checkpoint_path
+        """
+        self.doc_id = doc_id
+        self.source = source
+        self.signature = signature
+        self.path = os.path.join(root or config.rag.ingest_checkpoint_path, doc_id)
+        self.manifest = self._load_manifest()
+    
+    def _load_manifest(self) -> Dict[str, Any]:
+        fresh = {"doc_id": self.doc_id, "embedding": self.signature, "batches": 0,
+                 "pages_done": 0, "section": "", "complete": False}
+        try:
+            with open(os.path.join(self.path, self.MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return fresh
+        
+        if manifest.get("embedding") != self.signature:
+            logger.info(f"Discarding checkpoint for {self.source} built with {manifest.get('embedding')}")
+            shutil.rmtree(self.path, ignore_errors=True)
+            return fresh
+        return manifest
+    
+    @property
+    def pages_done(self) -> int:
+        return self.manifest["pages_done"]
+    
+    @property
+    def section(self) -> str:
+        """Section heading open at the end of the last committed page"""
+        return self.manifest.get("section", "")
+    
+    @property
+    def complete(self) -> bool:
+        return self.manifest["complete"]
+    
+    def _batch_path(self, batch_no: int, suffix: str) -> str:
+        return os.path.join(self.path, f"batch_{batch_no:05d}{suffix}")
+    
+    def load(self) -> Tuple[List[Document], List[Document], np.ndarray]:
+        """
+        Load everything committed so far
+
+        Returns:
+            Pages, chunks and a float32 matrix of chunk embeddings
+        """
+        pages, chunks, vectors = [], [], []
+        for batch_no in range(self.manifest["batches"]):
+            with open(self._batch_path(batch_no, ".json"), 'r', encoding='utf-8') as f:
+                batch = json.load(f)
+            pages.extend(Document(page_content=p["text"], metadata=p["metadata"]) for p in batch["pages"])
+            chunks.extend(Document(page_content=c["text"], metadata=c["metadata"]) for c in batch["chunks"])
+            vectors.append(np.load(self._batch_path(batch_no, ".npy")))
+        
+        if self.manifest["batches"]:
+            logger.info(f"Resuming {self.source} from checkpoint: {len(pages)} pages, {len(chunks)} chunks")
+            self._touch(self.path)
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return pages, chunks, matrix
+    
+    def commit_batch(self, pages: List[Document], chunks: List[Document], vectors: np.ndarray, section: str) -> None:
+        """
+        Persist one batch of pages and make it part of the checkpoint
+
+        Batch files are written first and the manifest is replaced atomically last,
+        so a crash mid-commit leaves the previous checkpoint intact.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        batch_no = self.manifest["batches"]
+        for i, chunk in enumerate(chunks):
+            chunk.metadata["chunk_id"] = f"{self.doc_id}:{batch_no}:{i}"
+        
+        self._write_atomic(self._batch_path(batch_no, ".json"), json.dumps({
+            "pages": [{"text": p.page_content, "metadata": p.metadata} for p in pages],
+            "chunks": [{"text": c.page_content, "metadata": c.metadata} for c in chunks],
+        }, ensure_ascii=False, default=str))
+        vectors_tmp = self._batch_path(batch_no, ".tmp.npy")
+        np.save(vectors_tmp, np.asarray(vectors, dtype=np.float32))
+        os.replace(vectors_tmp, self._batch_path(batch_no, ".npy"))
+        
+        self.manifest.update({
+            "batches": batch_no + 1,
+            "pages_done": self.manifest["pages_done"] + len(pages),
+            "section": section,
+        })
+        self._save_manifest()
+        logger.info(f"Checkpointed {self.source}: {self.manifest['pages_done']} pages in {batch_no + 1} batches")
+    
+    def mark_complete(self) -> None:
+        """Record that the document is fully extracted and embedded"""
+        self.manifest["complete"] = True
+        self._save_manifest()
+    
+    def _save_manifest(self) -> None:
+        self._write_atomic(os.path.join(self.path, self.MANIFEST_FILE), json.dumps(self.manifest))
+    
+    @staticmethod
+    def _touch(path: str) -> None:
+        """Mark a checkpoint as recently used so gc() evicts it last"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    
+    @staticmethod
+    def gc(keep: Set[str], root: Optional[str] = None) -> int:
+        """
+        Remove checkpoints that are no longer needed and cap the space the rest use
+
+        Checkpoints of documents not in keep are removed once they have not been
+        used for config.rag.ingest_checkpoint_ttl_hours; this also clears
+        ingestions that were abandoned part way. If the remaining checkpoints
+        exceed config.rag.ingest_checkpoint_max_mb, the least recently used
+        complete ones are removed; their documents are re-extracted and
+        re-embedded if they are needed again, but are not added to the index twice.
+
+        Args:
+            keep: SHA-256 of documents in the published index
+            root: Checkpoint directory, defaults to config.rag.ingest_checkpoint_path
+
+        Returns:
+            Number of checkpoints removed
+        """
+        root = root or config.rag.ingest_checkpoint_path
+        if not os.path.isdir(root):
+            return 0
+        now = time.time()
+        ttl = config.rag.ingest_checkpoint_ttl_hours * 3600
+        removed = 0
+        complete = []
+        total_size = 0
+        for doc_id in os.listdir(root):
+            path = os.path.join(root, doc_id)
+            if not os.path.isdir(path):
+                continue
+            last_used = os.path.getmtime(path)
+            if doc_id not in keep and now - last_used > ttl:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            total_size += size
+            try:
+                with open(os.path.join(path, IngestionCheckpoint.MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                    if json.load(f).get("complete"):
+                        complete.append((last_used, size, path))
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+        
+        max_size = config.rag.ingest_checkpoint_max_mb * 1024 * 1024
+        for _, size, path in sorted(complete):
+            if total_size <= max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+            removed += 1
+        
+        if removed:
+            logger.info(f"Removed {removed} ingestion checkpoints, {total_size / 1024 / 1024:.0f} MB remain")
+        return removed
+    
+    @staticmethod
+    def _write_atomic(path: str, content: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
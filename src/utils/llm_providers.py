@@ -0,0 +1,474 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Union
+from .prompt_layout import PromptLayout, GeminiContextCache
+from .request_scheduler import RequestScheduler, SchedulerTimeout
+from .tokens import count_tokens
+from .telemetry import telemetry
+from .usage import usage_from_response, usage_tracker
+from ..config import config
+
+# Import Google Gemini API if available
+try:
+    import google.generativeai as genai
+    GEMINI_AVAILABLE = True
+except ImportError:
+    GEMINI_AVAILABLE = False
+
+# Import OpenAI API if available
+try:
+    from openai import OpenAI
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+class LLMProvider:
+    """One LLM API with its own model and timeout"""
+    
+    name = "base"
+    
+    def __init__(self, model: str, timeout: float):
+        """
+        Args:
+            model: Model name at this provider
+            timeout: Seconds to wait for a response before trying another provider
+        """
+        self.model = model
+        self.timeout = timeout
+    
+    @property
+    def available(self) -> bool:
+        """Whether the client library and credentials are present"""
+        return False
+    
+    def generate(self, prompt: Union[str, PromptLayout], system_message: Optional[str] = None,
+                 stats: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Send a prompt and return the response text
+
+        Args:
+            prompt: Prompt text or layout
+            system_message: Instructions for the model's role
+            stats: Receives provider-specific details of the call
+
+        Raises:
+            Exception: If the API fails or returns no text
+        """
+        raise NotImplementedError
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through google.generativeai, serving large prompt prefixes from cached content"""
+    
+    name = "google"
+    
+    def __init__(self, model: str, timeout: float, api_key: Optional[str]):
+        super().__init__(model, timeout)
+        self.api_key = api_key
+        self._models: Dict[Optional[str], Any] = {}
+        self._caches: Dict[Optional[str], GeminiContextCache] = {}
+        self._lock = threading.Lock()
+        if self.available:
+            genai.configure(api_key=api_key)
+            logger.info(f"Configured Google Gemini with model: {model}")
+    
+    @property
+    def available(self) -> bool:
+        return GEMINI_AVAILABLE and bool(self.api_key)
+    
+    def _model(self, system_message: Optional[str]) -> Any:
+        with self._lock:
+            if system_message not in self._models:
+                self._models[system_message] = genai.GenerativeModel(self.model, system_instruction=system_message)
+                self._caches[system_message] = GeminiContextCache(self.model, system_message)
+            return self._models[system_message]
+    
+    def generate(self, prompt: Union[str, PromptLayout], system_message: Optional[str] = None,
+                 stats: Optional[Dict[str, Any]] = None) -> str:
+        model = self._model(system_message)
+        if isinstance(prompt, PromptLayout):
+            cached_response, cache_status = self._caches[system_message].generate(prompt, stats)
+            if stats is not None:
+                stats["cache"] = cache_status
+            if cached_response is not None:
+                return cached_response
+            prompt = prompt.render()
+        
+        response = model.generate_content(prompt, request_options={"timeout": self.timeout})
+        if not response or not getattr(response, 'text', None):
+            raise ValueError("Gemini returned an empty or invalid response")
+        if stats is not None:
+            stats["usage"] = usage_from_response(response)
+        return response.text
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions; repeated prompt prefixes are cached by the API automatically"""
+    
+    name = "openai"
+    
+    def __init__(self, model: str, timeout: float, api_key: Optional[str]):
+        super().__init__(model, timeout)
+        self.api_key = api_key
+        self.client = OpenAI(api_key=api_key, timeout=timeout, max_retries=0) if self.available else None
+    
+    @property
+    def available(self) -> bool:
+        return OPENAI_AVAILABLE and bool(self.api_key)
+    
+    def generate(self, prompt: Union[str, PromptLayout], system_message: Optional[str] = None,
+                 stats: Optional[Dict[str, Any]] = None) -> str:
+        if isinstance(prompt, PromptLayout):
+            prompt = prompt.render()
+        messages = [{"role": "user", "content": prompt}]
+        if system_message:
+            messages.insert(0, {"role": "system", "content": system_message})
+        
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=config.llm.temperature
+        )
+        text = response.choices[0].message.content if response.choices else None
+        if not text:
+            raise ValueError("OpenAI returned an empty response")
+        if stats is not None:
+            stats["usage"] = usage_from_response(response)
+        return text
+
+class MockProvider(LLMProvider):
+    """Local stand-in that answers after a simulated delay, for measuring the system's own overhead
+
+    The delay is a fixed latency plus the time to read the prompt and write
+    the answer at the configured token rates. Responses come from the canned
+    responses file (the first pattern found in the prompt wins) or are filler
+    text of config.llm.mock_response_tokens tokens.
+    """
+    
+    name = "mock"
+    
+    def __init__(self, model: str, timeout: float, api_key: Optional[str] = None):
+        super().__init__(model, timeout)
+        self.responses: Dict[str, str] = {}
+        path = config.llm.mock_responses_path
+        if path:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.responses = json.load(f)
+                logger.info(f"Loaded {len(self.responses)} canned mock responses from {path}")
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Error loading mock responses from {path}: {str(e)}")
+    
+    @property
+    def available(self) -> bool:
+        return True
+    
+    def generate(self, prompt: Union[str, PromptLayout], system_message: Optional[str] = None,
+                 stats: Optional[Dict[str, Any]] = None) -> str:
+        text = prompt.render() if isinstance(prompt, PromptLayout) else prompt
+        lowered = text.lower()
+        response = next(
+            (answer for pattern, answer in self.responses.items() if pattern.lower() in lowered),
+            None
+        )
+        if response is None:
+            response = " ".join(["Mock analysis of the provided context."] * max(1, config.llm.mock_response_tokens // 7))
+        
+        delay = config.llm.mock_latency_s
+        if config.llm.mock_prompt_tokens_per_second > 0:
+            delay += count_tokens(text) / config.llm.mock_prompt_tokens_per_second
+        if config.llm.mock_tokens_per_second > 0:
+            delay += count_tokens(response) / config.llm.mock_tokens_per_second
+        time.sleep(delay)
+        return response
+
+PROVIDER_CLASSES = {
+    GeminiProvider.name: GeminiProvider,
+    OpenAIProvider.name: OpenAIProvider,
+    MockProvider.name: MockProvider,
+}
+
+class ProviderHealth:
+    """Latency history and circuit breaker state of one provider
+
+    The circuit opens after a run of consecutive failures and the provider is
+    skipped until the cooldown has passed. One trial call is then let through
+    (half-open); its success closes the circuit and its failure reopens it.
+    """
+    
+    MIN_SAMPLES = 20
+    
+    def __init__(self, failure_threshold: int, cooldown_s: float, window: int = 200):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at < self.cooldown_s:
+            return "open"
+        return "half_open"
+    
+    def acquire(self) -> bool:
+        """Whether a call may be sent now; in half-open state only one trial is allowed"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+    
+    def record_failure(self) -> bool:
+        """Record a failed or timed out call; returns whether the circuit opened"""
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            opened = self._trial_in_flight or (
+                self.opened_at is None and self.consecutive_failures >= self.failure_threshold
+            )
+            if opened:
+                self.opened_at = time.time()
+            self._trial_in_flight = False
+            return opened
+    
+    def release_trial(self) -> None:
+        """Give back a half-open trial that was never sent, so another call can make it"""
+        with self._lock:
+            self._trial_in_flight = False
+    
+    def p95(self) -> Optional[float]:
+        """95th percentile latency in seconds, None until enough calls have succeeded"""
+        with self._lock:
+            if len(self.latencies) < self.MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "calls": len(self.latencies),
+            "p95_latency_s": round(p95, 3) if p95 is not None else None,
+        }
+
+class ProviderRouter:
+    """Send LLM calls to the healthiest configured provider
+
+    Providers are tried in the configured order, skipping those whose circuit
+    is open. A call that fails or exceeds its provider's timeout moves on to
+    the next provider. With hedging enabled, a call still running after the
+    primary provider's p95 latency is also sent to the next provider and the
+    first response wins, which bounds tail latency when a provider degrades.
+    """
+    
+    _default: Optional["ProviderRouter"] = None
+    _default_lock = threading.Lock()
+    
+    def __init__(self, providers: Optional[List[LLMProvider]] = None):
+        """
+        Args:
+            providers: Providers in order of preference, defaults to those configured
+                in config.llm.provider_order() that have credentials
+        """
+        if providers is None:
+            providers = []
+            for name in config.llm.provider_order():
+                provider_class = PROVIDER_CLASSES.get(name)
+                if provider_class is None:
+                    logger.error(f"Unknown LLM provider: {name}")
+                    continue
+                provider = provider_class(
+                    config.llm.model_for(name), config.llm.timeout_for(name), config.llm.api_key_for(name)
+                )
+                if provider.available:
+                    providers.append(provider)
+                else:
+                    logger.warning(f"LLM provider {name} is not available (missing client library or API key)")
+        self.providers = providers
+        self.health = {
+            provider.name: ProviderHealth(config.llm.circuit_failure_threshold, config.llm.circuit_cooldown_s)
+            for provider in providers
+        }
+        self.scheduler = RequestScheduler()
+        self.executor = ThreadPoolExecutor(max_workers=config.llm.max_concurrent_calls,
+                                           thread_name_prefix="llm")
+    
+    @classmethod
+    def default(cls) -> "ProviderRouter":
+        """Router shared by all agents of the process, so they share provider health"""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+    
+    def _call(self, provider: LLMProvider, prompt: Union[str, PromptLayout], system_message: Optional[str],
+              stats: Dict[str, Any], prompt_tokens: int, priority: int, deadline: float) -> str:
+        try:
+            text = self.scheduler.run(
+                provider.name, prompt_tokens + config.rag.expected_answer_tokens,
+                lambda: self._timed_call(provider, prompt, system_message, stats, prompt_tokens),
+                priority=priority, deadline=deadline
+            )
+        except SchedulerTimeout:
+            # Waiting for quota says nothing about the provider's health, but a trial the
+            # call held must be released or the circuit would stay half-open for good
+            self.health[provider.name].release_trial()
+            raise
+        except Exception:
+            if self.health[provider.name].record_failure():
+                logger.warning(f"Circuit opened for LLM provider {provider.name}")
+            raise
+        return text
+    
+    def _timed_call(self, provider: LLMProvider, prompt: Union[str, PromptLayout],
+                    system_message: Optional[str], stats: Dict[str, Any], prompt_tokens: int) -> str:
+        with telemetry.span("llm_call", provider=provider.name, prompt_tokens=prompt_tokens) as span:
+            started = time.perf_counter()
+            text = provider.generate(prompt, system_message, stats)
+            self.health[provider.name].record_success(time.perf_counter() - started)
+            # Prefer the provider's own counts; tiktoken only approximates other tokenizers
+            reported = stats.get("usage")
+            stats["usage"] = usage_tracker.record_call(
+                provider.name, provider.model,
+                reported["prompt_tokens"] if reported else prompt_tokens,
+                reported["completion_tokens"] if reported else count_tokens(text),
+                reported["cached_tokens"] if reported else 0,
+                estimated=reported is None
+            )
+            span.set(prompt_tokens=stats["usage"]["prompt_tokens"],
+                     completion_tokens=stats["usage"]["completion_tokens"])
+            if stats.get("cache") in ("hit", "created"):
+                span.set(cache_hit=stats["cache"] == "hit")
+        return text
+    
+    def generate(self, prompt: Union[str, PromptLayout], system_message: Optional[str] = None,
+                 stats: Optional[Dict[str, Any]] = None, priority: int = RequestScheduler.INTERACTIVE) -> str:
+        """
+        Send a prompt to the first provider that answers
+
+        Args:
+            prompt: Prompt text or layout
+            system_message: Instructions for the model's role
+            priority: RequestScheduler.INTERACTIVE for calls a user is waiting on,
+                RequestScheduler.BATCH for background work
+            stats: Receives 'provider' (the one that answered), 'hedged', 'attempts',
+                the answering call's 'usage' (tokens and cost) and any provider-specific
+                details such as 'cache'
+
+        Returns:
+            Response text
+
+        Raises:
+            RuntimeError: If every provider failed or timed out
+        """
+        if not self.providers:
+            raise RuntimeError("No LLM provider is configured with an API key")
+        
+        stats = stats if stats is not None else {}
+        stats["hedged"] = False
+        stats["attempts"] = 0
+        pending = {}
+        errors = []
+        remaining = list(self.providers)
+        text = prompt.render() if isinstance(prompt, PromptLayout) else prompt
+        prompt_tokens = count_tokens(text) + count_tokens(system_message or "")
+        
+        def launch_next(force: bool = False) -> bool:
+            """Send the call to the next provider whose circuit lets it through"""
+            while remaining:
+                provider = remaining.pop(0)
+                if not (self.health[provider.name].acquire() or force):
+                    logger.info(f"Skipping LLM provider {provider.name}, circuit is open")
+                    continue
+                call_stats = {}
+                future = self.executor.submit(
+                    telemetry.bind(self._call), provider, prompt, system_message, call_stats,
+                    prompt_tokens, priority, time.monotonic() + provider.timeout
+                )
+                pending[future] = (provider, time.perf_counter() + provider.timeout, call_stats)
+                stats["attempts"] += 1
+                return True
+            return False
+        
+        if not launch_next():
+            # Every circuit is open; trying the preferred provider is better than failing outright
+            remaining = list(self.providers)
+            launch_next(force=True)
+        primary = next(iter(pending.values()))[0]
+        hedge_at = None
+        if config.llm.hedge_enabled and remaining:
+            p95 = self.health[primary.name].p95()
+            if p95 is not None:
+                hedge_at = time.perf_counter() + max(p95, config.llm.hedge_min_delay_s)
+        
+        while pending:
+            now = time.perf_counter()
+            wake_at = min(deadline for _, deadline, _ in pending.values())
+            if hedge_at is not None:
+                wake_at = min(wake_at, hedge_at)
+            done, _ = wait(list(pending), timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                provider, _, call_stats = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    logger.error(f"LLM provider {provider.name} failed: {str(e)}")
+                    errors.append(f"{provider.name}: {str(e)}")
+                    continue
+                stats.update(call_stats)
+                stats["provider"] = provider.name
+                if stats["hedged"]:
+                    logger.info(f"Hedged LLM call answered by {provider.name}")
+                return text
+            
+            now = time.perf_counter()
+            for future, (provider, deadline, _) in list(pending.items()):
+                if now >= deadline:
+                    # The thread cannot be interrupted and its late result is ignored; the client's
+                    # own timeout ends it and _call records the outcome in the provider's health
+                    pending.pop(future)
+                    logger.error(f"LLM provider {provider.name} timed out after {provider.timeout}s")
+                    errors.append(f"{provider.name}: timed out after {provider.timeout}s")
+            
+            if hedge_at is not None and now >= hedge_at and pending:
+                hedge_at = None
+                if launch_next():
+                    logger.info(f"LLM call exceeded {primary.name} p95 latency, hedged to another provider")
+                    stats["hedged"] = True
+            elif not pending:
+                # Fail over to the next provider
+                hedge_at = None
+                launch_next()
+        
+        raise RuntimeError(f"All LLM providers failed: {'; '.join(errors)}")
+    
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Health of each provider"""
+        return {
+            provider.name: dict(model=provider.model, **self.health[provider.name].snapshot())
+            for provider in self.providers
+        }
@@ -0,0 +1,160 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .tokens import count_tokens, split_to_tokens
+from .telemetry import telemetry
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+MAP_PROMPT = """You are reading part {part} of {total} of a sustainability report.
+Extract every fact from this part that helps answer the question below: figures, targets, years,
+frameworks, named initiatives and direct quotes. Keep it concise and do not add information.
+If this part contains nothing relevant, reply with exactly NONE.
+
+## QUESTION
+{query}
+
+## REPORT PART
+{text}
+"""
+
+REDUCE_PROMPT = """Below are notes extracted from consecutive parts of a sustainability report for the question
+below. Merge them into one set of notes: keep every relevant fact, figure and quote, remove repetition,
+and do not add information.
+
+## QUESTION
+{query}
+
+## NOTES
+{text}
+"""
+
+class MapReduceError(RuntimeError):
+    """Too many sections of a document could not be read to answer from the rest"""
+
+class MapReduceAnalyzer:
+    """Answer a question over a whole document in bounded-size LLM calls
+
+    The document is packed into token-budgeted sections, and each section is
+    read by its own map call, run concurrently with bounded parallelism. The
+    partial notes are merged by reduce calls until they fit one prompt, so
+    every page is read while no single call exceeds the section budget.
+    """
+    
+    NO_CONTENT = "NONE"
+    
+    def __init__(self, generate: Callable[[str], str], section_tokens: Optional[int] = None,
+                 workers: Optional[int] = None, reduce_tokens: Optional[int] = None):
+        """
+        Args:
+            generate: Sends a prompt to the LLM and returns the response text
+            section_tokens: Maximum tokens of document text per map call
+            workers: Maximum concurrent LLM calls
+            reduce_tokens: Maximum tokens of notes passed to one reduce call and returned
+        """
+        self.generate = generate
+        self.section_tokens = section_tokens or config.rag.map_section_tokens
+        self.workers = workers or config.rag.map_workers
+        self.reduce_tokens = reduce_tokens or config.rag.reduce_input_tokens
+    
+    def split_sections(self, texts: List[str]) -> List[str]:
+        """Pack consecutive texts (usually pages) into sections of at most section_tokens"""
+        sections, current, current_tokens = [], [], 0
+        for text in texts:
+            for piece in self._pieces(text):
+                piece_tokens = count_tokens(piece)
+                if current and current_tokens + piece_tokens > self.section_tokens:
+                    sections.append("\n---\n".join(current))
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += piece_tokens
+        if current:
+            sections.append("\n---\n".join(current))
+        return sections
+    
+    def _pieces(self, text: str) -> List[str]:
+        text = text.strip()
+        if not text:
+            return []
+        if count_tokens(text) <= self.section_tokens:
+            return [text]
+        return split_to_tokens(text, self.section_tokens)
+    
+    def map(self, query: str, sections: List[str]) -> Tuple[List[str], List[int]]:
+        """
+        Run the map prompt over every section concurrently
+
+        Returns:
+            Notes of the sections with relevant content, and the part numbers
+            (from 1) of sections whose map call failed
+        """
+        def read(indexed):
+            i, section = indexed
+            try:
+                return self.generate(MAP_PROMPT.format(part=i + 1, total=len(sections), query=query, text=section))
+            except Exception as e:
+                logger.error(f"Map call failed for part {i + 1} of {len(sections)}: {str(e)}")
+                return None
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            partials = list(executor.map(telemetry.bind(read), enumerate(sections)))
+        # A failed call is not the same as a section with nothing relevant
+        failed = [i + 1 for i, p in enumerate(partials) if p is None]
+        notes = [p.strip() for p in partials if p and p.strip() and p.strip().upper() != self.NO_CONTENT]
+        return notes, failed
+    
+    def reduce(self, query: str, partials: List[str]) -> str:
+        """Merge partial notes in groups until they fit within reduce_tokens"""
+        while partials and count_tokens("\n\n".join(partials)) > self.reduce_tokens:
+            groups = self._group(partials)
+            if len(groups) == len(partials):
+                # Every note is too large to pair with another; merging cannot shrink the input further
+                partials = [split_to_tokens(p, self.reduce_tokens // len(partials))[0] for p in partials]
+                break
+            logger.info(f"Reducing {len(partials)} partial notes in {len(groups)} calls")
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                partials = list(executor.map(
+                    telemetry.bind(lambda group: self.generate(REDUCE_PROMPT.format(query=query, text="\n\n".join(group)))),
+                    groups
+                ))
+        return "\n\n".join(partials)
+    
+    def _group(self, partials: List[str]) -> List[List[str]]:
+        groups, current, current_tokens = [], [], 0
+        for partial in partials:
+            partial_tokens = count_tokens(partial)
+            if current and current_tokens + partial_tokens > self.reduce_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(partial)
+            current_tokens += partial_tokens
+        if current:
+            groups.append(current)
+        return groups
+    
+    def run(self, query: str, texts: List[str], stats: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Read every text for the query and return notes small enough for one final prompt
+
+        Args:
+            query: User query
+            texts: Document texts in reading order, usually one per page
+            stats: Receives 'sections' and 'failed_sections', the part numbers that could not be read
+
+        Returns:
+            Merged notes from all sections, empty if no section had relevant content
+
+        Raises:
+            MapReduceError: If more than config.rag.map_max_failed_fraction of the sections failed
+        """
+        sections = self.split_sections(texts)
+        logger.info(f"Map-reduce over {len(sections)} sections with {self.workers} workers")
+        partials, failed = self.map(query, sections)
+        logger.info(f"{len(partials)} of {len(sections)} sections had relevant content, {len(failed)} failed")
+        if stats is not None:
+            stats.update(sections=len(sections), failed_sections=failed)
+        telemetry.current().set(map_sections=len(sections), map_failed=len(failed))
+        if sections and len(failed) > len(sections) * config.rag.map_max_failed_fraction:
+            raise MapReduceError(f"{len(failed)} of {len(sections)} sections of the documents could not be read")
+        return self.reduce(query, partials)
@@ -0,0 +1,185 @@
+import io
+import os
+import re
+import json
+import time
+import shutil
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+from typing import Any, Dict, Optional
+from .telemetry import telemetry
+from ..config import config
+
+# Import the sampling profiler if available
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:
+    PYINSTRUMENT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+def requested_profile_mode(value: Optional[str], trusted: bool = False) -> Optional[str]:
+    """
+    Profiling mode asked for by a header, query parameter or command-line value
+
+    Args:
+        value: '1', 'true', 'yes' or 'cprofile' for cProfile, 'sampling' for the
+            sampling profiler; anything else (or None) disables profiling
+        trusted: The value comes from whoever runs the process (a command-line flag)
+            rather than a client, so it applies even if config.telemetry.profiling_enabled is off
+
+    Returns:
+        'cprofile', 'sampling' or None
+    """
+    value = (value or "").strip().lower()
+    if not value or not (trusted or config.telemetry.profiling_enabled):
+        return None
+    if value in ("1", "true", "yes", "on"):
+        return config.telemetry.profile_mode
+    return value if value in PROFILE_MODES else None
+
+class RequestProfiler:
+    """Profile one request or command and store the result under the profiles directory
+
+    Each run writes a directory data/profiles/<time>-<label>-<trace id>/ with
+    summary.txt (the hottest functions by cumulative time), profile.prof (pstats
+    data for snakeviz or pstats) or profile.html (pyinstrument), and
+    memory.json (tracemalloc peak and the largest allocation sites).
+
+    CPU profiles cover the thread that runs the request; work handed to thread
+    pools (LLM calls, map-reduce) shows up as time spent waiting on it. The
+    tracemalloc peak is process-wide, so concurrent requests inflate it. Only
+    the newest config.telemetry.profile_max_count profiles are kept.
+    """
+    
+    # tracemalloc is process-wide; only the first of overlapping profiles starts and stops it
+    _tracing_lock = threading.Lock()
+    _tracing_users = 0
+    _owns_tracing = False
+    
+    def __init__(self, label: str, mode: Optional[str] = None, root: Optional[str] = None):
+        """
+        Args:
+            label: Name of what is profiled, e.g. the endpoint
+            mode: 'cprofile' or 'sampling', defaults to config.telemetry.profile_mode
+            root: Profiles directory, defaults to config.telemetry.profile_path
+        """
+        self.label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label)
+        self.mode = mode or config.telemetry.profile_mode
+        if self.mode == "sampling" and not PYINSTRUMENT_AVAILABLE:
+            logger.warning("pyinstrument is not installed, profiling with cProfile instead")
+            self.mode = "cprofile"
+        self.root = root or config.telemetry.profile_path
+        self.path: Optional[str] = None
+        self.result: Dict[str, Any] = {}
+        self._profiler = None
+        self._started = 0.0
+    
+    def __enter__(self) -> "RequestProfiler":
+        # Started first: it raises if another profiler is already active, and must
+        # do so before tracing is counted, or tracing would never be stopped
+        if self.mode == "sampling":
+            self._profiler = SamplingProfiler()
+            self._profiler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        
+        with self._tracing_lock:
+            if RequestProfiler._tracing_users == 0:
+                # Leave tracing started elsewhere (e.g. python -X tracemalloc) running afterwards
+                RequestProfiler._owns_tracing = not tracemalloc.is_tracing()
+                if RequestProfiler._owns_tracing:
+                    tracemalloc.start(config.telemetry.profile_traceback_frames)
+            tracemalloc.reset_peak()
+            RequestProfiler._tracing_users += 1
+        self._memory_start = tracemalloc.get_traced_memory()[0]
+        self._started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration = time.perf_counter() - self._started
+        if self.mode == "sampling":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        with self._tracing_lock:
+            RequestProfiler._tracing_users -= 1
+            if RequestProfiler._tracing_users == 0 and RequestProfiler._owns_tracing:
+                tracemalloc.stop()
+        
+        try:
+            self._write(duration, current, peak, snapshot)
+        except Exception as e:
+            logger.error(f"Error writing profile of {self.label}: {str(e)}")
+        return False
+    
+    def _write(self, duration: float, current: int, peak: int, snapshot: tracemalloc.Snapshot) -> None:
+        trace_id = telemetry.current_trace_id() or "notrace"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.label}-{trace_id[:16]}"
+        self.path = os.path.join(self.root, name)
+        os.makedirs(self.path, exist_ok=True)
+        
+        if self.mode == "sampling":
+            with open(os.path.join(self.path, "profile.html"), 'w', encoding='utf-8') as f:
+                f.write(self._profiler.output_html())
+            summary = self._profiler.output_text(unicode=True, color=False)
+        else:
+            self._profiler.dump_stats(os.path.join(self.path, "profile.prof"))
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(config.telemetry.profile_top_n)
+            summary = stream.getvalue()
+        with open(os.path.join(self.path, "summary.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"{self.label}: {duration:.3f}s, tracemalloc peak {peak / 1024 / 1024:.1f} MB\n\n")
+            f.write(summary)
+        
+        top_allocations = [
+            {"location": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:config.telemetry.profile_top_n]
+        ]
+        self.result = {
+            "label": self.label,
+            "mode": self.mode,
+            "trace_id": trace_id,
+            "duration_s": round(duration, 3),
+            "memory_peak_mb": round(peak / 1024 / 1024, 2),
+            "memory_retained_mb": round((current - self._memory_start) / 1024 / 1024, 2),
+            "path": self.path,
+        }
+        with open(os.path.join(self.path, "memory.json"), 'w', encoding='utf-8') as f:
+            json.dump(dict(self.result, top_allocations=top_allocations), f, indent=2)
+        logger.info(f"Profile of {self.label} ({duration:.2f}s, peak {self.result['memory_peak_mb']} MB) "
+                    f"written to {self.path}")
+        self.prune(self.root)
+    
+    @staticmethod
+    def prune(root: Optional[str] = None, keep: Optional[int] = None) -> int:
+        """
+        Remove the oldest profiles beyond the retention limit
+
+        Args:
+            root: Profiles directory, defaults to config.telemetry.profile_path
+            keep: Profiles to keep, defaults to config.telemetry.profile_max_count
+
+        Returns:
+            Number of profiles removed
+        """
+        root = root or config.telemetry.profile_path
+        keep = config.telemetry.profile_max_count if keep is None else keep
+        try:
+            profiles = [entry for entry in os.scandir(root) if entry.is_dir()]
+        except FileNotFoundError:
+            return 0
+        profiles.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in profiles[keep:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+        return max(0, len(profiles) - keep)
@@ -0,0 +1,146 @@
+import time
+import hashlib
+import datetime
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from .tokens import count_tokens
+from .usage import usage_from_response
+from ..config import config
+
+# Import Gemini context caching if available
+try:
+    import google.generativeai as genai
+    from google.generativeai import caching
+    GEMINI_CACHING_AVAILABLE = True
+except ImportError:
+    GEMINI_CACHING_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+class PromptLayout:
+    """Prompt assembled from named blocks, stable blocks first
+
+    Blocks that are identical across queries (role, reference metrics, criteria,
+    instructions, and documents sent whole) form the prefix; blocks that change
+    per query (retrieved context, history, the question) follow it. Providers
+    that cache prompt prefixes, explicitly or automatically, can then reuse the
+    prefix between queries.
+    """
+    
+    def __init__(self):
+        self.blocks: List[Tuple[str, str, bool]] = []
+    
+    def add_static(self, name: str, text: str) -> "PromptLayout":
+        """Add a block that is the same for every query"""
+        if text:
+            self.blocks.append((name, text, True))
+        return self
+    
+    def add_variable(self, name: str, text: str) -> "PromptLayout":
+        """Add a block that changes between queries"""
+        if text:
+            self.blocks.append((name, text, False))
+        return self
+    
+    def prefix(self) -> str:
+        return "\n\n".join(text for _, text, static in self.blocks if static)
+    
+    def suffix(self) -> str:
+        return "\n\n".join(text for _, text, static in self.blocks if not static)
+    
+    def render(self) -> str:
+        """Full prompt, static blocks first"""
+        return "\n\n".join(part for part in (self.prefix(), self.suffix()) if part)
+    
+    def prefix_key(self) -> str:
+        return hashlib.sha256(self.prefix().encode('utf-8')).hexdigest()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Token counts of the cacheable prefix and the per-query suffix"""
+        prefix_tokens = count_tokens(self.prefix())
+        suffix_tokens = count_tokens(self.suffix())
+        total = prefix_tokens + suffix_tokens
+        return {
+            "prefix_tokens": prefix_tokens,
+            "suffix_tokens": suffix_tokens,
+            "total_tokens": total,
+            "cacheable_ratio": round(prefix_tokens / total, 3) if total else 0.0,
+        }
+
+class GeminiContextCache:
+    """Serve prompts whose prefix is large through Gemini cached content
+
+    The prefix is uploaded once as CachedContent and later prompts with the same
+    prefix only send their suffix, which Gemini bills at the cached-token rate.
+    Prefixes below the provider's minimum cacheable size, or that fail to cache,
+    are sent normally.
+    """
+    
+    def __init__(self, model_name: Optional[str] = None, system_message: Optional[str] = None):
+        """
+        Args:
+            model_name: Gemini model, defaults to the configured Gemini model
+            system_message: System instruction stored with the cached content
+        """
+        self.model_name = model_name or config.llm.model_for("google")
+        self.system_message = system_message
+        self._entries: Dict[str, Tuple[Any, float]] = {}
+        self._failed = set()
+        self._lock = threading.Lock()
+    
+    def _model_for(self, layout: PromptLayout) -> Tuple[Optional[Any], str]:
+        """Model bound to the cached prefix, and whether the cache was hit or created"""
+        key = layout.prefix_key()
+        now = time.time()
+        with self._lock:
+            if key in self._failed:
+                return None, "unavailable"
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                return entry[0], "hit"
+            
+            ttl_minutes = config.llm.prompt_cache_ttl_minutes
+            try:
+                cached = caching.CachedContent.create(
+                    model=self.model_name,
+                    display_name=f"prompt-prefix-{key[:12]}",
+                    system_instruction=self.system_message,
+                    contents=[layout.prefix()],
+                    ttl=datetime.timedelta(minutes=ttl_minutes),
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+            except Exception as e:
+                logger.warning(f"Gemini context caching unavailable for this prefix: {str(e)}")
+                self._failed.add(key)
+                return None, "unavailable"
+            # Renew a little before the provider expires the content
+            self._entries[key] = (model, now + ttl_minutes * 60 * 0.9)
+            return model, "created"
+    
+    def generate(self, layout: PromptLayout, stats: Optional[Dict[str, Any]] = None) -> Tuple[Optional[str], str]:
+        """
+        Generate a response using the cached prefix
+
+        Args:
+            layout: Prompt to send
+            stats: Receives the 'usage' Gemini reports for the call
+
+        Returns:
+            Response text (None if the prefix was not cached) and the cache status:
+            'hit', 'created', 'too_small', 'disabled' or 'unavailable'
+        """
+        if not GEMINI_CACHING_AVAILABLE or not config.llm.prompt_cache_enabled:
+            return None, "disabled"
+        if count_tokens(layout.prefix()) < config.llm.prompt_cache_min_tokens:
+            return None, "too_small"
+        
+        model, status = self._model_for(layout)
+        if model is None:
+            return None, status
+        response = model.generate_content(layout.suffix())
+        if not response or not hasattr(response, 'text'):
+            return None, "unavailable"
+        if stats is not None:
+            stats["usage"] = usage_from_response(response)
+        return response.text, status
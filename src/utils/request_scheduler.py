@@ -0,0 +1,194 @@
+import time
+import heapq
+import random
+import itertools
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+class SchedulerTimeout(TimeoutError):
+    """A call could not be sent before its deadline because the provider's budget was used up"""
+
+class TokenBucket:
+    """Budget that refills continuously up to a per-minute limit"""
+    
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """Seconds until the amount is available, 0 if it is available now"""
+        self._refill()
+        # A single call larger than the whole budget waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+    
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+def rate_limit_delay(error: Exception) -> Optional[float]:
+    """
+    Delay a rate-limit error asks for
+
+    Args:
+        error: Exception raised by an LLM client
+
+    Returns:
+        Seconds from the Retry-After header, 0.0 for a rate-limit error without one,
+        or None if the error is not a rate limit
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    try:
+        limited = int(status) == 429
+    except (TypeError, ValueError):
+        limited = False
+    limited = limited or type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+    if not limited:
+        return None
+    
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return 0.0
+
+class RequestScheduler:
+    """Throttle LLM calls to each provider's request and token quotas
+
+    Every provider has a requests-per-minute and a tokens-per-minute bucket.
+    Calls wait in a priority queue per provider, interactive ones ahead of
+    batch work, and are sent once both buckets can cover them. A rate-limit
+    response pauses the provider for its Retry-After time, or an exponential
+    backoff with full jitter, and the call is retried.
+    """
+    
+    INTERACTIVE = 0
+    BATCH = 1
+    
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        """
+        Args:
+            limits: Requests and tokens per minute by provider name, defaults to
+                config.llm.rate_limits_for
+        """
+        self.limits = limits or {}
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._waiting: Dict[str, list] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+    
+    def _buckets_for(self, provider: str) -> Tuple[TokenBucket, TokenBucket]:
+        if provider not in self._buckets:
+            rpm, tpm = self.limits.get(provider) or config.llm.rate_limits_for(provider)
+            self._buckets[provider] = (TokenBucket(rpm), TokenBucket(tpm))
+        return self._buckets[provider]
+    
+    def acquire(self, provider: str, tokens: int, priority: int = BATCH,
+                deadline: Optional[float] = None) -> None:
+        """
+        Wait until a call may be sent to a provider and charge it to the budgets
+
+        Args:
+            provider: Provider name
+            tokens: Estimated prompt and completion tokens of the call
+            priority: INTERACTIVE or BATCH; lower values are served first
+            deadline: time.monotonic() by which the call must be sent
+
+        Raises:
+            SchedulerTimeout: If the deadline passes first
+        """
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            requests, token_budget = self._buckets_for(provider)
+            queue = self._waiting.setdefault(provider, [])
+            heapq.heappush(queue, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._paused_until.get(provider, 0.0) - now
+                    if wait <= 0 and queue[0] == ticket:
+                        wait = max(requests.wait_time(1), token_budget.wait_time(tokens))
+                        if wait <= 0:
+                            requests.take(1)
+                            token_budget.take(tokens)
+                            return
+                    if deadline is not None and now >= deadline:
+                        raise SchedulerTimeout(f"No {provider} capacity before the call's deadline")
+                    # Calls behind the head of the queue sleep until it is served
+                    timeout = wait if wait > 0 else None
+                    if deadline is not None:
+                        timeout = min(timeout, deadline - now) if timeout is not None else deadline - now
+                    self._condition.wait(timeout)
+            finally:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                self._condition.notify_all()
+    
+    def pause(self, provider: str, seconds: float) -> None:
+        """Hold every call to a provider for the given time"""
+        with self._condition:
+            until = time.monotonic() + seconds
+            if until > self._paused_until.get(provider, 0.0):
+                self._paused_until[provider] = until
+            self._condition.notify_all()
+    
+    def run(self, provider: str, tokens: int, call: Callable[[], Any], priority: int = BATCH,
+            deadline: Optional[float] = None) -> Any:
+        """
+        Send a call within the provider's budgets, retrying rate-limit errors
+
+        Args:
+            provider: Provider name
+            tokens: Estimated prompt and completion tokens of the call
+            call: Sends the request
+            priority: INTERACTIVE or BATCH
+            deadline: time.monotonic() after which no attempt is started
+
+        Returns:
+            Result of the call
+
+        Raises:
+            SchedulerTimeout: If the deadline passes while waiting for capacity
+            Exception: The call's error if it is not a rate limit or retries are exhausted
+        """
+        max_retries = config.llm.rate_limit_max_retries
+        for attempt in range(max_retries + 1):
+            self.acquire(provider, tokens, priority, deadline)
+            try:
+                return call()
+            except Exception as e:
+                retry_after = rate_limit_delay(e)
+                if retry_after is None or attempt == max_retries:
+                    raise
+                backoff = min(config.llm.rate_limit_max_backoff_s, config.llm.rate_limit_backoff_s * 2 ** attempt)
+                # Honour Retry-After; jitter spreads the retries of calls limited at the same moment
+                delay = retry_after + random.uniform(0, 1) if retry_after else random.uniform(0, backoff)
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise
+                logger.warning(f"Rate limited by {provider}, retrying in {delay:.1f}s "
+                               f"(attempt {attempt + 1} of {max_retries})")
+                self.pause(provider, delay)
@@ -0,0 +1,59 @@
+import time
+import logging
+from typing import List, Optional
+from langchain.docstore.document import Document
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+class Reranker:
+    """Re-score retrieval candidates with a local CPU cross-encoder"""
+    
+    def __init__(self, model_name: Optional[str] = None):
+        """Load the cross-encoder model"""
+        from sentence_transformers import CrossEncoder
+        
+        self.model_name = model_name or config.rag.rerank_model
+        self.model = CrossEncoder(self.model_name, device="cpu")
+        logger.info(f"Loaded re-ranking model {self.model_name}")
+    
+    def rerank(self, query: str, documents: List[Document], top_n: Optional[int] = None,
+               budget_ms: Optional[int] = None) -> List[Document]:
+        """
+        Re-rank candidates and keep the best ones
+
+        Candidates are scored in batches in retrieval order. Once the latency budget
+        is spent, the remaining candidates are not scored and rank below the scored ones
+        in their original retrieval order.
+
+        Args:
+            query: User query
+            documents: Retrieval candidates, best first
+            top_n: Number of documents to keep, defaults to config.rag.rerank_top_n
+            budget_ms: Latency budget for scoring, defaults to config.rag.rerank_budget_ms
+
+        Returns:
+            The top_n documents, best first
+        """
+        top_n = top_n or config.rag.rerank_top_n
+        budget_ms = budget_ms if budget_ms is not None else config.rag.rerank_budget_ms
+        batch_size = config.rag.rerank_batch_size
+        
+        start = time.perf_counter()
+        scored = []
+        for batch_start in range(0, len(documents), batch_size):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if scored and elapsed_ms > budget_ms:
+                logger.warning(f"Re-ranking budget of {budget_ms}ms spent after {len(scored)} of "
+                               f"{len(documents)} candidates")
+                break
+            batch = documents[batch_start:batch_start + batch_size]
+            scores = self.model.predict([(query, doc.page_content) for doc in batch], batch_size=batch_size)
+            scored.extend(zip(scores, range(batch_start, batch_start + len(batch))))
+        
+        ranked = [i for _, i in sorted(scored, key=lambda item: item[0], reverse=True)]
+        ranked += list(range(len(scored), len(documents)))
+        
+        logger.info(f"Re-ranked {len(scored)} candidates in {(time.perf_counter() - start) * 1000:.0f}ms, "
+                    f"keeping {min(top_n, len(documents))}")
+        return [documents[i] for i in ranked[:top_n]]
@@ -66,6 +66,26 @@ class ScoringCriteria:
         
         return criteria_data.get(category, {}).get("dimensions", [])
     
+    @staticmethod
+    def clean_description(description: str) -> str:
+        """
+        Remove content references from a dimension description
+        
+        Args:
+            description: Dimension description as stored in the criteria file
+            
+        Returns:
+            Description without ':contentReference[...]' markers
+        """
+        while ":contentReference[" in description:
+            start_idx = description.find(":contentReference[")
+            end_idx = description.find("]", start_idx)
+            if end_idx > start_idx:
+                description = description[:start_idx] + description[end_idx+1:]
+            else:
+                break
+        return description
+    
     @staticmethod
     def format_criteria_for_prompt(criteria_data: Dict[str, Any]) -> str:
         """
@@ -91,14 +111,7 @@ class ScoringCriteria:
                 
                 if dim_name and dim_desc:
                     # Remove content references from descriptions
-                    desc_cleaned = dim_desc
-                    while ":contentReference[" in desc_cleaned:
-                        start_idx = desc_cleaned.find(":contentReference[")
-                        end_idx = desc_cleaned.find("]", start_idx)
-                        if end_idx > start_idx:
-                            desc_cleaned = desc_cleaned[:start_idx] + desc_cleaned[end_idx+1:]
-                        else:
-                            break
+                    desc_cleaned = ScoringCriteria.clean_description(dim_desc)
                     
                     formatted_output.append(f"### {dim_name}")
                     formatted_output.append(f"{desc_cleaned}\n")
@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import uuid
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from .embeddings import embedding_signature
+from .telemetry import telemetry
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+class ScoringJobManager:
+    """Run document scoring in a worker pool and keep results on disk
+
+    Results are stored under data/scoring/<doc_sha256>/<criteria_version>.json, so
+    a document already scored against the same criteria is answered from disk
+    without queueing anything. Jobs for the same document and criteria version
+    that are still running are shared rather than started twice.
+
+    Job records are written to data/scoring/jobs/<job_id>.json on every state
+    change, so any worker process sharing the directory can report a job's
+    status. Deduplication of running jobs is per process.
+    """
+    
+    MAX_FINISHED_JOBS = 256
+    
+    def __init__(self, score: Callable[[str], Dict[str, Any]], root: Optional[str] = None,
+                 workers: Optional[int] = None):
+        """
+        Args:
+            score: Scores a document file and returns the result dictionary
+            root: Result directory, defaults to config.web.scoring_path
+            workers: Number of concurrent scoring jobs, defaults to config.web.scoring_workers
+        """
+        self.score = score
+        self.root = root or config.web.scoring_path
+        self.executor = ThreadPoolExecutor(max_workers=workers or config.web.scoring_workers,
+                                           thread_name_prefix="scoring")
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._active: Dict[str, str] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def criteria_version(criteria: Dict[str, Any]) -> str:
+        """Version of the scoring criteria, model and evidence retrieval, so changing any re-scores documents"""
+        key = json.dumps([criteria, config.llm.preferred_model, embedding_signature(), config.rag.evidence_k],
+                         sort_keys=True)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]
+    
+    def _result_path(self, doc_id: str, version: str) -> str:
+        return os.path.join(self.root, doc_id, f"{version}.json")
+    
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.root, "jobs", f"{job_id}.json")
+    
+    def load_result(self, doc_id: str, version: str) -> Optional[Dict[str, Any]]:
+        """Stored result for a document and criteria version, if it has been scored"""
+        try:
+            with open(self._result_path(doc_id, version), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    
+    def submit(self, file_path: str, doc_id: str, version: str) -> Dict[str, Any]:
+        """
+        Return the stored result of a document or queue a scoring job for it
+
+        Args:
+            file_path: Document to score
+            doc_id: SHA-256 of the document
+            version: Criteria version from criteria_version()
+
+        Returns:
+            Job dictionary with 'job_id' and 'status' ('done', 'queued', 'running' or 'failed'),
+            and 'result' when done
+        """
+        result = self.load_result(doc_id, version)
+        if result is not None:
+            logger.info(f"Serving stored scoring result for {os.path.basename(file_path)}")
+            return {"job_id": None, "status": "done", "result": result}
+        
+        key = f"{doc_id}:{version}"
+        with self._lock:
+            job_id = self._active.get(key)
+            if job_id:
+                return dict(self.jobs[job_id])
+            job_id = uuid.uuid4().hex
+            job = {"job_id": job_id, "status": "queued", "file_name": os.path.basename(file_path),
+                   "submitted_at": time.time()}
+            self.jobs[job_id] = job
+            self._active[key] = job_id
+            self._save_job(job)
+            self._prune()
+        # The job's spans belong to the trace of the request that submitted it
+        self.executor.submit(telemetry.bind(self._run), job_id, key, file_path, doc_id, version)
+        logger.info(f"Queued scoring job {job_id} for {job['file_name']}")
+        return dict(job)
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of a job, read from disk if another process runs it, None if unknown"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return dict(job)
+        # Job IDs are hex UUIDs; anything else cannot name a record
+        if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            return None
+        try:
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    
+    def _run(self, job_id: str, key: str, file_path: str, doc_id: str, version: str) -> None:
+        self._update(job_id, status="running", started_at=time.time())
+        try:
+            result = self.score(file_path)
+            if "error" in result:
+                self._update(job_id, status="failed", error=result["error"])
+                return
+            result.update({"doc_id": doc_id, "criteria_version": version})
+            self._save_result(doc_id, version, result)
+            self._update(job_id, status="done", result=result)
+            logger.info(f"Scoring job {job_id} finished")
+        except Exception as e:
+            logger.error(f"Scoring job {job_id} failed: {str(e)}")
+            self._update(job_id, status="failed", error=str(e))
+        finally:
+            with self._lock:
+                self._active.pop(key, None)
+            self._update(job_id, finished_at=time.time())
+    
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self.jobs[job_id].update(fields)
+            self._save_job(self.jobs[job_id])
+    
+    def _save_job(self, job: Dict[str, Any]) -> None:
+        try:
+            self._write_json(self._job_path(job["job_id"]), job)
+        except OSError as e:
+            logger.warning(f"Could not save scoring job {job['job_id']}: {str(e)}")
+    
+    def _save_result(self, doc_id: str, version: str, result: Dict[str, Any]) -> None:
+        self._write_json(self._result_path(doc_id, version), result)
+    
+    @staticmethod
+    def _write_json(path: str, content: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(content, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+    
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs; their results stay on disk"""
+        finished = [job_id for job_id, job in self.jobs.items() if "finished_at" in job]
+        for job_id in finished[:max(0, len(finished) - self.MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+            try:
+                os.remove(self._job_path(job_id))
+            except OSError:
+                pass
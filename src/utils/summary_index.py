@@ -0,0 +1,195 @@
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from langchain.docstore.document import Document
+from .tokens import count_tokens, truncate_to_tokens
+from .telemetry import telemetry
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+SECTION_PROMPT = """Summarize the following section of a sustainability report in at most 200 words.
+Keep concrete facts: figures, targets, years, frameworks and named initiatives. Do not add information.
+
+Section: {title}
+
+{text}
+"""
+
+DOCUMENT_PROMPT = """Below are summaries of the sections of one sustainability report, in order.
+Write an overall summary of the report in at most 400 words covering its scope, frameworks,
+key performance figures, targets and notable gaps. Do not add information.
+
+{text}
+"""
+
+class SummaryIndex:
+    """Hierarchical summary index: section summaries under one summary per document
+
+    Summaries are generated once per document and stored under
+    data/summaries/<doc_id>/<version>.json, where the version hashes the prompts and
+    the LLM model. Changing either rebuilds the summaries instead of serving stale ones.
+    Section summaries are embedded so broad questions can be answered from the few
+    most relevant sections without touching individual chunks.
+    """
+    
+    def __init__(self, generate: Callable[[str], str], embed: Callable[[List[str]], List[List[float]]],
+                 root: Optional[str] = None):
+        """
+        Args:
+            generate: Sends a prompt to the LLM and returns the response text
+            embed: Embeds a list of texts
+            root: Summary directory, defaults to config.rag.summary_path
+        """
+        self.generate = generate
+        self.embed = embed
+        self.root = root or config.rag.summary_path
+        self.version = hashlib.sha256(
+            (SECTION_PROMPT + DOCUMENT_PROMPT + config.llm.preferred_model).encode('utf-8')
+        ).hexdigest()[:12]
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self._section_vectors: Dict[str, np.ndarray] = {}
+        # Path each loaded document was loaded from
+        self._sources: Dict[str, str] = {}
+    
+    def _path(self, doc_id: str, suffix: str) -> str:
+        return os.path.join(self.root, doc_id, f"{self.version}{suffix}")
+    
+    def ensure(self, doc_id: str, source: str, chunks: List[Document]) -> None:
+        """Load the summaries of a document, building them first if needed"""
+        try:
+            with open(self._path(doc_id, ".json"), 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+            vectors = np.load(self._path(doc_id, ".npy"))
+            logger.info(f"Loaded summaries for {source}")
+        except FileNotFoundError:
+            summary, vectors = self._build(doc_id, source, chunks)
+        self.documents[doc_id] = summary
+        self._section_vectors[doc_id] = vectors
+        self._sources[doc_id] = source
+    
+    def retain(self, sources: List[str]) -> None:
+        """Unload the summaries of documents that are not among the given paths"""
+        keep = set(sources)
+        for doc_id in [doc_id for doc_id, source in self._sources.items() if source not in keep]:
+            logger.info(f"Unloading summaries for {self._sources[doc_id]}")
+            self.documents.pop(doc_id, None)
+            self._section_vectors.pop(doc_id, None)
+            del self._sources[doc_id]
+    
+    def _build(self, doc_id: str, source: str, chunks: List[Document]):
+        """Summarize each section, then the document from its section summaries"""
+        sections = self._group_sections(chunks)
+        logger.info(f"Building summaries for {source}: {len(sections)} sections")
+        
+        def summarize(section):
+            text = truncate_to_tokens(section["text"], config.rag.summary_section_tokens)
+            return self.generate(SECTION_PROMPT.format(title=section["title"] or "Untitled", text=text))
+        
+        with ThreadPoolExecutor(max_workers=config.rag.summary_workers) as executor:
+            section_summaries = list(executor.map(telemetry.bind(summarize), sections))
+        
+        combined = "\n\n".join(
+            f"## {section['title'] or 'Untitled'}\n{text}" for section, text in zip(sections, section_summaries)
+        )
+        document_summary = self.generate(DOCUMENT_PROMPT.format(
+            text=truncate_to_tokens(combined, config.rag.summary_section_tokens * 4)
+        ))
+        
+        summary = {
+            "doc_id": doc_id,
+            "source": os.path.basename(source),
+            "version": self.version,
+            "document_summary": document_summary,
+            "sections": [
+                {"title": section["title"], "titles": section["titles"], "pages": section["pages"], "summary": text}
+                for section, text in zip(sections, section_summaries)
+            ],
+        }
+        vectors = np.asarray(self.embed(section_summaries) if section_summaries else [], dtype=np.float32)
+        
+        os.makedirs(os.path.dirname(self._path(doc_id, ".json")), exist_ok=True)
+        np.save(self._path(doc_id, ".npy"), vectors)
+        # Write the JSON last: its presence marks the summaries as complete
+        tmp_path = self._path(doc_id, ".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(doc_id, ".json"))
+        return summary, vectors
+    
+    @staticmethod
+    def _group_sections(chunks: List[Document]) -> List[Dict[str, Any]]:
+        """Group chunks by section in reading order, merging sections too small to summarize alone"""
+        sections = []
+        for chunk in chunks:
+            title = chunk.metadata.get("section", "")
+            page = chunk.metadata.get("page")
+            if not sections or sections[-1]["title"] != title:
+                sections.append({"title": title, "titles": [title], "pages": [], "text": ""})
+            section = sections[-1]
+            section["text"] += chunk.page_content + "\n"
+            if page is not None and page not in section["pages"]:
+                section["pages"].append(page)
+        
+        merged = []
+        for section in sections:
+            if merged and count_tokens(merged[-1]["text"]) < config.rag.summary_min_section_tokens:
+                previous = merged[-1]
+                previous["title"] = " / ".join(t for t in (previous["title"], section["title"]) if t)
+                previous["titles"] += section["titles"]
+                previous["text"] += section["text"]
+                previous["pages"] += [p for p in section["pages"] if p not in previous["pages"]]
+            else:
+                merged.append(section)
+        return merged
+    
+    def get_context(self, query_vector: np.ndarray, top_sections: Optional[int] = None) -> str:
+        """
+        Build context from document summaries and the sections closest to the query
+
+        Args:
+            query_vector: Embedded query
+            top_sections: Number of section summaries to include
+
+        Returns:
+            Context string, empty if no summaries are loaded
+        """
+        if not self.documents:
+            return ""
+        best = self._rank_sections(query_vector, top_sections)
+        
+        parts = ["=== DOCUMENT SUMMARIES ==="]
+        for summary in self.documents.values():
+            parts.append(f"[{summary['source']}]\n{summary['document_summary']}")
+        if best:
+            parts.append("=== MOST RELEVANT SECTION SUMMARIES ===")
+            for doc_id, i in best:
+                summary = self.documents[doc_id]
+                section = summary["sections"][i]
+                pages = ", ".join(str(p + 1) for p in section["pages"][:5])
+                parts.append(f"[{summary['source']} - {section['title'] or 'Untitled'} (pages {pages})]\n{section['summary']}")
+        return "\n\n".join(parts)
+    
+    def section_titles(self, query_vector: np.ndarray, top_sections: Optional[int] = None) -> List[str]:
+        """Chunk-level section titles of the sections closest to the query, used to drill down"""
+        return [
+            title
+            for doc_id, i in self._rank_sections(query_vector, top_sections)
+            for title in self.documents[doc_id]["sections"][i].get("titles", [])
+        ]
+    
+    def _rank_sections(self, query_vector: np.ndarray, top_sections: Optional[int] = None):
+        """(doc_id, section index) pairs of the sections closest to the query"""
+        top_sections = top_sections or config.rag.summary_top_sections
+        candidates = []
+        for doc_id in self.documents:
+            vectors = self._section_vectors.get(doc_id)
+            if vectors is None or not len(vectors):
+                continue
+            distances = np.linalg.norm(vectors - query_vector, axis=1)
+            candidates.extend((float(distance), doc_id, i) for i, distance in enumerate(distances))
+        return [(doc_id, i) for _, doc_id, i in sorted(candidates)[:top_sections]]
@@ -0,0 +1,383 @@
+import os
+import re
+import json
+import time
+import queue
+import secrets
+import logging
+import threading
+import functools
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+# Upper bounds of the stage duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text exposition format"""
+    
+    def __init__(self, prefix: str = "rag"):
+        self.prefix = prefix
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(labels: Dict[str, Any]) -> LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+    
+    def inc(self, name: str, value: float = 1.0, help_text: str = "", **labels) -> None:
+        """Add to a counter"""
+        metric = f"{self.prefix}_{name}"
+        with self._lock:
+            self._help.setdefault(metric, help_text)
+            series = self._counters.setdefault(metric, {})
+            key = self._key(labels)
+            series[key] = series.get(key, 0.0) + value
+    
+    def observe(self, name: str, value: float, help_text: str = "", **labels) -> None:
+        """Record a value in a histogram with DURATION_BUCKETS"""
+        metric = f"{self.prefix}_{name}"
+        with self._lock:
+            self._help.setdefault(metric, help_text)
+            series = self._histograms.setdefault(metric, {})
+            key = self._key(labels)
+            # Bucket counts, then +Inf count and sum
+            counts = series.setdefault(key, [0.0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+    
+    @staticmethod
+    def _labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(key) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = [(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs]
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+    
+    def render(self) -> str:
+        """All metrics in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            for metric, series in sorted(self._counters.items()):
+                if self._help.get(metric):
+                    lines.append(f"# HELP {metric} {self._help[metric]}")
+                lines.append(f"# TYPE {metric} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{metric}{self._labels(key)} {value:g}")
+            for metric, series in sorted(self._histograms.items()):
+                if self._help.get(metric):
+                    lines.append(f"# HELP {metric} {self._help[metric]}")
+                lines.append(f"# TYPE {metric} histogram")
+                for key, counts in sorted(series.items()):
+                    for bound, count in zip(DURATION_BUCKETS, counts):
+                        lines.append(f"{metric}_bucket{self._labels(key, ('le', f'{bound:g}'))} {count:g}")
+                    lines.append(f"{metric}_bucket{self._labels(key, ('le', '+Inf'))} {counts[-2]:g}")
+                    lines.append(f"{metric}_count{self._labels(key)} {counts[-2]:g}")
+                    lines.append(f"{metric}_sum{self._labels(key)} {counts[-1]:.6f}")
+        return "\n".join(lines) + "\n"
+
+class Span:
+    """Timed stage of a request with attributes describing its size and outcome"""
+    
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None,
+                 trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+        self.name = name
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration = 0.0
+        self.error: Optional[str] = None
+    
+    def set(self, **attributes) -> "Span":
+        """Add attributes such as pages, chunks, prompt_tokens or cache_hit"""
+        self.attributes.update(attributes)
+        return self
+    
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._started
+
+class _NoSpan(Span):
+    """Stand-in returned by Telemetry.current() outside any span; attributes are discarded"""
+    
+    def set(self, **attributes) -> "Span":
+        return self
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+# Trace of the current request and the remote parent span it continues, if any
+_current_trace: ContextVar[Optional[Tuple[str, Optional[str]]]] = ContextVar("current_trace", default=None)
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Trace and parent span id of a W3C traceparent header, None if it is missing or malformed"""
+    match = TRACEPARENT.match((header or "").strip().lower())
+    if not match or set(match.group(1)) == {"0"}:
+        return None
+    return match.group(1), match.group(2)
+
+def format_traceparent(trace_id: str, span_id: str) -> str:
+    return f"00-{trace_id}-{span_id}-01"
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def otlp_payload(spans: List[Span]) -> Dict[str, Any]:
+    """Spans as an OTLP/JSON ExportTraceServiceRequest"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": config.telemetry.service_name}}
+        ]},
+        "scopeSpans": [{
+            "scope": {"name": __name__},
+            "spans": [{
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(int(span.start_time * 1e9)),
+                "endTimeUnixNano": str(int((span.start_time + span.duration) * 1e9)),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 0},
+            } for span in spans]
+        }]
+    }]}
+
+class FileSpanExporter:
+    """Append each finished span to a JSON-lines file as an OTLP/JSON request"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+    
+    def __call__(self, span: Span) -> None:
+        line = json.dumps(otlp_payload([span]))
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+class OTLPHttpSpanExporter:
+    """Send spans to an OpenTelemetry collector over OTLP/HTTP JSON in background batches"""
+    
+    def __init__(self, endpoint: str, batch_size: int = 200, interval: float = 2.0):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        threading.Thread(target=self._run, name="otlp-export", daemon=True).start()
+    
+    def __call__(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass
+    
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + self.interval
+            while len(batch) < self.batch_size and time.time() < deadline:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            request = urllib.request.Request(
+                self.endpoint, data=json.dumps(otlp_payload(batch)).encode('utf-8'),
+                headers={"Content-Type": "application/json"}, method="POST"
+            )
+            try:
+                urllib.request.urlopen(request, timeout=10).close()
+            except Exception as e:
+                logger.warning(f"Could not export {len(batch)} spans to {self.endpoint}: {str(e)}")
+
+class Telemetry:
+    """Spans around pipeline stages, aggregated into metrics
+
+    Each span adds its duration to rag_stage_duration_seconds{stage}. Numeric
+    attributes (pages, chunks, prompt_tokens, completion_tokens, ...) are
+    summed into rag_stage_<attribute>_total{stage}, and a boolean cache_hit
+    attribute counts into rag_stage_cache_total{stage,result}. Exporters
+    registered with add_exporter receive every finished span.
+
+    Spans opened while another is active become its children, and spans
+    opened inside start_trace() join that trace, so every stage of a request
+    carries the request's trace id. Log records carry it as %(trace_id)s.
+    """
+    
+    # Attributes that identify a stage rather than measure it
+    LABEL_ATTRIBUTES = ("provider", "endpoint")
+    
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self._exporters: List[Callable[[Span], None]] = []
+    
+    def add_exporter(self, exporter: Callable[[Span], None]) -> None:
+        self._exporters.append(exporter)
+    
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """
+        Time a block of code as a pipeline stage
+
+        Args:
+            name: Stage name, e.g. 'load_document' or 'llm_call'
+            **attributes: Initial attributes; more can be added with Span.set
+
+        Yields:
+            The span, to attach sizes and cache outcomes to
+        """
+        parent = _current_span.get()
+        if parent is not None:
+            span = Span(name, attributes, parent.trace_id, parent.span_id)
+        else:
+            trace = _current_trace.get()
+            span = Span(name, attributes, *(trace or (None, None)))
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            self._record(span)
+    
+    def traced(self, name: str) -> Callable:
+        """Decorator running a function inside a span; the function can add attributes via current()"""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+    
+    @staticmethod
+    def start_trace(trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+        """
+        Start the trace of a request; spans opened in this context join it
+
+        Args:
+            trace_id: 32 hex digit trace id to continue, a new one by default
+            parent_id: Span id of the caller's span, from its traceparent header
+
+        Returns:
+            Token for end_trace
+        """
+        return _current_trace.set((trace_id or secrets.token_hex(16), parent_id))
+    
+    @staticmethod
+    def end_trace(token) -> None:
+        _current_trace.reset(token)
+    
+    @contextmanager
+    def trace(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+              **attributes) -> Iterator[Span]:
+        """Root span of a new or continued trace"""
+        token = self.start_trace(trace_id, parent_id)
+        try:
+            with self.span(name, **attributes) as span:
+                yield span
+        finally:
+            self.end_trace(token)
+    
+    @staticmethod
+    def current_trace_id() -> Optional[str]:
+        span = _current_span.get()
+        if span is not None:
+            return span.trace_id
+        trace = _current_trace.get()
+        return trace[0] if trace else None
+    
+    @staticmethod
+    def bind(func: Callable) -> Callable:
+        """
+        Make a function run in the caller's trace when called from a worker thread
+
+        Thread pools do not inherit context variables, so work submitted to them
+        would otherwise start unrelated traces. Each call runs in its own copy of
+        the context captured here, so the result can be called concurrently.
+        """
+        context = copy_context()
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return context.copy().run(func, *args, **kwargs)
+        return wrapper
+    
+    def configure_export(self) -> None:
+        """Add the span exporter selected by config.telemetry.trace_export"""
+        export = config.telemetry.trace_export
+        if export == "file":
+            self.add_exporter(FileSpanExporter(config.telemetry.trace_file_path))
+            logger.info(f"Exporting spans to {config.telemetry.trace_file_path}")
+        elif export == "otlp":
+            self.add_exporter(OTLPHttpSpanExporter(config.telemetry.otlp_endpoint))
+            logger.info(f"Exporting spans to {config.telemetry.otlp_endpoint}")
+        elif export != "none":
+            logger.warning(f"Unknown trace export {export}, spans are not exported")
+    
+    @staticmethod
+    def current() -> Span:
+        """Innermost active span of this thread or task"""
+        return _current_span.get() or _NoSpan("none")
+    
+    def _record(self, span: Span) -> None:
+        labels = {"stage": span.name}
+        labels.update({name: span.attributes[name] for name in self.LABEL_ATTRIBUTES if name in span.attributes})
+        self.registry.observe("stage_duration_seconds", span.duration,
+                              "Duration of pipeline stages", **labels)
+        if span.error:
+            self.registry.inc("stage_errors_total", 1, "Pipeline stages that raised", error=span.error, **labels)
+        for name, value in span.attributes.items():
+            if name == "cache_hit":
+                self.registry.inc("stage_cache_total", 1, "Cache lookups of pipeline stages",
+                                  result="hit" if value else "miss", **labels)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.registry.inc(f"stage_{name}_total", value, f"Sum of {name} over pipeline stages", **labels)
+        for exporter in self._exporters:
+            try:
+                exporter(span)
+            except Exception as e:
+                logger.error(f"Error exporting span {span.name}: {str(e)}")
+
+def _install_log_record_factory() -> None:
+    """Give every log record the trace_id and span_id it was logged in, '-' outside a trace"""
+    base_factory = logging.getLogRecordFactory()
+    if getattr(base_factory, "adds_trace_context", False):
+        return
+    def factory(*args, **kwargs):
+        record = base_factory(*args, **kwargs)
+        span = _current_span.get()
+        record.trace_id = Telemetry.current_trace_id() or "-"
+        record.span_id = span.span_id if span is not None else "-"
+        return record
+    factory.adds_trace_context = True
+    logging.setLogRecordFactory(factory)
+
+_install_log_record_factory()
+
+# Shared by every module of the process
+telemetry = Telemetry()
@@ -0,0 +1,55 @@
+import logging
+from typing import List
+
+# Import tiktoken if available
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Average characters per token for English prose, used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+
+def _get_encoding():
+    """Load the tokenizer once; the BPE file may need downloading on first use"""
+    global _encoding, TIKTOKEN_AVAILABLE
+    if _encoding is None and TIKTOKEN_AVAILABLE:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken encoding unavailable, estimating token counts: {str(e)}")
+            TIKTOKEN_AVAILABLE = False
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text, estimating from its length if tiktoken is unavailable"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+def split_to_tokens(text: str, max_tokens: int) -> List[str]:
+    """Split text into consecutive pieces of at most max_tokens tokens"""
+    encoding = _get_encoding()
+    if encoding is None:
+        size = max_tokens * CHARS_PER_TOKEN
+        return [text[i:i + size] for i in range(0, len(text), size)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
@@ -0,0 +1,87 @@
+import os
+import uuid
+import hashlib
+import logging
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+class HashingUploadFile:
+    """Upload target that writes to disk and hashes as the form parser streams data in
+
+    Werkzeug normally spools each uploaded file to memory or a temporary file
+    and the content is then read again to save and hash it. This file is
+    written once, in the blob store's temporary directory so it can be moved
+    into place without copying, and refuses to grow past the per-file limit.
+    """
+    
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Args:
+            directory: Directory for the temporary file, on the same filesystem as the blob store
+            max_bytes: Size at which the upload is rejected
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"upload-{uuid.uuid4().hex}")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._file = open(self.path, 'w+b')
+    
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.discard()
+            raise RequestEntityTooLarge(
+                f"File exceeds the {self.max_bytes // (1024 * 1024)} MB per-file upload limit"
+            )
+        self._sha256.update(data)
+        return self._file.write(data)
+    
+    @property
+    def sha(self) -> str:
+        """SHA-256 of everything written so far"""
+        return self._sha256.hexdigest()
+    
+    def finish(self) -> None:
+        """Flush and close the file so it can be moved"""
+        if not self._file.closed:
+            self._file.close()
+    
+    def discard(self) -> None:
+        """Close and delete the file"""
+        self.finish()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+    
+    def __getattr__(self, name):
+        # read, seek, tell and friends go to the underlying file
+        return getattr(self._file, name)
+    
+    def __iter__(self):
+        return iter(self._file)
+
+class StreamingUploadRequest(Request):
+    """Flask request whose uploaded files are streamed to disk while being hashed"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Kept here too, since request.files is never set if parsing fails part way
+        self._upload_files = []
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        upload = HashingUploadFile(
+            os.path.join(config.web.blob_path, ".tmp"),
+            config.web.max_file_mb * 1024 * 1024
+        )
+        self._upload_files.append(upload)
+        return upload
+    
+    def discard_uploads(self) -> None:
+        """Delete the temporary files of uploads that were not moved into the blob store"""
+        for upload in self._upload_files:
+            upload.discard()
@@ -0,0 +1,238 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from .cost_model import CostModel
+from .telemetry import telemetry
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+def usage_from_response(response: Any) -> Optional[Dict[str, int]]:
+    """
+    Token counts reported by a provider with its response
+
+    Args:
+        response: OpenAI chat completion (usage) or Gemini response (usage_metadata)
+
+    Returns:
+        prompt_tokens, completion_tokens and cached_tokens, or None if the
+        response carries no usage
+    """
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        }
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is not None and getattr(metadata, "prompt_token_count", None) is not None:
+        # Gemini counts cached content as part of the prompt
+        return {
+            "prompt_tokens": metadata.prompt_token_count,
+            "completion_tokens": getattr(metadata, "candidates_token_count", 0) or 0,
+            "cached_tokens": getattr(metadata, "cached_content_token_count", 0) or 0,
+        }
+    return None
+
+class Usage:
+    """Tokens and cost of a set of LLM calls"""
+    
+    def __init__(self):
+        self.prompt_tokens = 0.0
+        self.completion_tokens = 0.0
+        self.cached_tokens = 0.0
+        self.cost_usd = 0.0
+        self.calls = 0.0
+        # Calls whose tokens were counted locally because the provider reported none
+        self.estimated_calls = 0.0
+        self._lock = threading.Lock()
+    
+    @property
+    def total_tokens(self) -> float:
+        return self.prompt_tokens + self.completion_tokens
+    
+    def add(self, call: Dict[str, Any], share: float = 1.0) -> None:
+        """Add a call recorded by UsageTracker.record_call, or a share of it"""
+        with self._lock:
+            self.prompt_tokens += call["prompt_tokens"] * share
+            self.completion_tokens += call["completion_tokens"] * share
+            self.cached_tokens += call["cached_tokens"] * share
+            self.cost_usd += call["cost_usd"] * share
+            self.calls += share
+            if call["estimated"]:
+                self.estimated_calls += share
+    
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompt_tokens": round(self.prompt_tokens),
+                "completion_tokens": round(self.completion_tokens),
+                "cached_tokens": round(self.cached_tokens),
+                "total_tokens": round(self.total_tokens),
+                "cost_usd": round(self.cost_usd, 6),
+                "llm_calls": round(self.calls, 2),
+                "estimated_calls": round(self.estimated_calls, 2),
+            }
+
+class _Scope:
+    """Usage of one tracked block and what its calls are charged to"""
+    
+    def __init__(self, session_id: Optional[str], documents: List[str], parent: Optional["_Scope"]):
+        self.usage = Usage()
+        self.session_id = session_id
+        self.documents = documents
+        self.parent = parent
+
+_current_scope: ContextVar[Optional[_Scope]] = ContextVar("usage_scope", default=None)
+
+class UsageTracker:
+    """Token and cost accounting per request, session and document, with per-session budgets
+
+    Requests are tracked with track(); every LLM call made inside it (including
+    calls in worker threads started through telemetry.bind) is added to the
+    request's usage and charged to its session and documents as it completes.
+    A call over several documents is split evenly between them. Token counts
+    come from the provider's usage fields when it returns them and from
+    tiktoken otherwise; cost uses the CostModel price table.
+    """
+    
+    def __init__(self):
+        self.total = Usage()
+        self.sessions: "OrderedDict[str, Usage]" = OrderedDict()
+        self.documents: Dict[str, Usage] = {}
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def track(self, session_id: Optional[str] = None, documents: Optional[List[str]] = None) -> Iterator[Usage]:
+        """
+        Collect the usage of the LLM calls made in a block
+
+        Args:
+            session_id: Session the calls are charged to, defaults to the enclosing block's
+            documents: Paths of the documents the calls are about, defaults to the
+                enclosing block's
+
+        Yields:
+            Usage of the block; enclosing blocks include it in theirs
+        """
+        parent = _current_scope.get()
+        if session_id is None and parent is not None:
+            session_id = parent.session_id
+        if documents:
+            # Keyed by path: uploads are stored per content, so two files sharing a
+            # name are still charged separately
+            documents = [os.path.abspath(document) for document in documents]
+        elif parent is not None:
+            documents = parent.documents
+        scope = _Scope(session_id, documents or [], parent)
+        token = _current_scope.set(scope)
+        try:
+            yield scope.usage
+        finally:
+            _current_scope.reset(token)
+    
+    def record_call(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int,
+                    cached_tokens: int = 0, estimated: bool = False) -> Dict[str, Any]:
+        """
+        Charge one LLM call to the current request, session and documents
+
+        Args:
+            provider: Provider that answered
+            model: Model at the provider, used to price the call
+            prompt_tokens: Prompt tokens, including cached ones
+            completion_tokens: Response tokens
+            cached_tokens: Prompt tokens served from the provider's prompt cache
+            estimated: Whether the counts come from tiktoken rather than the provider
+
+        Returns:
+            The call's tokens and cost
+        """
+        call = {
+            "provider": provider,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "cost_usd": CostModel.call_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+            "estimated": estimated,
+        }
+        self.total.add(call)
+        scope = _current_scope.get()
+        if scope is not None:
+            parent = scope
+            while parent is not None:
+                parent.usage.add(call)
+                parent = parent.parent
+            if scope.session_id:
+                self._session(scope.session_id).add(call)
+            for document in scope.documents:
+                self._document(document).add(call, 1.0 / len(scope.documents))
+        
+        telemetry.registry.inc("llm_tokens_total", prompt_tokens, "LLM tokens", provider=provider, kind="prompt")
+        telemetry.registry.inc("llm_tokens_total", completion_tokens, "LLM tokens", provider=provider, kind="completion")
+        telemetry.registry.inc("llm_cost_usd_total", call["cost_usd"], "Estimated LLM cost in USD", provider=provider)
+        return call
+    
+    def _session(self, session_id: str) -> Usage:
+        with self._lock:
+            if session_id not in self.sessions:
+                self.sessions[session_id] = Usage()
+                # Forget the least recently active sessions, and with them their spending
+                while len(self.sessions) > config.llm.usage_max_sessions:
+                    self.sessions.popitem(last=False)
+            self.sessions.move_to_end(session_id)
+            return self.sessions[session_id]
+    
+    def _document(self, document: str) -> Usage:
+        with self._lock:
+            return self.documents.setdefault(document, Usage())
+    
+    def session_usage(self, session_id: Optional[str]) -> Dict[str, Any]:
+        """Usage of a session so far"""
+        with self._lock:
+            usage = self.sessions.get(session_id) if session_id else None
+        return usage.to_dict() if usage else Usage().to_dict()
+    
+    def document_usage(self, documents: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Usage charged to each document so far
+
+        Args:
+            documents: Paths of the documents to report, all documents if None
+
+        Returns:
+            Usage by document path, with the file name to display under 'name'
+        """
+        with self._lock:
+            charged = dict(self.documents)
+        if documents is not None:
+            paths = {os.path.abspath(document) for document in documents}
+            charged = {path: usage for path, usage in charged.items() if path in paths}
+        return {path: dict(usage.to_dict(), name=os.path.basename(path)) for path, usage in charged.items()}
+    
+    def budget_status(self, session_id: Optional[str]) -> Optional[str]:
+        """
+        Whether a session may make another request at full cost
+
+        Returns:
+            None while the session is within config.llm.session_token_budget and
+            session_cost_budget_usd (0 means unlimited), otherwise config.llm.budget_action:
+            'reject' or 'downgrade'
+        """
+        usage = self.session_usage(session_id)
+        token_budget = config.llm.session_token_budget
+        cost_budget = config.llm.session_cost_budget_usd
+        if (token_budget and usage["total_tokens"] >= token_budget) or (cost_budget and usage["cost_usd"] >= cost_budget):
+            logger.warning(f"Session {session_id} is over its budget ({usage['total_tokens']} tokens, "
+                           f"${usage['cost_usd']:.4f}), action: {config.llm.budget_action}")
+            return config.llm.budget_action
+        return None
+
+# Shared by all agents of the process
+usage_tracker = UsageTracker()
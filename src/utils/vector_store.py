@@ -1,30 +1,83 @@
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import os
+import json
+import pickle
 import logging
+import copy
+import threading
+from collections import OrderedDict
+import faiss
+import numpy as np
 from ..config import config
+from .index_generations import IndexGenerations
+from .chunk_store import ChunkStore, LayeredDocstore, PositionalIds
+from .embeddings import create_embeddings, embedding_signature
+from .chunker import StructureAwareChunker
+from .document_loader import DocumentLoader
+from .ingest_checkpoint import IngestionCheckpoint
+from .telemetry import telemetry
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class VectorStore:
     """Enhanced vector store with improved error handling and logging"""
     
-    def __init__(self):
-        """Initialize vector store with configuration"""
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=config.rag.embedding_model
-        )
+    MANIFEST_FILE = "manifest.json"
+    # Stores written before manifests existed could only use the original default model
+    LEGACY_SIGNATURE = "sentence-transformers/all-mpnet-base-v2|torch"
+    REBUILD_BATCH_SIZE = 512
+    
+    def __init__(self, read_only: Optional[bool] = None):
+        """Initialize vector store with configuration
+
+        Args:
+            read_only: Serve the index without ingestion, memory-mapping it and following
+                newly published generations. Defaults to config.rag.read_only.
+        """
+        self.embeddings = create_embeddings()
+        self.embedding_signature = embedding_signature()
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=config.rag.chunk_size,
             chunk_overlap=config.rag.chunk_overlap
         )
+        self.chunker = StructureAwareChunker()
+        self.read_only = config.rag.read_only if read_only is None else read_only
+        self.generations = IndexGenerations(config.rag.vector_store_path, keep=config.rag.keep_generations)
+        self.generation = None
+        self._pointer_mtime = None
         self.vector_store = None
+        # Session stores keep their index in memory and never publish a generation
+        self.persist = True
+        # SHA-256 of every document whose chunks are in the index
+        self.doc_ids = set()
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
         self._ensure_vector_store_dir()
     
+    def session_store(self) -> "VectorStore":
+        """
+        Create an empty in-memory store that shares this store's embedding model
+
+        Documents ingested into it reuse their ingestion checkpoints, so already
+        embedded documents cost no embedding calls, and nothing is written to the
+        shared index. Used to scope retrieval to one session's documents.
+
+        Returns:
+            New VectorStore with no index generations
+        """
+        store = copy.copy(self)
+        store.persist = False
+        store.read_only = False
+        store.generations = None
+        store.generation = None
+        store._pointer_mtime = None
+        store.vector_store = None
+        store.doc_ids = set()
+        return store
+    
     def _ensure_vector_store_dir(self) -> None:
         """Ensure vector store directory exists"""
         os.makedirs(os.path.dirname(config.rag.vector_store_path), exist_ok=True)
@@ -32,12 +85,23 @@ class VectorStore:
     def create_or_load(self) -> bool:
         """Create a new vector store or load existing one"""
         try:
-            if os.path.exists(config.rag.vector_store_path):
-                logger.info("Loading existing vector store...")
-                self.vector_store = FAISS.load_local(
-                    config.rag.vector_store_path, 
-                    self.embeddings
-                )
+            self._pointer_mtime = self.generations.pointer_mtime()
+            path = self.generations.current()
+            if path is not None:
+                built_with = self._read_signature(path)
+                if built_with != self.embedding_signature:
+                    if self.read_only:
+                        logger.error(f"Vector store was built with {built_with} but {self.embedding_signature} is configured; "
+                                     f"rebuild it with a writer process")
+                        return False
+                    logger.warning(f"Vector store was built with {built_with}; rebuilding with {self.embedding_signature}")
+                    self._rebuild(self._load_generation(path))
+                    return True
+                
+                logger.info(f"Loading existing vector store from {path}...")
+                self.vector_store = self._load_generation(path)
+                self.generation = path
+                self.doc_ids = self._read_doc_ids(path, self.vector_store)
                 return True
             logger.info("No existing vector store found.")
             return False
@@ -45,8 +109,189 @@ class VectorStore:
             logger.error(f"Error loading vector store: {str(e)}")
             return False
     
+    def refresh(self) -> bool:
+        """
+        Switch to the latest published generation if a writer has published a new one
+
+        Returns:
+            True if a new generation was loaded
+        """
+        mtime = self.generations.pointer_mtime()
+        if mtime is None or mtime == self._pointer_mtime:
+            return False
+        self._pointer_mtime = mtime
+        
+        path = self.generations.current()
+        if path is None or path == self.generation:
+            return False
+        if self._read_signature(path) != self.embedding_signature:
+            logger.error(f"Index generation {path} uses a different embedding model, keeping {self.generation}")
+            return False
+        try:
+            new_store = self._load_generation(path)
+        except Exception as e:
+            logger.error(f"Error loading index generation {path}, keeping {self.generation}: {str(e)}")
+            return False
+        
+        # Rebinding is atomic; searches already running keep using the old store
+        self.vector_store = new_store
+        self.generation = path
+        self.doc_ids = self._read_doc_ids(path, new_store)
+        logger.info(f"Switched to index generation {os.path.basename(path)}")
+        return True
+    
+    def _load_generation(self, path: str) -> FAISS:
+        """Load one generation, memory-mapping the index in read-only mode"""
+        if not ChunkStore.exists(path):
+            return self._load_legacy_generation(path)
+        
+        index_path = os.path.join(path, "index.faiss")
+        chunks = ChunkStore(path)
+        if self.read_only:
+            index = self._read_index_mmap(index_path) if config.rag.mmap_index else faiss.read_index(index_path)
+            return FAISS(self.embeddings, index, chunks, PositionalIds(len(chunks)))
+        
+        # Writers append through an overlay instead of loading every stored chunk
+        index = faiss.read_index(index_path)
+        return FAISS(self.embeddings, index, LayeredDocstore(chunks), {i: str(i) for i in range(len(chunks))})
+    
+    def _load_legacy_generation(self, path: str) -> FAISS:
+        """Load a store written with LangChain's pickled docstore"""
+        if not (self.read_only and config.rag.mmap_index):
+            return FAISS.load_local(path, self.embeddings)
+        
+        index = self._read_index_mmap(os.path.join(path, "index.faiss"))
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(self.embeddings, index, docstore, index_to_docstore_id)
+    
+    @staticmethod
+    def _read_index_mmap(index_path: str):
+        """Open a FAISS index backed by the page cache instead of the process heap"""
+        # IO_FLAG_MMAP_IFC also maps flat indexes; older faiss builds only map inverted lists
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(index_path, flags)
+        except RuntimeError as e:
+            logger.warning(f"Memory-mapped index load failed, reading into memory: {str(e)}")
+            return faiss.read_index(index_path)
+    
+    @classmethod
+    def published_doc_ids(cls, root: Optional[str] = None) -> Set[str]:
+        """
+        Documents in the currently published generation, read from its manifest without loading the index
+
+        Args:
+            root: Vector store directory, defaults to config.rag.vector_store_path
+
+        Returns:
+            SHA-256 of every indexed document; empty if there is no index or its
+            manifest predates the document list
+        """
+        path = IndexGenerations(root or config.rag.vector_store_path).current()
+        if path is None:
+            return set()
+        try:
+            with open(os.path.join(path, cls.MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                return set(json.load(f).get("documents", []))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return set()
+    
+    def _read_manifest(self, path: str) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(path, self.MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def _read_signature(self, path: str) -> str:
+        """Get the embedding signature a generation was built with"""
+        return self._read_manifest(path).get("embedding", self.LEGACY_SIGNATURE)
+    
+    def _read_doc_ids(self, path: str, store: FAISS) -> set:
+        """Documents indexed in a generation, scanning chunk metadata for older manifests"""
+        manifest = self._read_manifest(path)
+        if "documents" in manifest:
+            return set(manifest["documents"])
+        return {doc.metadata["doc_id"] for doc in self._iter_documents(store) if doc.metadata.get("doc_id")}
+    
+    def _rebuild(self, old_store: FAISS) -> None:
+        """Re-embed every stored chunk with the configured model and publish the result"""
+        self.vector_store = None
+        batch = []
+        total = 0
+        for doc in self._iter_documents(old_store):
+            batch.append(doc)
+            if len(batch) >= self.REBUILD_BATCH_SIZE:
+                self._embed_documents(batch)
+                total += len(batch)
+                batch = []
+                logger.info(f"Re-embedded {total} chunks...")
+        if batch:
+            self._embed_documents(batch)
+            total += len(batch)
+        
+        if self.vector_store is None:
+            logger.warning("Nothing to rebuild; previous vector store was empty")
+            return
+        self._publish()
+        logger.info(f"Rebuilt vector store with {total} chunks")
+    
+    def _embed_documents(self, documents: List[Document]) -> None:
+        """Embed documents into the in-memory store, creating it if needed"""
+        texts = [doc.page_content for doc in documents]
+        metadatas = [doc.metadata for doc in documents]
+        if self.vector_store is None:
+            self.vector_store = FAISS.from_texts(texts, self.embeddings, metadatas=metadatas)
+        else:
+            self.vector_store.add_texts(texts, metadatas=metadatas)
+    
+    def _publish(self) -> None:
+        """Write the in-memory store as a new generation and make it current"""
+        if not self.persist:
+            self.doc_ids = {doc.metadata["doc_id"] for doc in self._iter_documents() if doc.metadata.get("doc_id")}
+            return
+        tmp_path = self.generations.begin()
+        faiss.write_index(self.vector_store.index, os.path.join(tmp_path, "index.faiss"))
+        doc_ids = set()
+        
+        def documents():
+            for doc in self._iter_documents():
+                if doc.metadata.get("doc_id"):
+                    doc_ids.add(doc.metadata["doc_id"])
+                yield doc
+        
+        count = ChunkStore.write(tmp_path, documents())
+        with open(os.path.join(tmp_path, self.MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                "embedding": self.embedding_signature,
+                "dimension": self.vector_store.index.d,
+                "chunks": count,
+                "documents": sorted(doc_ids)
+            }, f)
+        self.doc_ids = doc_ids
+        self.generation = self.generations.publish(tmp_path)
+        self._pointer_mtime = self.generations.pointer_mtime()
+        
+        # Serve stored chunks from the new generation instead of keeping them in memory
+        self.vector_store.docstore = LayeredDocstore(ChunkStore(self.generation))
+        self.vector_store.index_to_docstore_id = {i: str(i) for i in range(count)}
+    
+    def _iter_documents(self, store: Optional[FAISS] = None):
+        """Yield stored documents in FAISS position order"""
+        store = store or self.vector_store
+        for i in range(store.index.ntotal):
+            doc = store.docstore.search(store.index_to_docstore_id[i])
+            if not isinstance(doc, Document):
+                raise ValueError(f"Docstore is missing the chunk for index position {i}")
+            yield doc
+    
+    @telemetry.traced("add_texts")
     def add_texts(self, texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
         """Add texts to vector store with improved error handling"""
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only; run ingestion in a writer process (see ingest.py)")
+        
         try:
             logger.info(f"Processing {len(texts)} texts...")
             chunks = self.text_splitter.split_text("\n".join(texts))
@@ -54,36 +299,246 @@ class VectorStore:
             if self.vector_store is None:
                 logger.info("Creating new vector store...")
                 self.vector_store = FAISS.from_texts(
-                    chunks, 
-                    self.embeddings, 
+                    chunks,
+                    self.embeddings,
                     metadatas=metadatas
                 )
-                self.vector_store.save_local(config.rag.vector_store_path)
             else:
                 logger.info("Adding to existing vector store...")
                 self.vector_store.add_texts(chunks, metadatas=metadatas)
-                self.vector_store.save_local(config.rag.vector_store_path)
+            self._publish()
+            telemetry.current().set(texts=len(texts), chunks=len(chunks))
             
             logger.info(f"Successfully processed {len(chunks)} chunks.")
         except Exception as e:
             logger.error(f"Error adding texts to vector store: {str(e)}")
             raise
     
-    def similarity_search(self, query: str, k: Optional[int] = None) -> List[Document]:
-        """Search for similar texts with configurable k"""
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed queries, serving repeats from an LRU cache and embedding the rest in one batch
+        
+        Args:
+            queries: Query strings
+            
+        Returns:
+            float32 matrix with one row per query
+        """
+        vectors = {}
+        with self._query_cache_lock:
+            for query in queries:
+                if query in self._query_cache:
+                    self._query_cache.move_to_end(query)
+                    vectors[query] = self._query_cache[query]
+        
+        misses = list(dict.fromkeys(q for q in queries if q not in vectors))
+        if misses:
+            embedded = self.embeddings.embed_documents(misses)
+            with self._query_cache_lock:
+                for query, vector in zip(misses, embedded):
+                    vector = np.asarray(vector, dtype=np.float32)
+                    vectors[query] = vector
+                    self._query_cache[query] = vector
+                while len(self._query_cache) > config.rag.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        
+        logger.info(f"Embedded {len(misses)} of {len(queries)} queries ({len(queries) - len(misses)} cached)")
+        return np.vstack([vectors[q] for q in queries])
+    
+    def add_documents(self, pages: List[Document]) -> None:
+        """
+        Chunk page documents and add them to the vector store
+        
+        Args:
+            pages: One document per page, as returned by DocumentLoader.load_documents_pages
+        """
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only; run ingestion in a writer process (see ingest.py)")
+        
+        try:
+            logger.info(f"Processing {len(pages)} pages...")
+            if config.rag.chunking == "structure":
+                chunks = self.chunker.split_documents(pages)
+            else:
+                chunks = self.text_splitter.split_documents(pages)
+            if not chunks:
+                logger.warning("No text to add to the vector store")
+                return
+            
+            self._embed_documents(chunks)
+            self._publish()
+            logger.info(f"Successfully processed {len(chunks)} chunks.")
+        except Exception as e:
+            logger.error(f"Error adding documents to vector store: {str(e)}")
+            raise
+    
+    @telemetry.traced("ingest_files")
+    def ingest_files(self, file_paths: List[str]) -> List[Document]:
+        """
+        Extract, chunk and embed documents with per-batch checkpoints, then publish them
+        
+        A document whose ingestion was interrupted resumes after its last committed
+        batch. Files that fail are skipped, but keep their checkpoint for the next attempt.
+        Documents already in the index are not added again; their pages come from
+        the checkpoint without parsing or embedding.
+        
+        Args:
+            file_paths: Documents to ingest
+            
+        Returns:
+            Page documents of every successfully ingested file
+        """
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only; run ingestion in a writer process (see ingest.py)")
+        
+        all_pages, all_chunks, all_vectors, checkpoints = [], [], [], []
+        seen = set()
+        for file_path in file_paths:
+            try:
+                doc_id = DocumentLoader.file_hash(file_path)
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                checkpoint = IngestionCheckpoint(doc_id, file_path, self.embedding_signature)
+                pages, chunks, vectors = self._ingest_file(file_path, checkpoint)
+            except Exception as e:
+                logger.error(f"Skipping file {file_path} due to error: {str(e)}")
+                continue
+            all_pages.extend(pages)
+            if doc_id in self.doc_ids and checkpoint.complete:
+                logger.info(f"{file_path} is already indexed, reusing its chunks")
+                continue
+            all_chunks.extend(chunks)
+            if len(vectors):
+                all_vectors.append(vectors)
+            checkpoints.append(checkpoint)
+        
+        if all_chunks:
+            self._add_embedded(all_chunks, np.vstack(all_vectors))
+            self._publish()
+        for checkpoint in checkpoints:
+            checkpoint.mark_complete()
+        if self.persist:
+            IngestionCheckpoint.gc(self.doc_ids)
+        
+        telemetry.current().set(documents=len(checkpoints), pages=len(all_pages), chunks=len(all_chunks))
+        logger.info(f"Ingested {len(all_pages)} pages as {len(all_chunks)} chunks from {len(checkpoints)} documents")
+        return all_pages
+    
+    @telemetry.traced("ingest_file")
+    def _ingest_file(self, file_path: str, checkpoint: IngestionCheckpoint):
+        """Extract and embed one document batch by batch, committing each batch to its checkpoint"""
+        telemetry.current().set(document=os.path.basename(file_path))
+        pages, chunks, vectors = checkpoint.load()
+        vectors = [vectors] if len(vectors) else []
+        # The same content may have been checkpointed under another path
+        for doc in pages + chunks:
+            doc.metadata["source"] = file_path
+        if checkpoint.complete:
+            return pages, chunks, np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        
+        sections = {file_path: checkpoint.section}
+        batch = []
+        page_iter = DocumentLoader.iter_document_pages(file_path, start_page=checkpoint.pages_done)
+        for page in page_iter:
+            page.metadata["doc_id"] = checkpoint.doc_id
+            batch.append(page)
+            if len(batch) < config.rag.ingest_batch_pages:
+                continue
+            vectors.extend(self._commit_batch(checkpoint, batch, sections, pages, chunks))
+            batch = []
+        if batch:
+            vectors.extend(self._commit_batch(checkpoint, batch, sections, pages, chunks))
+        
+        return pages, chunks, np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    
+    def _commit_batch(self, checkpoint: IngestionCheckpoint, batch: List[Document], sections: Dict[str, str],
+                      pages: List[Document], chunks: List[Document]) -> List[np.ndarray]:
+        """Chunk and embed one batch of pages and commit it to the checkpoint"""
+        if config.rag.chunking == "structure":
+            batch_chunks = self.chunker.split_documents(batch, sections)
+        else:
+            batch_chunks = self.text_splitter.split_documents(batch)
+        
+        dimension = self.embedding_dimension()
+        batch_vectors = np.asarray(
+            self.embeddings.embed_documents([chunk.page_content for chunk in batch_chunks]) if batch_chunks else [],
+            dtype=np.float32
+        ).reshape(-1, dimension)
+        checkpoint.commit_batch(batch, batch_chunks, batch_vectors, sections.get(checkpoint.source, ""))
+        
+        pages.extend(batch)
+        chunks.extend(batch_chunks)
+        return [batch_vectors] if len(batch_vectors) else []
+    
+    def embedding_dimension(self) -> int:
+        """Dimension of the configured embedding model"""
+        if self.vector_store is not None:
+            return self.vector_store.index.d
+        return len(self.embed_queries(["dimension probe"])[0])
+    
+    def _add_embedded(self, documents: List[Document], vectors: np.ndarray) -> None:
+        """Add already embedded documents to the in-memory store, creating it if needed"""
+        text_embeddings = list(zip([doc.page_content for doc in documents], vectors.tolist()))
+        metadatas = [doc.metadata for doc in documents]
         if self.vector_store is None:
+            self.vector_store = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas)
+        else:
+            self.vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
+    
+    @telemetry.traced("similarity_search")
+    def similarity_search_many(self, queries: List[str], k: Optional[int] = None) -> List[List[Document]]:
+        """
+        Search for several queries with one embedding batch and one FAISS search
+        
+        Args:
+            queries: Query strings
+            k: Number of results per query
+            
+        Returns:
+            One list of documents per query, in query order
+        """
+        if self.read_only:
+            self.refresh()
+        
+        # Bind once so a concurrent generation swap cannot split this search across stores
+        store = self.vector_store
+        if store is None:
             raise ValueError("Vector store not initialized. Call create_or_load() first.")
+        if not queries:
+            return []
         
         try:
-            k = k or config.rag.retrieval_k
-            logger.info(f"Performing similarity search with k={k}")
-            results = self.vector_store.similarity_search(query, k=k)
-            logger.info(f"Found {len(results)} results")
+            k = min(k or config.rag.retrieval_k, store.index.ntotal)
+            if k <= 0:
+                return [[] for _ in queries]
+            logger.info(f"Performing similarity search for {len(queries)} queries with k={k}")
+            vectors = self.embed_queries(queries)
+            if getattr(store, "_normalize_L2", False):
+                faiss.normalize_L2(vectors)
+            _, indices = store.index.search(vectors, k)
+            
+            results = []
+            for row in indices:
+                documents = []
+                for i in row:
+                    if i == -1:
+                        continue
+                    doc = store.docstore.search(store.index_to_docstore_id[int(i)])
+                    if isinstance(doc, Document):
+                        documents.append(doc)
+                results.append(documents)
+            telemetry.current().set(queries=len(queries), chunks=sum(len(r) for r in results))
+            logger.info(f"Found {sum(len(r) for r in results)} results")
             return results
         except Exception as e:
             logger.error(f"Error during similarity search: {str(e)}")
             raise
     
+    def similarity_search(self, query: str, k: Optional[int] = None) -> List[Document]:
+        """Search for similar texts with configurable k"""
+        return self.similarity_search_many([query], k)[0]
+    
     def get_relevant_chunks(self, query: str, k: Optional[int] = None) -> List[str]:
         """Get relevant text chunks for a query"""
         documents = self.similarity_search(query, k)
@@ -0,0 +1,142 @@
+import time
+import pytest
+from src.config import config
+from src.utils.llm_providers import LLMProvider, ProviderHealth, ProviderRouter
+from src.utils.request_scheduler import RequestScheduler
+
+class FakeProvider(LLMProvider):
+    """Provider that answers after a delay or fails, without any network"""
+    
+    def __init__(self, name, answer="ok", delay=0.0, error=None, timeout=5.0):
+        super().__init__(f"{name}-model", timeout)
+        self.name = name
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+    
+    @property
+    def available(self) -> bool:
+        return True
+    
+    def generate(self, prompt, system_message=None, stats=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.answer
+
+def make_router(*providers, limits=None):
+    router = ProviderRouter(list(providers))
+    router.scheduler = RequestScheduler(limits or {p.name: (10 ** 6, 10 ** 9) for p in providers})
+    return router
+
+def open_circuit(health):
+    for _ in range(health.failure_threshold):
+        health.record_failure()
+
+def test_circuit_opens_after_consecutive_failures():
+    health = ProviderHealth(failure_threshold=3, cooldown_s=30)
+    assert not health.record_failure()
+    assert not health.record_failure()
+    assert health.record_failure()
+    assert health.state == "open"
+    assert not health.acquire()
+
+def test_success_resets_the_failure_run():
+    health = ProviderHealth(failure_threshold=2, cooldown_s=30)
+    health.record_failure()
+    health.record_success(0.1)
+    assert not health.record_failure()
+    assert health.state == "closed"
+
+def test_half_open_lets_one_trial_through():
+    health = ProviderHealth(failure_threshold=1, cooldown_s=30)
+    open_circuit(health)
+    health.opened_at -= 30
+    assert health.state == "half_open"
+    assert health.acquire()
+    assert not health.acquire()
+
+def test_trial_success_closes_and_failure_reopens():
+    health = ProviderHealth(failure_threshold=1, cooldown_s=30)
+    open_circuit(health)
+    health.opened_at -= 30
+    health.acquire()
+    assert health.record_failure()
+    assert health.state == "open"
+    
+    health.opened_at -= 30
+    health.acquire()
+    health.record_success(0.1)
+    assert health.state == "closed"
+    assert health.acquire()
+
+def test_released_trial_can_be_taken_again():
+    health = ProviderHealth(failure_threshold=1, cooldown_s=30)
+    open_circuit(health)
+    health.opened_at -= 30
+    assert health.acquire()
+    health.release_trial()
+    assert health.state == "half_open"
+    assert health.acquire()
+
+def test_p95_needs_enough_samples():
+    health = ProviderHealth(failure_threshold=3, cooldown_s=30)
+    for i in range(ProviderHealth.MIN_SAMPLES - 1):
+        health.record_success(1.0)
+    assert health.p95() is None
+    for i in range(80):
+        health.record_success(float(i))
+    assert health.p95() == pytest.approx(75.0)
+
+def test_router_fails_over_to_the_next_provider():
+    primary = FakeProvider("primary", error=RuntimeError("down"))
+    secondary = FakeProvider("secondary", answer="from secondary")
+    router = make_router(primary, secondary)
+    stats = {}
+    assert router.generate("question", stats=stats) == "from secondary"
+    assert stats["provider"] == "secondary"
+    assert stats["attempts"] == 2
+    assert router.health["primary"].consecutive_failures == 1
+
+def test_router_skips_providers_with_an_open_circuit():
+    primary = FakeProvider("primary")
+    secondary = FakeProvider("secondary", answer="from secondary")
+    router = make_router(primary, secondary)
+    open_circuit(router.health["primary"])
+    assert router.generate("question") == "from secondary"
+    assert primary.calls == 0
+
+def test_router_raises_when_every_provider_fails():
+    router = make_router(FakeProvider("a", error=RuntimeError("down")), FakeProvider("b", error=RuntimeError("down")))
+    with pytest.raises(RuntimeError, match="All LLM providers failed"):
+        router.generate("question")
+
+def test_router_hedges_slow_calls(monkeypatch):
+    monkeypatch.setattr(config.llm, "hedge_enabled", True)
+    monkeypatch.setattr(config.llm, "hedge_min_delay_s", 0.05)
+    primary = FakeProvider("primary", answer="slow", delay=1.0)
+    secondary = FakeProvider("secondary", answer="fast")
+    router = make_router(primary, secondary)
+    for _ in range(ProviderHealth.MIN_SAMPLES):
+        router.health["primary"].record_success(0.05)
+    stats = {}
+    assert router.generate("question", stats=stats) == "fast"
+    assert stats["hedged"]
+    assert stats["provider"] == "secondary"
+
+def test_scheduler_timeout_releases_the_half_open_trial():
+    primary = FakeProvider("primary", timeout=0.1)
+    router = make_router(primary, limits={"primary": (1, 10 ** 9)})
+    router.scheduler.acquire("primary", 1)
+    health = router.health["primary"]
+    open_circuit(health)
+    health.opened_at -= config.llm.circuit_cooldown_s
+    
+    with pytest.raises(RuntimeError):
+        router.generate("question")
+    assert primary.calls == 0
+    # Waiting for quota neither reopened the circuit nor kept the trial
+    assert health.state == "half_open"
+    assert health.acquire()
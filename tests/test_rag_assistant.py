@@ -0,0 +1,40 @@
+from collections import OrderedDict
+import pytest
+from src.agents.rag_assistant import RAGAssistant
+from src.utils.cost_model import CostModel
+
+@pytest.fixture
+def assistant(monkeypatch):
+    # Loaded documents without an index, embedding model or LLM behind them
+    rag = object.__new__(RAGAssistant)
+    rag.file_paths = ["report.pdf"]
+    rag.user_req_file_paths = []
+    rag.texts = ["Scope 1 emissions fell by 12% in 2022."]
+    rag.document_tokens = 10
+    rag.vectorized = True
+    rag.metrics_data = None
+    rag.reranker = None
+    rag.cost_model = CostModel()
+    rag.prompt_prefixes = OrderedDict()
+    rag.summary_calls = []
+    
+    def get_summary_context(query, drill_down=False):
+        rag.summary_calls.append((query, drill_down))
+        return "=== SECTION SUMMARIES ===\nEmissions fell across all scopes."
+    
+    monkeypatch.setattr(rag, "get_summary_context", get_summary_context)
+    monkeypatch.setattr(rag, "generate_response", lambda layout, stats=None: "answer")
+    return rag
+
+def test_broad_queries_drill_down_into_the_summary_index_automatically(assistant):
+    result = assistant.process_query("Give me an overview of the climate strategy")
+    assert assistant.summary_calls == [("Give me an overview of the climate strategy", True)]
+    assert "Emissions fell across all scopes." in result["context"]
+
+def test_specific_queries_do_not_use_the_summary_index(assistant):
+    assistant.process_query("What were Scope 1 emissions in 2022?")
+    assert assistant.summary_calls == []
+
+def test_downgraded_broad_queries_skip_the_drill_down(assistant):
+    assistant.process_query("Summarize the report", downgrade=True)
+    assert assistant.summary_calls == [("Summarize the report", False)]
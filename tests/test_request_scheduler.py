@@ -0,0 +1,119 @@
+import threading
+import time
+import types
+import pytest
+from src.utils import request_scheduler
+from src.utils.request_scheduler import RequestScheduler, SchedulerTimeout, TokenBucket, rate_limit_delay
+
+class FakeClock:
+    """Stands in for the time module so bucket refills can be stepped exactly"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+    
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(request_scheduler, "time", fake)
+    return fake
+
+class RateLimited(Exception):
+    def __init__(self, headers=None):
+        super().__init__("rate limited")
+        self.status_code = 429
+        self.response = types.SimpleNamespace(headers=headers or {})
+
+def test_bucket_starts_full_and_refills_continuously(clock):
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(60) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now += 100
+    # Refills stop at capacity
+    assert bucket.wait_time(60) == 0
+    assert bucket.wait_time(61) == 0
+
+def test_bucket_caps_oversized_requests_at_capacity(clock):
+    bucket = TokenBucket(60)
+    bucket.take(10)
+    # A call larger than the whole budget waits for a full bucket, not forever
+    assert bucket.wait_time(1000) == pytest.approx(10.0)
+
+def test_rate_limit_delay_reads_retry_after_headers():
+    assert rate_limit_delay(RateLimited({"retry-after": "7"})) == 7.0
+    assert rate_limit_delay(RateLimited({"retry-after-ms": "1500"})) == 1.5
+    assert rate_limit_delay(RateLimited()) == 0.0
+    assert rate_limit_delay(ValueError("boom")) is None
+
+def test_rate_limit_delay_recognizes_client_error_types():
+    ResourceExhausted = type("ResourceExhausted", (Exception,), {})
+    assert rate_limit_delay(ResourceExhausted("quota")) == 0.0
+
+def test_acquire_charges_both_budgets(clock):
+    scheduler = RequestScheduler({"fake": (10, 1000)})
+    scheduler.acquire("fake", 400)
+    requests, tokens = scheduler._buckets["fake"]
+    assert requests.level == pytest.approx(9)
+    assert tokens.level == pytest.approx(600)
+
+def test_acquire_times_out_when_budget_is_used_up():
+    scheduler = RequestScheduler({"fake": (1, 1000)})
+    scheduler.acquire("fake", 1)
+    with pytest.raises(SchedulerTimeout):
+        scheduler.acquire("fake", 1, deadline=time.monotonic() + 0.05)
+    # The timed out call left the queue
+    assert scheduler._waiting["fake"] == []
+
+def test_interactive_calls_are_served_before_batch_calls():
+    # 600 requests per minute: one call every 0.1s once the initial burst is spent
+    scheduler = RequestScheduler({"fake": (600, 10 ** 9)})
+    requests, _ = scheduler._buckets_for("fake")
+    requests.level = 0
+    served = []
+    
+    def call(name, priority):
+        scheduler.acquire("fake", 1, priority=priority, deadline=time.monotonic() + 5)
+        served.append(name)
+    
+    batch = threading.Thread(target=call, args=("batch", RequestScheduler.BATCH))
+    batch.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=call, args=("interactive", RequestScheduler.INTERACTIVE))
+    interactive.start()
+    batch.join(5)
+    interactive.join(5)
+    assert served == ["interactive", "batch"]
+
+def test_run_retries_rate_limited_calls(monkeypatch):
+    monkeypatch.setattr(request_scheduler.random, "uniform", lambda a, b: 0.0)
+    scheduler = RequestScheduler({"fake": (1000, 10 ** 6)})
+    attempts = []
+    
+    def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited()
+        return "ok"
+    
+    assert scheduler.run("fake", 10, call) == "ok"
+    assert len(attempts) == 3
+
+def test_run_raises_other_errors_without_retrying():
+    scheduler = RequestScheduler({"fake": (1000, 10 ** 6)})
+    attempts = []
+    
+    def call():
+        attempts.append(1)
+        raise ValueError("bad request")
+    
+    with pytest.raises(ValueError):
+        scheduler.run("fake", 10, call)
+    assert len(attempts) == 1
@@ -0,0 +1,43 @@
+import pytest
+from src.agents.router_agent import RouterAgent
+
+class FakeAssistant:
+    """Answers queries like RAGAssistant.process_query, without retrieval or an LLM"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def generate_response(self, prompt, stats=None):
+        return "summary"
+    
+    def process_query(self, query, strategy=None, memory=None, downgrade=False):
+        self.calls.append((query, downgrade))
+        return {
+            "response": "answer",
+            "context": "context",
+            "enhanced_prompt": "prompt",
+            "search_query": query,
+            "prompt_stats": {"prompt_tokens": 120, "cached_tokens": 80},
+            "downgraded": downgrade,
+            "usage": {"calls": 1, "total_tokens": 150}
+        }
+
+@pytest.fixture
+def router():
+    agent = RouterAgent()
+    agent.rag_assistant = FakeAssistant()
+    agent.scoring_agent = object()
+    agent.explore_agent = FakeAssistant()
+    return agent
+
+@pytest.mark.parametrize("mode", ["analysis", "explore"])
+def test_route_query_passes_prompt_stats_and_usage_through(router, mode):
+    result = router.route_query("What are the emission targets?", mode=mode, session_id="s1")
+    assert result["prompt_stats"] == {"prompt_tokens": 120, "cached_tokens": 80}
+    assert result["usage"] == {"calls": 1, "total_tokens": 150}
+    assert result["downgraded"] is False
+
+def test_route_query_reports_a_downgraded_answer(router):
+    result = router.route_query("What are the emission targets?", mode="analysis", session_id="s1", downgrade=True)
+    assert result["downgraded"] is True
+    assert router.rag_assistant.calls == [("What are the emission targets?", True)]
@@ -0,0 +1,24 @@
+import os
+from src.utils.usage import UsageTracker
+
+def charge(tracker, documents, prompt_tokens):
+    with tracker.track("session", documents=documents):
+        tracker.record_call("fake", "fake-model", prompt_tokens, 0)
+
+def test_documents_sharing_a_name_are_charged_separately(tmp_path):
+    tracker = UsageTracker()
+    first = str(tmp_path / "aaa" / "report.pdf")
+    second = str(tmp_path / "bbb" / "report.pdf")
+    charge(tracker, [first], 100)
+    charge(tracker, [second], 40)
+    
+    usage = tracker.document_usage([second])
+    assert list(usage) == [os.path.abspath(second)]
+    assert usage[os.path.abspath(second)]["prompt_tokens"] == 40
+    assert usage[os.path.abspath(second)]["name"] == "report.pdf"
+
+def test_a_call_over_several_documents_is_split_between_them(tmp_path):
+    tracker = UsageTracker()
+    documents = [str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")]
+    charge(tracker, documents, 100)
+    assert [usage["prompt_tokens"] for usage in tracker.document_usage().values()] == [50, 50]
@@ -0,0 +1,41 @@
+import autogen
+import pytest
+from src.config import config
+from src.agents.user_proxy import EnhancedUserProxy
+
+@pytest.fixture
+def agents(monkeypatch):
+    # No LLM clients: the proxy's replies come from the reply function registered by the test
+    monkeypatch.setattr(type(config), "llm_config", property(lambda self: False))
+    monkeypatch.setattr(config.rag, "memory_recent_turns", 1)
+    summaries = []
+    
+    def summarize(prompt):
+        summaries.append(prompt)
+        return "The user asked about Scope 1 emissions in 2022, which were 1.2 Mt."
+    
+    proxy = EnhancedUserProxy(generate=summarize)
+    assistant = autogen.ConversableAgent("rag_assistant", llm_config=False, human_input_mode="NEVER")
+    return proxy, assistant, summaries
+
+def test_summarized_history_reaches_the_reply_prompt(agents):
+    proxy, assistant, summaries = agents
+    for question, answer in [("What were Scope 1 emissions in 2022?", "1.2 Mt"),
+                             ("And the target for 2030?", "Net zero by 2030")]:
+        proxy.send(question, assistant, request_reply=False, silent=True)
+        assistant.send(answer, proxy, request_reply=False, silent=True)
+    assert len(summaries) == 1
+    assert "What were Scope 1 emissions in 2022?" in summaries[0]
+    
+    prompts = []
+    
+    def reply(agent, messages=None, sender=None, config=None):
+        prompts.append(messages)
+        return True, "ok"
+    
+    proxy.register_reply([autogen.Agent, None], reply)
+    assert proxy.generate_reply(sender=assistant) == "ok"
+    system, latest = prompts[0]
+    assert "Scope 1 emissions in 2022, which were 1.2 Mt" in system["content"]
+    assert "User: And the target for 2030?\nAssistant: Net zero by 2030" in system["content"]
+    assert latest["content"] == "Net zero by 2030"
@@ -1,13 +1,29 @@
 import os
 import sys
+import re
 import uuid
 import logging
 import json
+import threading
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, make_response, render_template, session
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 from src.agents.router_agent import RouterAgent
+from src.agents.scoring_agent import ScoringAgent
+from src.utils.scoring_jobs import ScoringJobManager
+from src.utils.blob_store import BlobStore
+from src.utils.upload_stream import StreamingUploadRequest
+from src.utils.document_loader import DocumentLoader
+from src.utils.cost_model import CostModel
+from src.utils.vector_store import VectorStore
+from src.utils.telemetry import telemetry, parse_traceparent, format_traceparent
+from src.utils.profiling import RequestProfiler, requested_profile_mode
+from src.utils.usage import usage_tracker
 from src.config import config
 
 # 添加项目根目录到系统路径
@@ -15,19 +31,135 @@ project_root = Path(__file__).parent.absolute()
 sys.path.append(str(project_root))
 
 app = Flask(__name__)
+# Stream uploads to disk while hashing them; the request limit is enforced by Werkzeug as data arrives
+app.request_class = StreamingUploadRequest
+app.config['MAX_CONTENT_LENGTH'] = config.web.max_request_mb * 1024 * 1024
 CORS(app)
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - [trace=%(trace_id)s span=%(span_id)s] %(message)s'
 )
 logger = logging.getLogger(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'
+telemetry.configure_export()
 
 # 初始化路由代理，用于分发查询到适当的代理
 router_agent = None
 
+# Uploaded files are stored once per content and shared between sessions
+blob_store = BlobStore()
+
+# Parse stored uploads in the background so loading finds them already parsed
+prefetch_executor = ThreadPoolExecutor(max_workers=config.web.prefetch_workers, thread_name_prefix="prefetch")
+
+def store_upload(file, filename: str):
+    """Store an uploaded file in the blob store and start parsing it"""
+    sha, file_path, _ = blob_store.put(file.stream, filename)
+    prefetch_executor.submit(telemetry.bind(DocumentLoader.parse_document), file_path)
+    return sha, file_path
+
+@app.before_request
+def start_trace():
+    """Start the request's trace, continuing the caller's traceparent or X-Request-ID"""
+    if request.endpoint in (None, 'metrics', 'static'):
+        return
+    request_id = request.headers.get('X-Request-ID', '')
+    remote = parse_traceparent(request.headers.get('traceparent'))
+    if remote:
+        trace_id, parent_id = remote
+    else:
+        trace_id = request_id.lower() if re.fullmatch(r'[0-9a-fA-F]{32}', request_id) else None
+        parent_id = None
+    g.trace_token = telemetry.start_trace(trace_id, parent_id)
+    # The request span stays open until teardown so every stage below it is its child
+    g.request_span_context = telemetry.span("http_request", endpoint=request.endpoint, method=request.method)
+    g.request_span = g.request_span_context.__enter__()
+    if request_id:
+        g.request_span.set(request_id=request_id)
+
+@app.after_request
+def add_trace_headers(response):
+    """Return the trace id so clients and logs can be correlated"""
+    span = g.get('request_span')
+    if span is not None:
+        response.headers['X-Request-ID'] = request.headers.get('X-Request-ID') or span.trace_id
+        response.headers['traceparent'] = format_traceparent(span.trace_id, span.span_id)
+        # A string, so the status is kept on the span but not summed into a stage counter
+        span.set(status=str(response.status_code))
+        telemetry.registry.inc("http_requests_total", 1, "HTTP requests", endpoint=request.endpoint,
+                               status=response.status_code)
+    return response
+
+@app.teardown_request
+def end_trace(exc=None):
+    if g.get('request_span_context') is not None:
+        g.request_span_context.__exit__(type(exc) if exc else None, exc, None)
+        telemetry.end_trace(g.trace_token)
+
+@app.teardown_request
+def discard_uploads(exc=None):
+    """Delete temporary upload files the request did not store"""
+    # request.files would parse the form again and re-raise a rejected upload's 413
+    request.discard_uploads()
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """Report uploads rejected for size in the JSON format the pages expect"""
+    return jsonify({
+        'success': False,
+        'message': e.description or f'Upload exceeds the {config.web.max_request_mb} MB request limit.'
+    }), 413
+
+def session_id() -> str:
+    """Identifier of the browser session, used to reference its uploaded files"""
+    if 'session_id' not in session:
+        session['session_id'] = uuid.uuid4().hex
+    return session['session_id']
+
+def profiled(view):
+    """Profile the view when the request asks for it with an X-Profile header or ?profile=
+
+    Only honoured with PROFILING_ENABLED set. The value 1 uses the configured
+    profiler, cprofile or sampling picks one. The name of the profile's directory
+    under config.telemetry.profile_path is returned in the X-Profile-ID header.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = requested_profile_mode(request.headers.get('X-Profile') or request.args.get('profile'))
+        if mode is None:
+            return view(*args, **kwargs)
+        with contextlib.ExitStack() as stack:
+            try:
+                profiler = stack.enter_context(RequestProfiler(request.endpoint, mode))
+            except Exception as e:
+                # Such as another profiler already running in the process; the request is served anyway
+                logger.warning(f"Could not start the {mode} profiler, serving {request.endpoint} unprofiled: {str(e)}")
+                profiler = None
+            response = make_response(view(*args, **kwargs))
+        if profiler is not None and profiler.path:
+            # Clients get the profile's name, not where the server keeps its files
+            response.headers['X-Profile-ID'] = os.path.basename(profiler.path)
+            telemetry.current().set(profile_path=profiler.path)
+        return response
+    return wrapper
+
+# Scoring runs in background workers, created on first use
+scoring_agent = None
+scoring_jobs = None
+scoring_lock = threading.Lock()
+
+def get_scoring_jobs() -> ScoringJobManager:
+    """Create the scoring agent and its job manager once"""
+    global scoring_agent, scoring_jobs
+    with scoring_lock:
+        if scoring_jobs is None:
+            # Only the embeddings are used for evidence; the model is the one the RAG stores already loaded
+            scoring_agent = ScoringAgent(vector_store=VectorStore())
+            scoring_jobs = ScoringJobManager(scoring_agent.score_document)
+    return scoring_jobs
+
 @app.route('/')
 def index():
     """渲染主页"""
@@ -39,10 +171,20 @@ def score_page():
     return render_template('score.html')
 
 @app.route('/upload_documents', methods=['POST'])
+@profiled
 def upload_documents():
     """处理用户上传的文档作为需求和问题规格"""
     global router_agent
     
+    # Loading builds summaries with LLM calls; sessions over budget may not start new work
+    budget_action = usage_tracker.budget_status(session_id())
+    if budget_action == 'reject':
+        return jsonify({
+            'success': False,
+            'message': 'This session has used up its token budget.',
+            'session_usage': usage_tracker.session_usage(session_id())
+        }), 429
+    
     try:
         # 检查是否有文件上传
         if 'files' not in request.files:
@@ -58,21 +200,19 @@ def upload_documents():
                 'message': 'No files selected.'
             })
         
-        # 创建临时目录来存储用户需求文档
-        user_req_dir = os.path.join(project_root, 'data', 'user_requirements', str(uuid.uuid4()))
-        os.makedirs(user_req_dir, exist_ok=True)
-        
-        # 保存上传的文件
+        # 保存上传的文件；相同内容只存一份，已存在的文件跳过写入
         user_req_paths = []
         uploaded_filenames = []
+        blob_shas = []
         
         for file in files:
             if file and file.filename:
                 filename = secure_filename(file.filename)
                 if filename.lower().endswith(('.pdf', '.txt')):
-                    file_path = os.path.join(user_req_dir, filename)
-                    file.save(file_path)
-                    user_req_paths.append(file_path)
+                    sha, file_path = store_upload(file, filename)
+                    if file_path not in user_req_paths:
+                        user_req_paths.append(file_path)
+                        blob_shas.append(sha)
                     uploaded_filenames.append(filename)
         
         if not user_req_paths:
@@ -81,9 +221,6 @@ def upload_documents():
                 'message': 'No valid PDF or TXT files were uploaded.'
             })
         
-        # 初始化路由代理
-        router_agent = RouterAgent()
-        
         # 加载系统中已有的文档
         reference_dir = os.path.join(project_root, 'data', 'documents', 'reference')
         # report_dir = os.path.join(project_root, 'data', 'documents', 'report')
@@ -113,15 +250,38 @@ def upload_documents():
                 'message': 'No documents found.'
             })
         
-        # 决定是否需要向量化文档 (超过3个文件或总大小>1MB)
-        should_vectorize = len(all_paths) > 3 or sum(os.path.getsize(path) for path in all_paths if os.path.exists(path)) > 1000000
+        # 根据提取文本的token数和模型上下文窗口决定分析方式：整篇放入prompt或向量检索
+        analysis_plan = CostModel().plan(CostModel.estimate_tokens(all_paths))
+        should_vectorize = analysis_plan['vectorize']
+        
+        # Rejected before the session or the router agent change; the stored blobs stay
+        # unreferenced and are collected once they expire
+        if should_vectorize and config.rag.read_only:
+            return jsonify({
+                'success': False,
+                'message': 'This server serves a read-only index; run ingest.py in a writer process to add documents.'
+            })
+        
+        blob_store.add_references(session_id(), blob_shas)
+        blob_store.gc(keep=VectorStore.published_doc_ids())
+        
+        # 初始化路由代理
+        router_agent = RouterAgent()
         
         # 设置用户需求文档标记
         router_agent.set_user_requirement_files(user_req_paths)
         
         # 加载文档，根据需要决定是否向量化
         # 传递用户文件和所有文件分开，这样scoring_agent只会使用用户上传的文件
-        router_agent.load_documents(all_paths, vectorize=should_vectorize, user_files=user_req_paths)
+        # Downgraded sessions answer from small retrieved contexts, which need no summaries
+        with usage_tracker.track(session_id(), documents=user_req_paths):
+            loaded = router_agent.load_documents(all_paths, vectorize=should_vectorize, user_files=user_req_paths,
+                                                 build_summaries=False if budget_action == 'downgrade' else None)
+        if not loaded:
+            return jsonify({
+                'success': False,
+                'message': 'Error loading the documents; see the server log for details.'
+            })
         
         vectorization_msg = "Documents have been vectorized for efficient retrieval." if should_vectorize else \
                            "Documents are being processed directly by the language model without vectorization."
@@ -131,9 +291,13 @@ def upload_documents():
             'message': f'Successfully processed {len(uploaded_filenames)} user requirement documents. {vectorization_msg}',
             'files': uploaded_filenames,
             'system_files': [os.path.basename(path) for path in system_paths] if 'system_paths' in locals() else [],
-            'vectorized': should_vectorize
+            'vectorized': should_vectorize,
+            'analysis_plan': analysis_plan
         })
     
+    except HTTPException:
+        # Uploads rejected for size are answered with 413 by upload_too_large
+        raise
     except Exception as e:
         logger.error(f"Error processing documents: {str(e)}")
         return jsonify({
@@ -142,6 +306,7 @@ def upload_documents():
         })
 
 @app.route('/ask', methods=['POST'])
+@profiled
 def ask():
     """处理用户问题并根据模式参数路由到适当的代理"""
     global router_agent
@@ -164,12 +329,22 @@ def ask():
             'message': 'Query cannot be empty.'
         })
     
+    budget_action = usage_tracker.budget_status(session_id())
+    if budget_action == 'reject':
+        return jsonify({
+            'success': False,
+            'message': 'This session has used up its token budget.',
+            'session_usage': usage_tracker.session_usage(session_id())
+        }), 429
+    
     try:
         # 根据模式决定如何处理查询
         logger.info(f"Processing query in {mode} mode: {query}")
         
         # 路由查询到适当的代理，传递模式参数
-        result = router_agent.route_query(query, mode=mode)
+        with usage_tracker.track(session_id()) as usage:
+            result = router_agent.route_query(query, mode=mode, session_id=session_id(),
+                                              downgrade=budget_action == 'downgrade')
         
         # 根据使用的代理类型返回响应
         if result.get('agent') == 'scoring_agent':
@@ -177,7 +352,9 @@ def ask():
                 'success': True,
                 'query': query,
                 'agent_type': 'scoring_agent',
-                'answer': result.get('response', '')
+                'answer': result.get('response', ''),
+                'usage': usage.to_dict(),
+                'session_usage': usage_tracker.session_usage(session_id())
             })
         else:  # rag_assistant
             return jsonify({
@@ -185,7 +362,11 @@ def ask():
                 'query': query,
                 'agent_type': 'rag_assistant',
                 'context': result.get('context', ''),
-                'answer': result.get('response', '')
+                'answer': result.get('response', ''),
+                'prompt_stats': result.get('prompt_stats'),
+                'downgraded': result.get('downgraded', False),
+                'usage': usage.to_dict(),
+                'session_usage': usage_tracker.session_usage(session_id())
             })
     
     except Exception as e:
@@ -196,6 +377,118 @@ def ask():
         })
 
 
+@app.route('/score_document', methods=['POST'])
+def score_document():
+    """Queue a report for scoring, or return its stored result if it was already scored"""
+    try:
+        files = request.files.getlist('files')
+        if not files or not files[0].filename:
+            return jsonify({
+                'success': False,
+                'message': 'No file selected.'
+            })
+        
+        filename = secure_filename(files[0].filename)
+        if not filename.lower().endswith(('.pdf', '.txt')):
+            return jsonify({
+                'success': False,
+                'message': 'Only PDF and TXT files can be scored.'
+            })
+        
+        # A scoring prompt cannot be made cheaper, so sessions over budget are turned away either way,
+        # before anything is stored or loaded for them
+        if usage_tracker.budget_status(session_id()):
+            return jsonify({
+                'success': False,
+                'message': 'This session has used up its token budget.',
+                'session_usage': usage_tracker.session_usage(session_id())
+            }), 429
+        
+        sha, file_path = store_upload(files[0], filename)
+        blob_store.add_references(session_id(), [sha])
+        
+        jobs = get_scoring_jobs()
+        if not scoring_agent.scoring_criteria:
+            return jsonify({
+                'success': False,
+                'message': 'Scoring criteria not loaded.'
+            })
+        
+        # The job inherits the session from the request's context, so its calls are charged to it
+        with usage_tracker.track(session_id()):
+            job = jobs.submit(file_path, sha, ScoringJobManager.criteria_version(scoring_agent.scoring_criteria))
+        if job['status'] == 'done':
+            return jsonify({
+                'success': True,
+                'status': 'done',
+                'cached': True,
+                'files': [filename],
+                'results': [job['result']]
+            })
+        
+        return jsonify({
+            'success': True,
+            'status': job['status'],
+            'job_id': job['job_id'],
+            'files': [filename]
+        }), 202
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting document for scoring: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error submitting document for scoring: {str(e)}'
+        })
+
+@app.route('/score_status/<job_id>')
+def score_status(job_id):
+    """Report the state of a scoring job, with its result once done"""
+    job = get_scoring_jobs().get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': 'Unknown scoring job.'
+        }), 404
+    
+    response = {
+        'success': job['status'] != 'failed',
+        'status': job['status'],
+        'job_id': job_id,
+        'files': [job['file_name']]
+    }
+    if job['status'] == 'done':
+        response['results'] = [job['result']]
+    elif job['status'] == 'failed':
+        response['message'] = job.get('error', 'Scoring failed.')
+    return jsonify(response)
+
+@app.route('/usage')
+def usage():
+    """Tokens and estimated cost used by this session and charged to each of its documents"""
+    # Other sessions' documents, and their names, are not this session's business;
+    # documents are reported by content hash since two uploads may share a name
+    session_documents = {}
+    for sha in blob_store.references(session_id()):
+        path = blob_store.path_for(sha)
+        if path:
+            session_documents[os.path.abspath(path)] = sha
+    charged = usage_tracker.document_usage(list(session_documents))
+    return jsonify({
+        'session': usage_tracker.session_usage(session_id()),
+        'budget': {
+            'tokens': config.llm.session_token_budget,
+            'cost_usd': config.llm.session_cost_budget_usd,
+            'action': config.llm.budget_action
+        },
+        'documents': {session_documents[path]: usage for path, usage in charged.items()},
+        'total': usage_tracker.total.to_dict()
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Pipeline stage timings, sizes and cache hits in the Prometheus text format"""
+    return Response(telemetry.registry.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     # 创建templates目录（如果不存在）
@@ -210,5 +503,8 @@ if __name__ == '__main__':
     scoring_dir = os.path.join(project_root, 'data', 'scoring')
     os.makedirs(scoring_dir, exist_ok=True)
     
+    # 清理不再被任何会话引用的上传文件
+    blob_store.gc(force=True, keep=VectorStore.published_doc_ids())
+    
     print("Starting RAG Web Application...")
     app.run(debug=True, port=5000)